@@ -0,0 +1,15 @@
+""" Benchmark suite of Kobin, runnable without a network or a server.
+
+    $ PYTHONPATH=. python -m benchmarks --output results.json
+    $ PYTHONPATH=. python -m benchmarks --baseline results.json --threshold 0.1
+
+Each case calls a part of the framework, or the whole application through
+``Kobin.__call__`` with a synthetic environ, and reports its throughput and
+latency percentiles. Results are stored as JSON; compared with a baseline,
+any case whose median latency grew by more than the threshold is reported
+as a regression and the command exits with status 1.
+
+``bench_router.py`` and ``bench_context.py`` are standalone scripts which
+compare the router and the request context with the implementations they
+replaced.
+"""
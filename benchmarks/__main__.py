@@ -0,0 +1,52 @@
+import argparse
+import sys
+from typing import Dict, List
+
+from .runner import compare, load, run, save
+from .suites import SUITES
+
+
+def report(name: str, result: Dict[str, float]) -> None:
+    print('{:<40} {:>12.0f} {:>10.2f} {:>10.2f} {:>10.2f}'.format(
+        name, result['ops_per_sec'], result['p50_us'], result['p90_us'], result['p99_us']))
+
+
+def main(argv: List[str]=None) -> int:
+    parser = argparse.ArgumentParser(prog='python -m benchmarks', description='Benchmark Kobin.')
+    parser.add_argument('suites', nargs='*', metavar='suite',
+                        help='Suites to run: {} (default: all).'.format(', '.join(sorted(SUITES))))
+    parser.add_argument('--filter', '-k', default='', help='Only run the cases containing this text.')
+    parser.add_argument('--duration', type=float, default=1.0, help='Seconds spent on each case.')
+    parser.add_argument('--repeat', type=int, default=5,
+                        help='Times each case is measured, the duration being split between them.')
+    parser.add_argument('--output', '-o', help='Write the results as JSON into this file.')
+    parser.add_argument('--baseline', '-b', help='JSON results of a previous run to compare with.')
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help='Relative growth of the lowest p50 of the repeats reported as a regression.')
+    args = parser.parse_args(argv)
+    unknown = set(args.suites) - set(SUITES)
+    if unknown:
+        parser.error('unknown suite: {}'.format(', '.join(sorted(unknown))))
+
+    cases = [case for suite in args.suites or sorted(SUITES) for case in SUITES[suite]()
+             if args.filter in case.name]
+    print('{:<40} {:>12} {:>10} {:>10} {:>10}'.format('case', 'ops/s', 'p50 (us)', 'p90 (us)', 'p99 (us)'))
+    results = run(cases, args.duration, report, args.repeat)
+    if args.output:
+        save(results, args.output)
+
+    if not args.baseline:
+        return 0
+    rows = compare(load(args.baseline), results, args.threshold)
+    print()
+    print('{:<40} {:>12} {:>12} {:>8}'.format('case', 'base min p50', 'min p50', 'change'))
+    for name, old, new, change, regressed in rows:
+        print('{:<40} {:>12.2f} {:>12.2f} {:>+7.1%}{}'.format(
+            name, old, new, change, '  REGRESSION' if regressed else ''))
+    regressions = sum(1 for row in rows if row[4])
+    print('{} regression(s) above {:.0%}'.format(regressions, args.threshold))
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,74 @@
+""" Compare the attribute access cost of the contextvars based ``request`` and
+    ``response`` globals with the threading.local based ones they replaced.
+
+    $ PYTHONPATH=. python benchmarks/bench_context.py
+"""
+import threading
+import timeit
+
+from kobin.environs import LocalRequest, LocalResponse, Request, Response, bind
+
+NUMBER = 200000
+
+
+def _local_property():
+    ls = threading.local()
+
+    def fget(_):
+        try:
+            return ls.var
+        except AttributeError:
+            raise RuntimeError("Request context not initialized.")
+
+    def fset(_, value):
+        ls.var = value
+
+    return property(fget, fset)
+
+
+class ThreadLocalRequest(Request):
+    __slots__ = ()
+    bind = Request.__init__
+    environ = _local_property()
+
+
+class ThreadLocalResponse(Response):
+    __slots__ = ()
+    bind = Response.__init__
+    _status_code = _local_property()
+    _headers = _local_property()
+    _cookies = _local_property()
+    body = _local_property()
+
+
+def run(label: str, request: Request, response: Response) -> None:
+    cases = [
+        ('request.path', lambda: request.path),
+        ('request.method', lambda: request.method),
+        ('response.status_code', lambda: response.status_code),
+        ('response.status = 200', lambda: setattr(response, 'status', 200)),
+        ('response.headers', lambda: response.headers),
+    ]
+    for name, func in cases:
+        seconds = min(timeit.repeat(func, number=NUMBER, repeat=3))
+        print('{:<14} {:<24} {:8.1f} ns'.format(label, name, seconds / NUMBER * 1e9))
+
+
+def main() -> None:
+    environ = {'REQUEST_METHOD': 'GET', 'PATH_INFO': '/hello'}
+
+    thread_local_request = ThreadLocalRequest.__new__(ThreadLocalRequest)
+    thread_local_response = ThreadLocalResponse.__new__(ThreadLocalResponse)
+    bind_seconds = min(timeit.repeat(
+        lambda: (thread_local_request.bind(dict(environ)), thread_local_response.bind()),
+        number=NUMBER // 10, repeat=3))
+    print('{:<14} {:<24} {:8.1f} ns'.format('threading', 'bind', bind_seconds / (NUMBER // 10) * 1e9))
+    run('threading', thread_local_request, thread_local_response)
+
+    bind_seconds = min(timeit.repeat(lambda: bind(dict(environ)), number=NUMBER // 10, repeat=3))
+    print('{:<14} {:<24} {:8.1f} ns'.format('contextvars', 'bind', bind_seconds / (NUMBER // 10) * 1e9))
+    run('contextvars', LocalRequest(), LocalResponse())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,39 @@
+""" Measure Router.match latency while the number of routes grows.
+
+    $ PYTHONPATH=. python benchmarks/bench_router.py
+
+The last registered route is the worst case for a linear scan; with the
+segment trie its latency should stay flat from 10 to 5,000 routes.
+"""
+import timeit
+
+from kobin.routes import Router
+
+ROUTE_COUNTS = (10, 100, 1000, 5000)
+NUMBER = 20000
+
+
+def build_router(count: int) -> Router:
+    router = Router()
+    for i in range(count):
+        def callback(item_id: int):
+            return item_id
+        router.add('GET', '/section{}/items/{{item_id}}'.format(i), 'route{}'.format(i), callback)
+    return router
+
+
+def main() -> None:
+    print('{:>8} {:>14} {:>14}'.format('routes', 'first (us)', 'last (us)'))
+    for count in ROUTE_COUNTS:
+        router = build_router(count)
+        first = {'REQUEST_METHOD': 'GET', 'PATH_INFO': '/section0/items/42'}
+        last = {'REQUEST_METHOD': 'GET', 'PATH_INFO': '/section{}/items/42'.format(count - 1)}
+        results = []
+        for environ in (first, last):
+            seconds = min(timeit.repeat(lambda: router.match(environ), number=NUMBER, repeat=3))
+            results.append(seconds / NUMBER * 1e6)
+        print('{:>8} {:>14.2f} {:>14.2f}'.format(count, *results))
+
+
+if __name__ == '__main__':
+    main()
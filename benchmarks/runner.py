@@ -0,0 +1,142 @@
+import gc
+import json
+import platform
+import sys
+import time
+from time import perf_counter
+from typing import Any, Callable, Dict, List, Tuple
+
+PERCENTILES = (50, 90, 99)
+
+
+class Case:
+    """ A benchmark case. ``func`` is timed on each call; with ``setup``, it
+        receives a fresh value returned by ``setup()``, which is not timed.
+    """
+    __slots__ = ('name', 'func', 'setup')
+
+    def __init__(self, name: str, func: Callable, setup: Callable[[], Any]=None) -> None:
+        self.name = name
+        self.func = func
+        self.setup = setup
+
+
+def percentile(ordered: List[float], p: float) -> float:
+    """ Nearest-rank percentile of an already sorted list. """
+    index = max(int(round(p / 100 * len(ordered))) - 1, 0)
+    return ordered[min(index, len(ordered) - 1)]
+
+
+def measure(case: Case, duration: float=0.5, min_samples: int=100, warmup: int=20) -> Dict[str, float]:
+    """ Call ``case`` repeatedly for about ``duration`` seconds and summarize
+        the latency of each call in microseconds. Like :mod:`timeit`, the
+        garbage collector is disabled while measuring.
+    """
+    func, setup = case.func, case.setup
+    for _ in range(warmup):
+        func(setup()) if setup else func()
+    samples = []  # type: List[float]
+    gc.collect()
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        deadline = perf_counter() + duration
+        while len(samples) < min_samples or perf_counter() < deadline:
+            if setup is None:
+                start = perf_counter()
+                func()
+            else:
+                value = setup()
+                start = perf_counter()
+                func(value)
+            samples.append(perf_counter() - start)
+    finally:
+        if enabled:
+            gc.enable()
+    return summarize(samples)
+
+
+def summarize(samples: List[float]) -> Dict[str, float]:
+    ordered = sorted(samples)
+    total = sum(ordered)
+    result = {
+        'samples': len(ordered),
+        'ops_per_sec': len(ordered) / total if total else float('inf'),
+        'mean_us': total / len(ordered) * 1e6,
+        'max_us': ordered[-1] * 1e6,
+    }
+    for p in PERCENTILES:
+        result['p{}_us'.format(p)] = percentile(ordered, p) * 1e6
+    return result
+
+
+def run(cases: List[Case], duration: float=0.5, report: Callable[[str, Dict[str, float]], None]=None,
+        repeat: int=5) -> Dict[str, Any]:
+    """ Measure every case ``repeat`` times, ``duration`` seconds in all,
+        and return the results with the environment they were taken in.
+        The repeats of all cases are interleaved so that a slow phase of the
+        machine doesn't hit one case only. The summary kept for a case is
+        its repeat with the median p50, plus ``min_p50_us``, the lowest p50
+        of its repeats, and ``spread``, their relative range.
+    """
+    repeat = max(repeat, 1)
+    runs = {case.name: [] for case in cases}  # type: Dict[str, List[Dict[str, float]]]
+    for _ in range(repeat):
+        for case in cases:
+            runs[case.name].append(measure(case, duration / repeat))
+    results = {}  # type: Dict[str, Dict[str, float]]
+    for case in cases:
+        results[case.name] = combine(runs[case.name])
+        if report is not None:
+            report(case.name, results[case.name])
+    return {
+        'python': platform.python_version(),
+        'implementation': platform.python_implementation(),
+        'platform': platform.platform(),
+        'argv': sys.argv[1:],
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'repeat': repeat,
+        'results': results,
+    }
+
+
+def combine(runs: List[Dict[str, float]]) -> Dict[str, float]:
+    """ One summary for the repeated measures of a case, see :func:`run`. """
+    ordered = sorted(runs, key=lambda r: r['p50_us'])
+    result = dict(ordered[(len(ordered) - 1) // 2])
+    best, worst = ordered[0]['p50_us'], ordered[-1]['p50_us']
+    result['repeats'] = len(runs)
+    result['min_p50_us'] = best
+    result['spread'] = (worst - best) / best if best else 0.0
+    return result
+
+
+def save(data: Dict[str, Any], path: str) -> None:
+    with open(path, 'w') as f:
+        json.dump(data, f, indent=2, sort_keys=True)
+        f.write('\n')
+
+
+def load(path: str) -> Dict[str, Any]:
+    with open(path) as f:
+        return json.load(f)
+
+
+def compare(baseline: Dict[str, Any], current: Dict[str, Any], threshold: float=0.1,
+            metric: str='min_p50_us') -> List[Tuple[str, float, float, float, bool]]:
+    """ ``(name, baseline, current, relative change, regressed)`` of the cases
+        found in both runs. A case regressed when ``metric`` grew by more
+        than ``threshold`` (0.1 is 10%) and by more than the ``spread`` of
+        the repeats of either run, so that noise isn't reported. Results
+        without ``metric`` fall back to ``p50_us``.
+    """
+    rows = []
+    before = baseline['results']
+    for name, result in sorted(current['results'].items()):
+        if name not in before:
+            continue
+        old, new = before[name].get(metric, before[name]['p50_us']), result.get(metric, result['p50_us'])
+        change = (new - old) / old if old else 0.0
+        noise = max(before[name].get('spread', 0.0), result.get('spread', 0.0))
+        rows.append((name, old, new, change, change > threshold and change > noise))
+    return rows
@@ -0,0 +1,206 @@
+""" Benchmark cases grouped by the part of the framework they exercise. """
+import io
+import json
+import tempfile
+from typing import Any, Callable, Dict, List
+from urllib.parse import urlencode
+
+from kobin import Kobin, render_template
+from kobin.environs import Request, Response
+from kobin.exceptions import HTTPError
+
+from .bench_router import ROUTE_COUNTS, build_router
+from .runner import Case
+
+HEADER_COUNTS = (5, 20, 50)
+QUERY_SIZES = (1, 10, 100)
+BODY_SIZES = (1024, 64 * 1024, 1024 * 1024)
+TEMPLATE_ROWS = (10, 100, 1000)
+
+ROW_TEMPLATE = """<table>
+{% for row in rows %}<tr><td>{{ row.id }}</td><td>{{ row.name|e }}</td><td>{{ row.email }}</td></tr>
+{% endfor %}</table>
+"""
+
+
+def _environ(method: str='GET', path: str='/', **extra: Any) -> Dict[str, Any]:
+    environ = {
+        'REQUEST_METHOD': method,
+        'PATH_INFO': path,
+        'QUERY_STRING': '',
+        'SERVER_NAME': 'localhost',
+        'SERVER_PORT': '80',
+        'SERVER_PROTOCOL': 'HTTP/1.1',
+        'wsgi.url_scheme': 'http',
+    }
+    environ.update(extra)
+    return environ
+
+
+def _headers(count: int) -> Dict[str, str]:
+    return {'HTTP_X_HEADER_{}'.format(i): 'value-{}'.format(i) for i in range(count)}
+
+
+def _form(size: int) -> bytes:
+    fields, length, i = [], 0, 0
+    while length < size:
+        field = ('field{}'.format(i), 'x' * 64)
+        fields.append(field)
+        length += len(field[0]) + len(field[1]) + 2
+        i += 1
+    return urlencode(fields).encode('ascii')
+
+
+def _call(app: Kobin) -> Callable[[Dict[str, Any]], None]:
+    """ Drive ``app`` like a WSGI server: start the response, consume and close the body. """
+    def start_response(status, headerlist):
+        pass
+
+    def call(environ: Dict[str, Any]) -> None:
+        body = app(environ, start_response)
+        for _ in body:
+            pass
+        close = getattr(body, 'close', None)
+        if close is not None:
+            close()
+    return call
+
+
+def routing() -> List[Case]:
+    """ ``Router.match`` for the first and last registered routes and a 404. """
+    cases = []
+    for count in ROUTE_COUNTS:
+        router = build_router(count)
+
+        def not_found(environ, router=router):
+            try:
+                router.match(environ)
+            except HTTPError:
+                pass
+
+        for label, path in (('first', '/section0/items/42'),
+                            ('last', '/section{}/items/42'.format(count - 1))):
+            environ = _environ(path=path)
+            cases.append(Case('routing/match-{}[routes={}]'.format(label, count),
+                              router.match, lambda environ=environ: dict(environ)))
+        missing = _environ(path='/missing/items/42')
+        cases.append(Case('routing/not-found[routes={}]'.format(count),
+                          not_found, lambda missing=missing: dict(missing)))
+    return cases
+
+
+def request_parsing() -> List[Case]:
+    """ ``Request.GET``, ``Request.POST`` and ``Request.headers`` on fresh environs. """
+    cases = []
+    for size in QUERY_SIZES:
+        environ = _environ(QUERY_STRING=urlencode([('key{}'.format(i), 'value') for i in range(size)]))
+        cases.append(Case('request/query[params={}]'.format(size),
+                          lambda r: r.GET, lambda environ=environ: Request(dict(environ))))
+    for size in BODY_SIZES:
+        body = _form(size)
+
+        def setup(body=body):
+            return Request(_environ('POST', CONTENT_TYPE='application/x-www-form-urlencoded',
+                                    CONTENT_LENGTH=str(len(body)), **{'wsgi.input': io.BytesIO(body)}))
+        cases.append(Case('request/form[bytes={}]'.format(size), lambda r: r.POST, setup))
+    for count in HEADER_COUNTS:
+        environ = _environ(**_headers(count))
+        cases.append(Case('request/headers[headers={}]'.format(count),
+                          lambda r: dict(r.headers), lambda environ=environ: Request(dict(environ))))
+    return cases
+
+
+def response_building() -> List[Case]:
+    """ ``Response.headerlist`` with a growing number of headers and a cookie. """
+    cases = []
+    for count in HEADER_COUNTS:
+        names = ['X-Header-{}'.format(i) for i in range(count)]
+
+        def build(names=names):
+            response = Response('hello')
+            for name in names:
+                response.headers[name] = 'value'
+            response.set_cookie('session', 'abc', path='/')
+            return response.headerlist
+        cases.append(Case('response/headerlist[headers={}]'.format(count), build))
+    return cases
+
+
+def templates() -> List[Case]:
+    """ End-to-end rendering of a table template with a growing number of rows. """
+    directory = tempfile.TemporaryDirectory()
+    with open('{}/rows.html'.format(directory.name), 'w') as f:
+        f.write(ROW_TEMPLATE)
+    cases = []
+    for size in TEMPLATE_ROWS:
+        app = Kobin()
+        app.config['TEMPLATE_DIRS'] = [directory.name]
+        app.config['STATICFILES_DIRS'] = []
+        rows = [{'id': i, 'name': '<user {}>'.format(i), 'email': 'user{}@example.com'.format(i)}
+                for i in range(size)]
+
+        @app.route('/')
+        def index(rows=rows):
+            return render_template('rows.html', rows=rows)
+
+        # The setup holds on to the temporary directory for as long as the case exists.
+        environ = _environ()
+        cases.append(Case('template/render[rows={}]'.format(size), _call(app),
+                          lambda environ=environ, directory=directory: dict(environ)))
+    return cases
+
+
+def end_to_end() -> List[Case]:
+    """ Whole requests through ``Kobin.__call__``. """
+    app = Kobin()
+    app.config['STATICFILES_DIRS'] = []
+    for i in range(100):
+        app.route('/section{}/items/{{item_id}}'.format(i), callback=lambda item_id: str(item_id))
+
+    @app.route('/')
+    def index():
+        return 'hello world'
+
+    @app.route('/users/{user_id}')
+    def user(user_id: int):
+        from kobin import response
+        response.headers['Content-Type'] = 'application/json'
+        return json.dumps({'id': user_id, 'name': 'user'})
+
+    @app.route('/forms', method='POST')
+    def forms():
+        from kobin import request
+        return str(len(request.forms))
+
+    @app.route('/bytes/{size}')
+    def raw(size: int):
+        return b'x' * size
+
+    call = _call(app)
+    cases = [
+        Case('wsgi/text', call, lambda: _environ(path='/')),
+        Case('wsgi/json', call, lambda: _environ(path='/users/42')),
+        Case('wsgi/last-of-100-routes', call, lambda: _environ(path='/section99/items/42')),
+        Case('wsgi/not-found', call, lambda: _environ(path='/missing')),
+    ]
+    for count in HEADER_COUNTS:
+        headers = _headers(count)
+        cases.append(Case('wsgi/text[headers={}]'.format(count), call,
+                          lambda headers=headers: _environ(path='/', **headers)))
+    for size in BODY_SIZES:
+        body = _form(size)
+        cases.append(Case('wsgi/form[bytes={}]'.format(size), call, lambda body=body: _environ(
+            'POST', '/forms', CONTENT_TYPE='application/x-www-form-urlencoded',
+            CONTENT_LENGTH=str(len(body)), **{'wsgi.input': io.BytesIO(body)})))
+        cases.append(Case('wsgi/bytes[bytes={}]'.format(size), call,
+                          lambda size=size: _environ(path='/bytes/{}'.format(size))))
+    return cases
+
+
+SUITES = {
+    'routing': routing,
+    'request': request_parsing,
+    'response': response_building,
+    'template': templates,
+    'wsgi': end_to_end,
+}  # type: Dict[str, Callable[[], List[Case]]]
@@ -3,7 +3,7 @@ from kobin import Kobin
 app = Kobin()
 
 
-@app.route('^/(?P<name>\w*)$')
+@app.route('/{name}')
 def hello(name: str) -> str:
     return "Hello {}!!".format(name)
 
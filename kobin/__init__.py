@@ -1,5 +1,5 @@
 from .app import Kobin, Config, current_app, current_config
 from .environs import request, response
-from .templates import render_template
+from .templates import render_template, stream_template
 from .exceptions import HTTPError
 from .routes import redirect
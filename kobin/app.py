@@ -1,63 +1,540 @@
+import asyncio
+import contextvars
+import functools
+import inspect
+import io
+import json
 import os
+import threading
 import types
-from typing import Any, Callable, Dict, List, Union, Tuple
+from concurrent.futures import ThreadPoolExecutor
+from time import perf_counter
+from typing import Any, Callable, Dict, Iterable, List, Union, Tuple
+from .caching import cached, create_cache
+from .compression import compress_body, compress_body_async
+from .conditional import conditional_output
+from .middleware import Handler, Middleware, call_callback, compose, compose_async, with_middlewares
+from .metrics import Hooks, MetricsRegistry, RequestMetrics, Timings, prometheus_view
+from .profiler import Profiler, create_profiler
+from .asgi import bridge_body, build_environ, iter_body_async, lifespan, send_response
 from .routes import Router, Route
-from .environs import request, response
+from .environs import bind, request, response
 from .exceptions import HTTPError
+from .static import create_static_files
+from .templates import create_environment, compile_templates, warmup_templates
 
 
 class Kobin:
     def __init__(self, root_path: str='.') -> None:
         self.router = Router()
         self.config = Config(os.path.abspath(root_path))
+        self._template_env = None
+        self._response_cache = None
+        self._static_files = None
+        self._static_files_loaded = False
+        self.hooks = Hooks()
+        self._metrics = None
+        self._profiler = None
+        self._instrumentation_loaded = False
+        self._instrumentation_lock = threading.Lock()
+        self.middlewares = []  # type: List[Middleware]
+        self._chain = None  # type: Handler
+        self._async_chain = None  # type: Handler
+        self._executor = None  # type: ThreadPoolExecutor
+
+    @property
+    def template_env(self):
+        """ Jinja2 environment built from the config when it is first used. """
+        if self._template_env is None:
+            self._template_env = create_environment(self.config)
+        return self._template_env
+
+    @property
+    def static_files(self):
+        """ The :class:`kobin.static.StaticFiles` built from ``STATIC_ROOT`` and
+            ``STATICFILES_DIRS`` when it is first used, or None without them.
+        """
+        if not self._static_files_loaded:
+            self._static_files = create_static_files(self.config)
+            self._static_files_loaded = True
+        return self._static_files
+
+    @property
+    def metrics(self) -> MetricsRegistry:
+        """ The in-process metrics registry of this application. """
+        if self._metrics is None:
+            self._metrics = MetricsRegistry()
+        return self._metrics
+
+    def setup_instrumentation(self) -> None:
+        """ Install what the config asks for, once: ``METRICS`` installs the
+            :class:`kobin.metrics.RequestMetrics` hook and ``METRICS_PATH`` a
+            route serving them in the Prometheus text format, ``PROFILER`` the
+            profiler of :mod:`kobin.profiler`. Call it once the config is
+            complete; :meth:`run` and the ASGI lifespan startup do. Otherwise
+            the first request does, before any route is matched.
+        """
+        with self._instrumentation_lock:
+            if self._instrumentation_loaded:
+                return
+            self.hooks.sample_rate = max(int(self.config['METRICS_SAMPLE_RATE']), 1)
+            if self.config['METRICS']:
+                self.hooks.add('after_response', RequestMetrics(self.metrics))
+                if self.config['METRICS_PATH']:
+                    self.router.add('GET', self.config['METRICS_PATH'], 'kobin_metrics',
+                                    prometheus_view(self.metrics))
+            self._profiler = create_profiler(self.config)
+            if self._profiler is not None:
+                self._profiler.start()
+            self._instrumentation_loaded = True
+
+    @property
+    def instrumentation(self) -> Union[None, Hooks]:
+        """ :attr:`hooks` when at least one hook is registered, otherwise None. """
+        if not self._instrumentation_loaded:
+            self.setup_instrumentation()
+        return self.hooks if self.hooks.active else None
+
+    @property
+    def profiler(self) -> Union[None, Profiler]:
+        """ The profiler selected by ``PROFILER``, e.g. to call ``app.profiler.dump()``. """
+        self.instrumentation
+        return self._profiler
+
+    def add_hook(self, event: str, callback: Callable[[Dict[str, Any], Timings], None]) -> None:
+        """ Call ``callback(environ, timings)`` on ``event``: one of ``before_request``,
+            ``after_match``, ``after_handler`` or ``after_response``.
+        """
+        self.hooks.add(event, callback)
+
+    def hook(self, event: str) -> Callable:
+        def decorator(callback):
+            self.add_hook(event, callback)
+            return callback
+        return decorator
+
+    def add_middleware(self, middleware: Middleware) -> None:
+        """ Run every route callback through ``middleware``, see :mod:`kobin.middleware`.
+            Middlewares added first are the outermost.
+        """
+        self.middlewares.append(middleware)
+        self._chain = None
+        self._async_chain = None
+
+    def middleware(self, middleware: Middleware) -> Middleware:
+        self.add_middleware(middleware)
+        return middleware
+
+    @property
+    def chain(self) -> Union[None, Handler]:
+        """ :attr:`middlewares` composed into a single handler on first use,
+            or None without middlewares.
+        """
+        if self._chain is None and self.middlewares:
+            self._chain = compose(self.middlewares)
+        return self._chain
+
+    @property
+    def async_chain(self) -> Union[None, Handler]:
+        """ :attr:`middlewares` composed for ``async def`` callbacks, see
+            :func:`kobin.middleware.compose_async`.
+        """
+        if self._async_chain is None and self.middlewares:
+            self._async_chain = compose_async(self.middlewares)
+        return self._async_chain
+
+    @property
+    def response_cache(self):
+        """ Default backend of the response cache, built from ``RESPONSE_CACHE_*``. """
+        if self._response_cache is None:
+            self._response_cache = create_cache(self.config)
+        return self._response_cache
+
+    def precompile_templates(self, target: str=None) -> Dict[str, float]:
+        """ Compile every template in ``TEMPLATE_DIRS`` ahead of the first request.
+            With ``target``, python modules are written there to be loaded
+            through ``TEMPLATE_MODULE_DIR``; otherwise the templates are loaded
+            into this application's environment. Returns the time spent on
+            each template in seconds.
+        """
+        if target is not None:
+            return compile_templates(self.config, target)
+        return warmup_templates(self.template_env, self.config)
 
     def route(self, rule: str=None, method: str='GET', name: str=None,
-              callback: Callable[..., Union[str, bytes]]=None) -> Callable[..., Union[str, bytes]]:
+              callback: Callable[..., Union[str, bytes]]=None,
+              cache: Union[float, Dict[str, Any]]=None,
+              middlewares: List[Middleware]=None) -> Callable[..., Union[str, bytes]]:
+        """ Register a callback for ``rule``. ``cache`` keeps its responses in
+            the response cache, given as a TTL in seconds or as the keyword
+            arguments of :func:`kobin.caching.cached`. ``middlewares`` only
+            wrap this callback, inside the middlewares of the application.
+        """
         def decorator(callback_func):
-            self.router.add(method, rule, name, callback_func)
+            target = callback_func
+            if cache is not None:
+                options = cache if isinstance(cache, dict) else {'ttl': cache}
+                target = cached(**options)(callback_func)
+            if middlewares:
+                target = with_middlewares(middlewares)(target)
+            self.router.add(method, rule, name, target)
             return callback_func
         return decorator(callback) if callback else decorator
 
     def _handle(self, environ: Dict) -> Union[str, bytes]:
         environ['kobin.app'] = self
-        request.bind(environ)  # type: ignore
-        response.bind()        # type: ignore
+        bind(environ)
+        hooks = self.instrumentation
+        timings = hooks.start(environ) if hooks is not None else None
         try:
-            callback, kwargs = self.router.match(environ)
-            output = callback(**kwargs) if kwargs else callback()
-        except HTTPError:
-            import sys
-            _type, _value, _traceback = sys.exc_info()
-            response.apply(_value)
+            output = None
+            static_files = self.static_files
+            if static_files is not None:
+                output = static_files.serve(environ, response)
+            if output is None:
+                callback, kwargs = self.router.match(environ)
+                if timings is not None:
+                    timings.matched = perf_counter()
+                    hooks.fire('after_match', environ, timings)
+                chain = self.chain
+                profiler = self._profiler
+                if profiler is not None:
+                    output = profiler.run(environ, chain or call_callback, callback, kwargs)
+                elif chain is not None:
+                    output = chain(callback, kwargs)
+                else:
+                    output = callback(**kwargs) if kwargs else callback()
+        except HTTPError as e:
+            response.apply(e)
             output = response.body
         except:
             response.apply(HTTPError(500, 'Internal server error.'))
             output = response.body
+        if timings is not None:
+            timings.handled = perf_counter()
+            hooks.fire('after_handler', environ, timings)
         return output
 
     def wsgi(self, environ: Dict,
-             start_response: Callable[[bytes, List[Tuple[str, str]]], None]) -> List[bytes]:
-        out = self._handle(environ)
-        if isinstance(out, str):
-            out = out.encode('utf-8')
+             start_response: Callable[[bytes, List[Tuple[str, str]]], None]) -> Iterable[bytes]:
+        out = conditional_output(environ, response, self.config, _checked_body(self._handle(environ)))
+        body = make_body(environ, out)
+        if self.config['COMPRESSION']:
+            body = compress_body(environ, response, self.config, body)
+        if request.method == 'HEAD':
+            body = drop_body(out, body)
         start_response(response.status, response.headerlist)
-        return [out]
+        if environ.get('kobin.timings') is None:
+            return body
+        # after_response fires once the server is done with the body.
+        return _closing(body, functools.partial(self._finish, environ))
 
-    def __call__(self, environ: Dict, start_response) -> List[bytes]:
+    def _finish(self, environ: Dict) -> None:
+        timings = environ.get('kobin.timings')
+        if timings is not None:
+            timings.finished = perf_counter()
+            self.hooks.fire('after_response', environ, timings)
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        """ Thread pool running synchronous callbacks for :meth:`asgi`,
+            bounded by ``ASGI_THREAD_POOL_SIZE``.
+        """
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.config['ASGI_THREAD_POOL_SIZE'],
+                                                thread_name_prefix='kobin')
+        return self._executor
+
+    async def _run_sync(self, func: Callable, *args) -> Any:
+        context = contextvars.copy_context()
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, functools.partial(context.run, func, *args))
+
+    async def _handle_async(self, environ: Dict) -> Any:
+        environ['kobin.app'] = self
+        bind(environ)
+        hooks = self.instrumentation
+        timings = hooks.start(environ) if hooks is not None else None
+        try:
+            output = None
+            static_files = self.static_files
+            if static_files is not None:
+                output = static_files.serve(environ, response)
+            if output is None:
+                callback, kwargs = self.router.match(environ)
+                if timings is not None:
+                    timings.matched = perf_counter()
+                    hooks.fire('after_match', environ, timings)
+                profiler = self._profiler
+                if inspect.iscoroutinefunction(callback):
+                    chain = self.async_chain
+                    output = chain(callback, kwargs) if chain is not None else callback(**kwargs)
+                    if profiler is not None:
+                        output = profiler.run_async(environ, output)
+                else:
+                    chain = self.chain
+                    bridge_body(environ, asyncio.get_running_loop())
+                    if profiler is not None:
+                        output = await self._run_sync(profiler.run, environ, chain or call_callback,
+                                                      callback, kwargs)
+                    else:
+                        output = await self._run_sync(chain or call_callback, callback, kwargs)
+                if inspect.isawaitable(output):
+                    output = await output
+        except HTTPError as e:
+            response.apply(e)
+            output = response.body
+        except Exception:
+            response.apply(HTTPError(500, 'Internal server error.'))
+            output = response.body
+        if timings is not None:
+            timings.handled = perf_counter()
+            hooks.fire('after_handler', environ, timings)
+        return output
+
+    async def asgi(self, scope: Dict[str, Any], receive: Callable, send: Callable) -> None:
+        """ ASGI 3 entry point, e.g. ``uvicorn myproject:app.asgi``.
+            ``async def`` callbacks are awaited on the event loop, other
+            callbacks run in :attr:`executor` and read the body as it is
+            received, through ``wsgi.input``.
+        """
+        if scope['type'] == 'lifespan':
+            await lifespan(receive, send, on_startup=self.setup_instrumentation,
+                           on_shutdown=self._shutdown_executor)
+            return
+        if scope['type'] != 'http':
+            raise ValueError('Unsupported ASGI scope type: {}'.format(scope['type']))
+        environ = build_environ(scope, receive)
+        out = _checked_body(await self._handle_async(environ), asynchronous=True)
+        out = conditional_output(environ, response, self.config, out)
+        if request.method == 'HEAD':
+            body = make_body(environ, out) if isinstance(out, (bytes, str)) else None
+            if body is not None and self.config['COMPRESSION']:
+                body = compress_body(environ, response, self.config, body)
+            body = iter_body_async(drop_body(out, body), self._run_sync, FILE_CHUNK_SIZE)
+        else:
+            if isinstance(out, str):
+                out = out.encode('utf-8')
+            body = iter_body_async(out, self._run_sync, FILE_CHUNK_SIZE)
+            if self.config['COMPRESSION']:
+                size = len(out) if isinstance(out, bytes) else None
+                body = compress_body_async(environ, response, self.config, body, size)
+        await send_response(send, response.status_code, response.headerlist, body)
+        self._finish(environ)
+
+    def _shutdown_executor(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+    def run(self, host: str=None, port: int=None, server: str=None, **options) -> None:
+        """ Serve this application with the ``SERVER`` of the config.
+            ``'kobin'`` starts the pre-forking server of :mod:`kobin.server`,
+            configured by ``WORKERS``, ``THREADS``, ``KEEPALIVE_TIMEOUT``,
+            ``GRACEFUL_TIMEOUT`` and ``ACCESS_LOG`` unless given as ``options``.
+            ``'wsgiref'`` starts the single threaded server of the standard library.
+        """
+        host = host or self.config['HOST']
+        port = self.config['PORT'] if port is None else port
+        server = server or self.config['SERVER']
+        self.setup_instrumentation()
+        if server == 'wsgiref':
+            from wsgiref.simple_server import make_server
+            make_server(host, port, self).serve_forever()
+        elif server == 'kobin':
+            from .server import serve
+            serve(self, host, port,
+                  workers=options.get('workers', self.config['WORKERS']),
+                  threads=options.get('threads', self.config['THREADS']),
+                  keepalive_timeout=options.get('keepalive_timeout', self.config['KEEPALIVE_TIMEOUT']),
+                  graceful_timeout=options.get('graceful_timeout', self.config['GRACEFUL_TIMEOUT']),
+                  access_log=options.get('access_log', self.config['ACCESS_LOG']))
+        else:
+            raise ValueError('Unknown server: {}'.format(server))
+
+    def __call__(self, environ: Dict, start_response) -> Iterable[bytes]:
         """It is called when receive http request."""
         return self.wsgi(environ, start_response)
 
 
+FILE_CHUNK_SIZE = 64 * 1024
+
+
+class _ClosingList(list):
+    """ A body built at once whose ``close()`` calls ``on_close``. It stays
+        a list, so that servers can still tell its length.
+    """
+    def __init__(self, body: List[bytes], on_close: Callable[[], None]) -> None:
+        super().__init__(body)
+        self.on_close = on_close
+
+    def close(self) -> None:
+        self.on_close()
+
+
+class _ClosingBody:
+    """ A streamed body whose ``close()`` closes it, then calls ``on_close``. """
+    __slots__ = ('body', 'on_close')
+
+    def __init__(self, body: Iterable[bytes], on_close: Callable[[], None]) -> None:
+        self.body = body
+        self.on_close = on_close
+
+    def __iter__(self):
+        return iter(self.body)
+
+    def close(self) -> None:
+        _close_then(getattr(self.body, 'close', None), self.on_close)
+
+
+def _close_then(close: Union[None, Callable[[], None]], on_close: Callable[[], None]) -> None:
+    try:
+        if close is not None:
+            close()
+    finally:
+        on_close()
+
+
+def _closing(body: Iterable[bytes], on_close: Callable[[], None]) -> Iterable[bytes]:
+    """ ``body`` calling ``on_close`` once the server closed it. Lists and
+        the objects returned by ``wsgi.file_wrapper`` keep their type, so that
+        servers still see their length or send the file with sendfile.
+    """
+    if isinstance(body, list):
+        return _ClosingList(body, on_close)
+    if not isinstance(body, types.GeneratorType):
+        try:
+            body.close = functools.partial(_close_then, getattr(body, 'close', None), on_close)  # type: ignore
+            return body
+        except AttributeError:
+            pass  # no instance attributes, e.g. with __slots__
+    return _ClosingBody(body, on_close)
+
+
+def _checked_body(out: Any, asynchronous: bool=False) -> Any:
+    """ ``out``, or the body of a 500 error when it can't be sent as a
+        response body, decided before the response is started.
+    """
+    if isinstance(out, (bytes, str)) or hasattr(out, 'read') or hasattr(out, '__iter__') or \
+            (asynchronous and hasattr(out, '__aiter__')):
+        return out
+    response.apply(HTTPError(500, 'Internal server error.'))
+    return response.body
+
+
+def make_body(environ: Dict, out: Any) -> Iterable[bytes]:
+    """ Turn the output of a callback into a WSGI response body.
+        ``str`` and ``bytes`` are sent at once. Binary file objects go through
+        ``wsgi.file_wrapper`` when the server provides it, so that it can use
+        sendfile; text files are read and encoded. Any other iterable is
+        streamed chunk by chunk.
+    """
+    if isinstance(out, bytes):
+        return [out]
+    if isinstance(out, str):
+        return [out.encode('utf-8')]
+    if hasattr(out, 'read'):
+        if isinstance(out, io.TextIOBase):
+            return _iter_file(out)
+        file_wrapper = environ.get('wsgi.file_wrapper')
+        if file_wrapper is not None:
+            return file_wrapper(out, FILE_CHUNK_SIZE)
+        return _iter_file(out)
+    return _iter_chunks(out)
+
+
+def drop_body(out: Any, body: Iterable[bytes]) -> List[bytes]:
+    """ The empty body of a response to a HEAD request. When ``body`` was
+        built at once, its length is kept as the ``Content-Length``.
+    """
+    if isinstance(body, list) and response.status_code not in (204, 304) \
+            and 'Content-Length' not in response.headers:
+        response.headers['Content-Length'] = str(sum(len(chunk) for chunk in body))
+    for obj in (body, out):
+        close = getattr(obj, 'close', None)
+        if close is not None:
+            close()
+    return []
+
+
+def _iter_file(f) -> Iterable[bytes]:
+    try:
+        while True:
+            chunk = f.read(FILE_CHUNK_SIZE)
+            if not chunk:
+                break
+            yield chunk.encode('utf-8') if isinstance(chunk, str) else chunk
+    finally:
+        f.close()
+
+
+def _iter_chunks(iterable: Iterable[Union[str, bytes]]) -> Iterable[bytes]:
+    try:
+        for chunk in iterable:
+            if isinstance(chunk, str):
+                chunk = chunk.encode('utf-8')
+            if chunk:
+                yield chunk
+    finally:
+        close = getattr(iterable, 'close', None)
+        if close is not None:
+            close()
+
+
 class Config(dict):
     default_config = {
         'BASE_DIR': os.path.abspath('.'),
         'TEMPLATE_DIRS': [os.path.join(os.path.abspath('.'), 'templates')],
         'STATICFILES_DIRS': [os.path.join(os.path.abspath('.'), 'static')],
         'STATIC_ROOT': '/static/',
+        'STATIC_CACHE_TTL': 2,
+        'STATIC_CACHE_SIZE': 4096,
+        'STATIC_CACHE_CONTROL': None,
+        'TEMPLATE_CACHE_SIZE': 400,
+        'TEMPLATE_AUTO_RELOAD': False,
+        'TEMPLATE_BYTECODE_CACHE_DIR': None,
+        'TEMPLATE_MODULE_DIR': None,
+
+        'MAX_BODY_SIZE': 100 * 1024 * 1024,
+        'MULTIPART_SPOOL_SIZE': 512 * 1024,
+        'MULTIPART_MAX_PARTS': 1000,
+        'MULTIPART_MAX_MEMORY': 1024 * 1024,
+        'JSON_LOADS': json.loads,
+        'ASGI_THREAD_POOL_SIZE': 32,
+
+        'RESPONSE_CACHE_BACKEND': 'memory',
+        'RESPONSE_CACHE_SIZE': 1024,
+        'RESPONSE_CACHE_DIR': None,
+
+        'METRICS': False,
+        'METRICS_SAMPLE_RATE': 1,
+        'METRICS_PATH': None,
+        'PROFILER': None,
+        'PROFILER_FRACTION': 0.01,
+        'PROFILER_INTERVAL': 0.01,
+        'PROFILER_DIR': None,
+        'PROFILER_DUMP_INTERVAL': 0,
+        'PROFILER_SAMPLE_RATE': 1,
+
+        'AUTO_ETAG': False,
+        'COMPRESSION': False,
+        'COMPRESSION_LEVEL': 6,
+        'COMPRESSION_BROTLI_LEVEL': 4,
+        'COMPRESSION_MIN_SIZE': 500,
+        'COMPRESSION_EXCLUDED_TYPES': (
+            'image/png', 'image/jpeg', 'image/gif', 'image/webp', 'video/', 'audio/', 'font/woff',
+            'application/zip', 'application/gzip', 'application/x-gzip', 'application/pdf',
+        ),
+        'COMPRESSION_EXCLUDED_ROUTES': (),
 
         'PORT': 8080,
         'HOST': '127.0.0.1',
-        'SERVER': 'wsgiref',
+        'SERVER': 'kobin',
+        'WORKERS': os.cpu_count() or 1,
+        'THREADS': 8,
+        'KEEPALIVE_TIMEOUT': 5,
+        'GRACEFUL_TIMEOUT': 30,
+        'ACCESS_LOG': False,
     }  # type: Dict[str, Any]
 
     def __init__(self, root_path: str, *args, **kwargs) -> None:
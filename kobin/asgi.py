@@ -0,0 +1,217 @@
+import asyncio
+import io
+from typing import Any, Awaitable, Callable, Dict, List, Tuple
+
+_END = object()
+
+
+def build_environ(scope: Dict[str, Any], receive: Callable[[], Awaitable[Dict]]) -> Dict[str, Any]:
+    """ Build a WSGI like environ from an ASGI ``http`` scope, so that
+        :class:`kobin.environs.Request` works the same under both protocols.
+        The body is not read here; see :meth:`kobin.environs.Request.aread`.
+    """
+    root_path = scope.get('root_path', '')
+    path = scope['path']
+    if root_path and path.startswith(root_path):
+        path = path[len(root_path):]
+    server = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': root_path,
+        'PATH_INFO': path,
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': 'HTTP/{}'.format(scope.get('http_version', '1.1')),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(),
+        'kobin.asgi.scope': scope,
+        'kobin.asgi.receive': receive,
+    }  # type: Dict[str, Any]
+    if scope.get('client'):
+        environ['REMOTE_ADDR'] = scope['client'][0]
+    for name, value in scope.get('headers', []):
+        key = name.decode('latin1').upper().replace('-', '_')
+        if key not in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+            key = 'HTTP_' + key
+        value = value.decode('latin1')
+        if key in environ:
+            # HTTP/2 sends one cookie header per pair, joined like HTTP/1.1 does.
+            value = environ[key] + ('; ' if key == 'HTTP_COOKIE' else ',') + value
+        environ[key] = value
+    return environ
+
+
+class ReceiveReader:
+    """ Blocking, file-like reader of the body messages of an ASGI request,
+        used as ``wsgi.input`` by synchronous callbacks running in a worker
+        thread while ``loop`` runs ``receive``.
+    """
+    def __init__(self, receive: Callable[[], Awaitable[Dict]], loop: asyncio.AbstractEventLoop) -> None:
+        self._receive = receive
+        self._loop = loop
+        self._buffer = bytearray()
+        self._done = False
+
+    def _fill(self) -> None:
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is self._loop:
+            raise RuntimeError('Read the body of an ASGI request with "await request.aread()".')
+        message = asyncio.run_coroutine_threadsafe(self._receive(), self._loop).result()
+        if message['type'] == 'http.disconnect':
+            from .exceptions import HTTPError
+            raise HTTPError(400, 'Client disconnected.')
+        self._buffer += message.get('body', b'')
+        self._done = not message.get('more_body', False)
+
+    def read(self, size: int=-1) -> bytes:
+        while not self._done and (size < 0 or len(self._buffer) < size):
+            self._fill()
+        if size < 0 or size > len(self._buffer):
+            size = len(self._buffer)
+        chunk = bytes(self._buffer[:size])
+        del self._buffer[:size]
+        return chunk
+
+
+def bridge_body(environ: Dict[str, Any], loop: asyncio.AbstractEventLoop) -> None:
+    """ Let a synchronous callback stream the body of an ASGI request through
+        ``wsgi.input`` instead of receiving it before the callback runs.
+    """
+    receive = environ.get('kobin.asgi.receive')
+    if receive is None:
+        return
+    environ['kobin.asgi.receive'] = None
+    environ['wsgi.input'] = ReceiveReader(receive, loop)
+    environ['wsgi.input_terminated'] = True
+
+
+async def iter_body_async(out: Any, run_sync: Callable[..., Awaitable[Any]], chunk_size: int):
+    """ The asynchronous counterpart of :func:`kobin.app.make_body`.
+        Async iterables are consumed directly; file objects and other
+        iterables are advanced through ``run_sync`` so that a slow
+        producer never blocks the event loop.
+    """
+    if isinstance(out, bytes):
+        yield out
+        return
+    if isinstance(out, str):
+        yield out.encode('utf-8')
+        return
+    if hasattr(out, '__aiter__'):
+        try:
+            async for chunk in out:
+                yield chunk.encode('utf-8') if isinstance(chunk, str) else chunk
+        finally:
+            aclose = getattr(out, 'aclose', None)
+            if aclose is not None:
+                await aclose()
+        return
+    if hasattr(out, 'read'):
+        try:
+            while True:
+                chunk = await run_sync(out.read, chunk_size)
+                if not chunk:
+                    break
+                yield chunk.encode('utf-8') if isinstance(chunk, str) else chunk
+        finally:
+            out.close()
+        return
+    iterator = iter(out)
+    try:
+        while True:
+            chunk = await run_sync(next, iterator, _END)
+            if chunk is _END:
+                break
+            if chunk:
+                yield chunk.encode('utf-8') if isinstance(chunk, str) else chunk
+    finally:
+        close = getattr(out, 'close', None)
+        if close is not None:
+            close()
+
+
+async def send_response(send: Callable[[Dict], Awaitable[None]], status: int,
+                        headerlist: List[Tuple[str, str]], body) -> None:
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [(k.encode('latin1'), v.encode('latin1')) for k, v in headerlist],
+    })
+    async for chunk in body:
+        await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+    await send({'type': 'http.response.body', 'body': b'', 'more_body': False})
+
+
+async def lifespan(receive: Callable[[], Awaitable[Dict]], send: Callable[[Dict], Awaitable[None]],
+                   on_startup: Callable[[], None]=None, on_shutdown: Callable[[], None]=None) -> None:
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            if on_startup is not None:
+                on_startup()
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            if on_shutdown is not None:
+                on_shutdown()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+class ASGITestClient:
+    """ Call an ASGI application in process, without a server.
+
+        >>> client = ASGITestClient(app.asgi)
+        >>> status, headers, body = client.request('GET', '/')
+    """
+    def __init__(self, app: Callable[..., Awaitable[None]]) -> None:
+        self.app = app
+
+    async def arequest(self, method: str, path: str, body: bytes=b'',
+                       headers: Dict[str, str]=None, chunk_size: int=None) \
+            -> Tuple[int, List[Tuple[str, str]], bytes]:
+        path, _, query_string = path.partition('?')
+        headers = dict(headers or {})
+        if body:
+            headers.setdefault('Content-Length', str(len(body)))
+        scope = {
+            'type': 'http',
+            'asgi': {'version': '3.0'},
+            'http_version': '1.1',
+            'method': method.upper(),
+            'scheme': 'http',
+            'path': path,
+            'root_path': '',
+            'query_string': query_string.encode('latin1'),
+            'headers': [(k.lower().encode('latin1'), v.encode('latin1')) for k, v in headers.items()],
+            'server': ('testserver', 80),
+            'client': ('127.0.0.1', 12345),
+        }
+        chunk_size = chunk_size or len(body) or 1
+        chunks = [body[i:i + chunk_size] for i in range(0, len(body), chunk_size)] or [b'']
+        messages = [{'type': 'http.request', 'body': c, 'more_body': i < len(chunks) - 1}
+                    for i, c in enumerate(chunks)]
+        sent = []  # type: List[Dict]
+
+        async def receive() -> Dict:
+            if messages:
+                return messages.pop(0)
+            await asyncio.sleep(3600)
+            return {'type': 'http.disconnect'}
+
+        async def send(message: Dict) -> None:
+            sent.append(message)
+
+        await self.app(scope, receive, send)
+        start = sent[0]
+        response_headers = [(k.decode('latin1'), v.decode('latin1')) for k, v in start['headers']]
+        response_body = b''.join(m.get('body', b'') for m in sent[1:])
+        return start['status'], response_headers, response_body
+
+    def request(self, method: str, path: str, body: bytes=b'',
+                headers: Dict[str, str]=None, chunk_size: int=None) \
+            -> Tuple[int, List[Tuple[str, str]], bytes]:
+        return asyncio.run(self.arequest(method, path, body, headers, chunk_size))
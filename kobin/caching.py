@@ -0,0 +1,304 @@
+import asyncio
+import functools
+import hashlib
+import inspect
+import os
+import pickle
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager, contextmanager
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, List, Sequence, Tuple, Union
+
+from .environs import ResponseHeaders, request, response
+
+
+class MemoryCache:
+    """ In-process LRU cache whose entries expire after their TTL.
+        Each worker process has its own copy.
+    """
+    def __init__(self, maxsize: int=1024) -> None:
+        self.maxsize = maxsize
+        self._entries = OrderedDict()  # type: OrderedDict
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Any:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: Any, ttl: float) -> None:
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+class FileCache:
+    """ Cache kept as one pickle file per key in ``directory``, so that every
+        worker process of a deployment shares it. Files are replaced
+        atomically; the directory must only be writable by the application.
+
+        The modification time of each file is set to its expiry time. Expired
+        files are removed when read, and a sweep run at most every
+        ``sweep_interval`` seconds after a write removes the expired ones and,
+        above ``maxsize`` files, the ones expiring first.
+    """
+    def __init__(self, directory: str, maxsize: int=1024, sweep_interval: float=1) -> None:
+        self.directory = directory
+        self.maxsize = maxsize
+        self.sweep_interval = sweep_interval
+        self._next_sweep = 0.0
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, hashlib.sha1(key.encode('utf-8')).hexdigest() + '.cache')
+
+    def get(self, key: str) -> Any:
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                expires, stored_key, value = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return None
+        if stored_key != key:
+            return None
+        if expires < time.time():
+            self._unlink(path)
+            return None
+        return value
+
+    def set(self, key: str, value: Any, ttl: float) -> None:
+        expires = time.time() + ttl
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump((expires, key, value), f, pickle.HIGHEST_PROTOCOL)
+            os.utime(tmp, (expires, expires))
+            os.replace(tmp, self._path(key))
+        except BaseException:
+            os.unlink(tmp)
+            raise
+        if time.monotonic() >= self._next_sweep:
+            self._next_sweep = time.monotonic() + self.sweep_interval
+            self.sweep()
+
+    def sweep(self) -> None:
+        """ Remove the expired files, then the ones expiring first until at
+            most ``maxsize`` are left.
+        """
+        now = time.time()
+        entries = []  # type: List[Tuple[float, str]]
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if not entry.name.endswith('.cache'):
+                    continue
+                try:
+                    expires = entry.stat().st_mtime
+                except FileNotFoundError:
+                    continue
+                if expires < now:
+                    self._unlink(entry.path)
+                else:
+                    entries.append((expires, entry.path))
+        if len(entries) > self.maxsize:
+            entries.sort()
+            for _, path in entries[:len(entries) - self.maxsize]:
+                self._unlink(path)
+
+    def _unlink(self, path: str) -> None:
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass  # removed by another process
+
+    def delete(self, key: str) -> None:
+        try:
+            os.unlink(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def clear(self) -> None:
+        for name in os.listdir(self.directory):
+            if name.endswith('.cache'):
+                os.unlink(os.path.join(self.directory, name))
+
+
+def create_cache(config: Dict[str, Any]) -> Union[MemoryCache, FileCache]:
+    """ The backend named by ``RESPONSE_CACHE_BACKEND``: ``'memory'`` holding
+        up to ``RESPONSE_CACHE_SIZE`` responses, or ``'file'`` keeping as many
+        in ``RESPONSE_CACHE_DIR``.
+    """
+    backend = config['RESPONSE_CACHE_BACKEND']
+    if backend == 'memory':
+        return MemoryCache(config['RESPONSE_CACHE_SIZE'])
+    if backend == 'file':
+        if not config['RESPONSE_CACHE_DIR']:
+            raise ValueError('RESPONSE_CACHE_DIR is required by the file response cache.')
+        return FileCache(config['RESPONSE_CACHE_DIR'], config['RESPONSE_CACHE_SIZE'])
+    raise ValueError('Unknown response cache backend: {}'.format(backend))
+
+
+class SingleFlight:
+    """ Let one thread at a time run the code guarded for a given key. """
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._calls = {}  # type: Dict[str, List[Any]]
+
+    @contextmanager
+    def __call__(self, key: str) -> Iterator[None]:
+        with self._lock:
+            call = self._calls.get(key)
+            if call is None:
+                call = self._calls[key] = [threading.Lock(), 0]
+            call[1] += 1
+        try:
+            with call[0]:
+                yield
+        finally:
+            with self._lock:
+                call[1] -= 1
+                if not call[1]:
+                    del self._calls[key]
+
+
+class AsyncSingleFlight:
+    """ Let one task at a time run the code guarded for a given key.
+        Unlike :class:`SingleFlight`, waiting doesn't block the event loop.
+    """
+    def __init__(self) -> None:
+        self._calls = {}  # type: Dict[str, List[Any]]
+
+    @asynccontextmanager
+    async def __call__(self, key: str) -> AsyncIterator[None]:
+        call = self._calls.get(key)
+        if call is None:
+            call = self._calls[key] = [asyncio.Lock(), 0]
+        call[1] += 1
+        try:
+            async with call[0]:
+                yield
+        finally:
+            call[1] -= 1
+            if not call[1]:
+                del self._calls[key]
+
+
+def cache_key(query: Sequence[str]=None, vary: Sequence[str]=()) -> str:
+    """ The cache key of the current request: its method, path, the query
+        params named in ``query`` (the whole query string when None) and the
+        values of the ``vary`` request headers.
+    """
+    environ = request.environ
+    method = environ.get('REQUEST_METHOD', 'GET').upper()
+    parts = ['GET' if method == 'HEAD' else method, request.path]
+    if query is None:
+        parts.append(environ.get('QUERY_STRING', ''))
+    else:
+        params = request.GET
+        parts.extend('{}={}'.format(name, params.getall(name)) for name in query)
+    if vary:
+        headers = request.headers
+        parts.extend('{}:{}'.format(name.lower(), headers.get(name, '')) for name in vary)
+    return '\n'.join(parts)
+
+
+def _restore(entry: Tuple[int, ResponseHeaders, bytes]) -> bytes:
+    status, headers, body = entry
+    response.status = status
+    response.headers = headers.copy()
+    return body
+
+
+def _entry(out: Any) -> Union[None, Tuple[int, ResponseHeaders, bytes]]:
+    """ What to store for the output of a callback, or None when the response
+        must not be shared: errors, cookies and streamed bodies.
+    """
+    if response.status_code != 200 or response._cookies or not isinstance(out, (bytes, str)):
+        return None
+    headers = response._headers
+    if isinstance(out, str):
+        out = out.encode('utf-8')
+    return 200, ResponseHeaders() if headers is None else headers.copy(), out
+
+
+def cached(ttl: float, query: Sequence[str]=None, vary: Sequence[str]=(), backend: Any=None) \
+        -> Callable[[Callable], Callable]:
+    """ Keep the responses of a GET route for ``ttl`` seconds, keyed by
+        :func:`cache_key`. Concurrent misses of the same key in a process
+        run the callback once; the others wait for its result. ``backend``
+        defaults to :attr:`kobin.app.Kobin.response_cache`.
+
+        >>> @app.route('/ranking')
+        ... @cached(60, query=['page'], vary=['Accept-Language'])
+        ... def ranking():
+        ...     return render_template('ranking.html', users=top_users())
+    """
+    single_flight = SingleFlight()
+    async_single_flight = AsyncSingleFlight()
+
+    def get_backend() -> Any:
+        return backend if backend is not None else request.environ['kobin.app'].response_cache
+
+    def lookup() -> Tuple[Any, Union[None, str], Any]:
+        if request.method not in ('GET', 'HEAD'):
+            return None, None, None
+        key = cache_key(query, vary)
+        store = get_backend()
+        return store, key, store.get(key)
+
+    def decorator(callback: Callable) -> Callable:
+        if inspect.iscoroutinefunction(callback):
+            @functools.wraps(callback)
+            async def async_wrapper(**kwargs):
+                store, key, entry = lookup()
+                if key is None:
+                    return await callback(**kwargs)
+                if entry is not None:
+                    return _restore(entry)
+                async with async_single_flight(key):
+                    entry = store.get(key)
+                    if entry is not None:
+                        return _restore(entry)
+                    out = await callback(**kwargs)
+                    entry = _entry(out)
+                    if entry is not None:
+                        store.set(key, entry, ttl)
+                return out
+            return async_wrapper
+
+        @functools.wraps(callback)
+        def wrapper(**kwargs):
+            store, key, entry = lookup()
+            if key is None:
+                return callback(**kwargs)
+            if entry is not None:
+                return _restore(entry)
+            with single_flight(key):
+                entry = store.get(key)
+                if entry is not None:
+                    return _restore(entry)
+                out = callback(**kwargs)
+                entry = _entry(out)
+                if entry is not None:
+                    store.set(key, entry, ttl)
+            return out
+        return wrapper
+    return decorator
@@ -0,0 +1,167 @@
+import zlib
+from typing import Any, AsyncIterator, Dict, Iterable, Iterator, Sequence, Union
+
+try:
+    import brotli  # type: ignore
+except ImportError:  # pragma: no cover
+    brotli = None
+
+# Encodings in order of preference when the client accepts them equally.
+ENCODINGS = ('br', 'gzip') if brotli is not None else ('gzip', )
+_SKIPPED_STATUS = (204, 206, 304)
+
+
+class GzipStream:
+    """ Incremental gzip compressor. Every chunk is flushed with
+        ``Z_SYNC_FLUSH`` so the client can decode it as soon as it arrives.
+    """
+    __slots__ = ('_compressor', )
+
+    def __init__(self, level: int) -> None:
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, chunk: bytes, flush: bool=True) -> bytes:
+        data = self._compressor.compress(chunk)
+        return data + self._compressor.flush(zlib.Z_SYNC_FLUSH) if flush else data
+
+    def finish(self) -> bytes:
+        return self._compressor.flush()
+
+
+class BrotliStream:
+    """ Incremental brotli compressor, available when ``brotli`` is installed. """
+    __slots__ = ('_compressor', )
+
+    def __init__(self, level: int) -> None:
+        self._compressor = brotli.Compressor(quality=level)
+
+    def compress(self, chunk: bytes, flush: bool=True) -> bytes:
+        data = self._compressor.process(chunk)
+        return data + self._compressor.flush() if flush else data
+
+    def finish(self) -> bytes:
+        return self._compressor.finish()
+
+
+def negotiate(accept_encoding: str, available: Sequence[str]=ENCODINGS) -> Union[None, str]:
+    """ The encoding of ``available`` the ``Accept-Encoding`` header prefers,
+        or None when the client accepts none of them.
+    """
+    qualities = {}  # type: Dict[str, float]
+    for item in accept_encoding.split(','):
+        coding, _, params = item.partition(';')
+        quality = 1.0
+        params = params.strip()
+        if params[:2] in ('q=', 'Q='):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        qualities[coding.strip().lower()] = quality
+    best, best_quality = None, 0.0
+    for coding in available:
+        quality = qualities.get(coding, qualities.get('*', 0.0))
+        if quality > best_quality:
+            best, best_quality = coding, quality
+    return best
+
+
+def start_compression(environ: Dict[str, Any], response: Any, config: Dict[str, Any],
+                      size: int=None) -> Union[None, GzipStream, BrotliStream]:
+    """ Decide whether ``response`` is sent compressed. If so, set its
+        ``Content-Encoding`` and return the compressor for the body.
+        ``size`` is the length of the body when it is known up front; bodies
+        shorter than ``COMPRESSION_MIN_SIZE`` are left alone. Responses of the
+        routes named in ``COMPRESSION_EXCLUDED_ROUTES`` and content types
+        starting with one of ``COMPRESSION_EXCLUDED_TYPES`` are never compressed.
+    """
+    if response.status_code < 200 or response.status_code in _SKIPPED_STATUS:
+        return None
+    route = environ.get('kobin.route')
+    if route is not None and route.name in config['COMPRESSION_EXCLUDED_ROUTES']:
+        return None
+    headers = response.headers
+    if 'Content-Encoding' in headers or 'no-transform' in headers.get('Cache-Control', ''):
+        return None
+    content_type = headers.get('Content-Type', response.default_content_type).lower()
+    if content_type.startswith(tuple(config['COMPRESSION_EXCLUDED_TYPES'])):
+        return None
+
+    vary = headers.get_all('Vary')
+    if not any('accept-encoding' in v.lower() or v.strip() == '*' for v in vary):
+        headers.append('Vary', 'Accept-Encoding')
+    if size is None and 'Content-Length' in headers:
+        size = int(headers['Content-Length'])
+    if size is not None and size < config['COMPRESSION_MIN_SIZE']:
+        return None
+    encoding = negotiate(environ.get('HTTP_ACCEPT_ENCODING', ''))
+    if encoding is None:
+        return None
+
+    headers['Content-Encoding'] = encoding
+    del headers['Content-Length']
+    etag = headers.get('ETag')
+    if etag is not None and not etag.startswith('W/'):
+        # The compressed body is not byte for byte the tagged one anymore.
+        headers['ETag'] = 'W/' + etag
+    if encoding == 'br':
+        return BrotliStream(config['COMPRESSION_BROTLI_LEVEL'])
+    return GzipStream(config['COMPRESSION_LEVEL'])
+
+
+def compress_body(environ: Dict[str, Any], response: Any, config: Dict[str, Any],
+                  body: Iterable[bytes]) -> Iterable[bytes]:
+    """ The compression stage of :meth:`kobin.app.Kobin.wsgi`.
+        Bodies given as a list are compressed at once and get a new
+        ``Content-Length``; any other iterable is compressed as it is
+        streamed, flushing after every chunk.
+    """
+    if isinstance(body, list):
+        data = b''.join(body)
+        stream = start_compression(environ, response, config, len(data))
+        if stream is None:
+            return body
+        data = stream.compress(data, flush=False) + stream.finish()
+        response.headers['Content-Length'] = str(len(data))
+        return [data]
+    stream = start_compression(environ, response, config)
+    if stream is None:
+        return body
+    return _iter_compressed(body, stream)
+
+
+def _iter_compressed(body: Iterable[bytes], stream: Any) -> Iterator[bytes]:
+    try:
+        for chunk in body:
+            data = stream.compress(chunk)
+            if data:
+                yield data
+        yield stream.finish()
+    finally:
+        close = getattr(body, 'close', None)
+        if close is not None:
+            close()
+
+
+def compress_body_async(environ: Dict[str, Any], response: Any, config: Dict[str, Any],
+                        body: AsyncIterator[bytes], size: int=None) -> AsyncIterator[bytes]:
+    """ The compression stage of :meth:`kobin.app.Kobin.asgi`, to be called
+        before the response headers are sent.
+    """
+    stream = start_compression(environ, response, config, size)
+    if stream is None:
+        return body
+    return _aiter_compressed(body, stream)
+
+
+async def _aiter_compressed(body: AsyncIterator[bytes], stream: Any) -> AsyncIterator[bytes]:
+    try:
+        async for chunk in body:
+            data = stream.compress(chunk)
+            if data:
+                yield data
+        yield stream.finish()
+    finally:
+        aclose = getattr(body, 'aclose', None)
+        if aclose is not None:
+            await aclose()
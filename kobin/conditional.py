@@ -0,0 +1,135 @@
+import functools
+import hashlib
+import inspect
+from email.utils import parsedate_to_datetime
+from typing import Any, Callable, Dict
+
+from .environs import request, response
+
+ETAG_CACHE_MAX_BODY = 64 * 1024
+
+
+def make_etag(data: bytes, weak: bool=False) -> str:
+    """ A quoted entity tag computed from ``data``. """
+    tag = '"{}"'.format(hashlib.blake2b(data, digest_size=16).hexdigest())
+    return 'W/' + tag if weak else tag
+
+
+@functools.lru_cache(maxsize=256)
+def _cached_etag(data: bytes) -> str:
+    return make_etag(data)
+
+
+def body_etag(data: bytes) -> str:
+    """ :func:`make_etag` for response bodies. Tags of small bodies are kept
+        in a LRU cache, so a handler returning the same page again only costs
+        a dict lookup.
+    """
+    if len(data) <= ETAG_CACHE_MAX_BODY:
+        return _cached_etag(data)
+    return make_etag(data)
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    """ Weak comparison of ``etag`` with the tags of an ``If-None-Match`` header. """
+    if if_none_match.strip() == '*':
+        return True
+    if etag.startswith('W/'):
+        etag = etag[2:]
+    for tag in if_none_match.split(','):
+        tag = tag.strip()
+        if tag.startswith('W/'):
+            tag = tag[2:]
+        if tag == etag:
+            return True
+    return False
+
+
+def _not_modified_since(if_modified_since: str, last_modified: str) -> bool:
+    try:
+        return parsedate_to_datetime(last_modified) <= parsedate_to_datetime(if_modified_since)
+    except (TypeError, ValueError):
+        return False
+
+
+def is_not_modified(environ: Dict[str, Any], etag: str=None, last_modified: str=None) -> bool:
+    """ Evaluate ``If-None-Match`` and, when it is absent, ``If-Modified-Since``
+        of a GET or HEAD request against the validators of the resource.
+    """
+    if environ.get('REQUEST_METHOD', 'GET').upper() not in ('GET', 'HEAD'):
+        return False
+    if_none_match = environ.get('HTTP_IF_NONE_MATCH')
+    if if_none_match is not None:
+        return etag is not None and etag_matches(if_none_match, etag)
+    if_modified_since = environ.get('HTTP_IF_MODIFIED_SINCE')
+    if if_modified_since is not None and last_modified is not None:
+        return _not_modified_since(if_modified_since, last_modified)
+    return False
+
+
+def _not_modified(response: Any) -> None:
+    response.status = 304
+    headers = response.headers
+    for name in ('Content-Length', 'Content-Type', 'Content-Encoding'):
+        del headers[name]
+
+
+def conditional_output(environ: Dict[str, Any], response: Any, config: Dict[str, Any], out: Any) -> Any:
+    """ The conditional request stage of :meth:`kobin.app.Kobin.wsgi` and
+        :meth:`kobin.app.Kobin.asgi`. With ``AUTO_ETAG``, ``str`` and ``bytes``
+        outputs of successful responses get an ``ETag`` from their content.
+        When the validators of the response match the request, the response
+        becomes a ``304 Not Modified`` and the output is dropped.
+    """
+    if response.status_code != 200:
+        return out
+    headers = response._headers
+    if config['AUTO_ETAG'] and isinstance(out, (bytes, str)) and (headers is None or 'ETag' not in headers):
+        if isinstance(out, str):
+            out = out.encode('utf-8')
+        response.headers['ETag'] = body_etag(out)
+        headers = response._headers
+    if headers is None:
+        return out
+    if is_not_modified(environ, headers.get('ETag'), headers.get('Last-Modified')):
+        close = getattr(out, 'close', None)
+        if close is not None:
+            close()
+        _not_modified(response)
+        return b''
+    return out
+
+
+def etag(version: Callable[..., Any]) -> Callable[[Callable], Callable]:
+    """ Derive the ``ETag`` of a route from a cheap version key, so that the
+        callback is not called at all when the client has the current version.
+        ``version`` receives the url vars of the callback.
+
+        >>> @app.route('/posts/{post_id}')
+        ... @etag(lambda post_id: posts.updated_at(post_id))
+        ... def post(post_id: int):
+        ...     return render_template('post.html', post=posts.get(post_id))
+    """
+    def not_modified(kwargs: Dict[str, Any]) -> bool:
+        response.headers['ETag'] = tag = make_etag(str(version(**kwargs)).encode('utf-8'))
+        if is_not_modified(request.environ, tag):
+            _not_modified(response)
+            return True
+        return False
+
+    def decorator(callback: Callable) -> Callable:
+        if inspect.iscoroutinefunction(callback):
+            @functools.wraps(callback)
+            async def async_wrapper(**kwargs):
+                if not_modified(kwargs):
+                    return b''
+                return await callback(**kwargs)
+            return async_wrapper
+
+        @functools.wraps(callback)
+        def wrapper(**kwargs):
+            if not_modified(kwargs):
+                return b''
+            return callback(**kwargs)
+        return wrapper
+    return decorator
@@ -1,29 +1,160 @@
-import threading
-import cgi
-import json
-from typing import Dict, List, Tuple, Any
+import re
+from contextvars import ContextVar
+from operator import attrgetter
+from collections.abc import Mapping, MutableMapping
+from typing import Dict, Iterable, Iterator, List, Tuple, Any, Union
 import http.client as http_client
-from urllib.parse import SplitResult
+from urllib.parse import SplitResult, parse_qsl
 from http.cookies import SimpleCookie  # type: ignore
-from wsgiref.headers import Headers  # type: ignore
 
 
-def _local_property():
-    ls = threading.local()
+_MISSING = object()
+
+
+class _Context:
+    """ The request and response of the request being handled. A new one is
+        set for every request, so contexts copied into threads or asyncio
+        tasks never see each other's objects.
+    """
+    __slots__ = ('request', 'response')
+
+    def __init__(self, request: 'Request'=None, response: 'Response'=None) -> None:
+        self.request = request
+        self.response = response
+
+
+_context = ContextVar('kobin.context')  # type: ContextVar
+
+
+def bind(environ: Dict) -> None:
+    """ Bind a new request and response to the current context. """
+    _context.set(_Context(Request(environ), Response()))
+
+
+def _context_property(target: str, name: str):
+    get_value = attrgetter(target + '.' + name)
+    get_target = attrgetter(target)
 
     def fget(_):
         try:
-            return ls.var
-        except AttributeError:
+            return get_value(_context.get())
+        except LookupError:
             raise RuntimeError("Request context not initialized.")
 
     def fset(_, value):
-        ls.var = value
+        try:
+            setattr(get_target(_context.get()), name, value)
+        except LookupError:
+            raise RuntimeError("Request context not initialized.")
 
     def fdel(_):
-        del ls.var
+        delattr(get_target(_context.get()), name)
+
+    return property(fget, fset, fdel, 'Context-local property')
+
+
+class MultiDict(MutableMapping):
+    """ A dict that keeps every value of repeated keys. Item access returns
+        the last value of a key and :meth:`getall` all of them.
+    """
+    __slots__ = ('dict', )
+
+    def __init__(self, items: Iterable[Tuple[str, Any]]=()) -> None:
+        self.dict = {}  # type: Dict[str, List[Any]]
+        for key, value in items:
+            self.append(key, value)
+
+    def __len__(self) -> int:
+        return len(self.dict)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.dict)
+
+    def __contains__(self, key) -> bool:
+        return key in self.dict
+
+    def __getitem__(self, key: str) -> Any:
+        return self.dict[key][-1]
+
+    def __setitem__(self, key: str, value: Any) -> None:
+        self.dict[key] = [value]
+
+    def __delitem__(self, key: str) -> None:
+        del self.dict[key]
+
+    def append(self, key: str, value: Any) -> None:
+        self.dict.setdefault(key, []).append(value)
+
+    def getall(self, key: str) -> List[Any]:
+        return list(self.dict.get(key, ()))
+
+    def allitems(self) -> List[Tuple[str, Any]]:
+        return [(k, v) for k, values in self.dict.items() for v in values]
+
+    def __repr__(self):
+        return '<{cls}: {items}>'.format(cls=self.__class__.__name__, items=self.allitems())
+
+
+_COOKIE_ESCAPE_RE = re.compile(r'\\(?:([0-3][0-7][0-7])|(.))')
+
+
+def _unescape_cookie_value(match) -> str:
+    octal, char = match.groups()
+    return chr(int(octal, 8)) if octal else char
+
+
+def parse_cookie(header: str) -> Dict[str, str]:
+    """ Parse a ``Cookie`` header. Unlike :class:`http.cookies.SimpleCookie`,
+        malformed pairs are skipped instead of discarding the whole header.
+        When a name is repeated, the first (most specific) value wins.
+    """
+    cookies = {}  # type: Dict[str, str]
+    for pair in header.split(';'):
+        key, sep, value = pair.partition('=')
+        key = key.strip()
+        if not sep or not key or key in cookies:
+            continue
+        value = value.strip()
+        if len(value) >= 2 and value[0] == value[-1] == '"':
+            value = value[1:-1]
+            if '\\' in value:
+                value = _COOKIE_ESCAPE_RE.sub(_unescape_cookie_value, value)
+        cookies[key] = value
+    return cookies
+
+
+class RequestHeaders(Mapping):
+    """ A read-only, case-insensitive view of the HTTP headers found in a
+        WSGI environ, e.g. ``headers['content-type']``.
+    """
+    __slots__ = ('dict', )
 
-    return property(fget, fset, fdel, 'Thread-local property')
+    def __init__(self, environ: Dict) -> None:
+        self.dict = {}  # type: Dict[str, Tuple[str, str]]
+        for key, value in environ.items():
+            if key.startswith('HTTP_'):
+                name = key[5:]
+            elif key in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+                name = key
+            else:
+                continue
+            name = name.replace('_', '-').title()
+            self.dict[name.lower()] = (name, str(value))
+
+    def __len__(self) -> int:
+        return len(self.dict)
+
+    def __iter__(self) -> Iterator[str]:
+        return (name for name, _ in self.dict.values())
+
+    def __contains__(self, key) -> bool:
+        return isinstance(key, str) and key.lower() in self.dict
+
+    def __getitem__(self, key: str) -> str:
+        return self.dict[key.lower()][1]
+
+    def __repr__(self):
+        return '<{cls}: {items}>'.format(cls=self.__class__.__name__, items=dict(self.items()))
 
 
 ##################################################################################
@@ -33,12 +164,11 @@ def _local_property():
 class Request:
     """ A wrapper for WSGI environment dictionaries.
     """
-    __slots__ = ('environ', '_body', )
+    __slots__ = ('environ', )
 
     def __init__(self, environ: Dict=None) -> None:
         self.environ = {} if environ is None else environ
         self.environ['kobin.request'] = self
-        self._body = None  # type: str
 
     def get(self, value: str, default=None):
         return self.environ.get(value, default)
@@ -55,33 +185,177 @@ class Request:
         return self.environ.get('REQUEST_METHOD', 'GET').upper()
 
     @property
-    def GET(self) -> Dict[str, str]:
-        params = cgi.FieldStorage(  # type: ignore
-            environ=self.environ,
-            keep_blank_values=True,
-        )
-        p = {k: params[k].value for k in params}
-        return p
+    def GET(self) -> MultiDict:
+        """ The parsed ``QUERY_STRING``, cached until it is changed. """
+        environ = self.environ
+        query = environ.get('kobin.request.query')
+        if query is None:
+            query = MultiDict(parse_qsl(environ.get('QUERY_STRING', ''), keep_blank_values=True))
+            environ['kobin.request.query'] = query
+        return query
+
+    def _config(self, key: str) -> Any:
+        """ A config value of the app serving this request, or its default. """
+        from .app import Config
+        app = self.environ.get('kobin.app')
+        if app is not None and key in app.config:
+            return app.config[key]
+        return Config.default_config[key]
+
+    def _parse_forms(self) -> None:
+        from .exceptions import HTTPError
+        from .multipart import MultipartError, parse_multipart, parse_options_header
+        environ = self.environ
+        forms, files = MultiDict(), MultiDict()
+        content_type, options = parse_options_header(environ.get('CONTENT_TYPE', ''))
+        if content_type == 'multipart/form-data':
+            if int(environ.get('CONTENT_LENGTH') or 0) > 0:
+                try:
+                    fields, uploads = parse_multipart(
+                        self.iter_body(), options.get('boundary', ''),
+                        charset=options.get('charset', 'utf-8'),
+                        spool_size=self._config('MULTIPART_SPOOL_SIZE'),
+                        max_parts=self._config('MULTIPART_MAX_PARTS'),
+                        max_memory=self._config('MULTIPART_MAX_MEMORY'),
+                    )
+                except MultipartError as e:
+                    raise HTTPError(e.status, str(e))
+                forms, files = MultiDict(fields), MultiDict(uploads)
+        elif content_type in ('application/x-www-form-urlencoded', ''):
+            forms = MultiDict(parse_qsl(self.body, keep_blank_values=True))
+        environ['kobin.request.forms'] = forms
+        environ['kobin.request.files'] = files
 
     @property
-    def POST(self) -> Dict[str, str]:
-        form = cgi.FieldStorage(  # type: ignore
-            fp=self.environ['wsgi.input'],
-            environ=self.environ,
-            keep_blank_values=True,
-        )
-        params = {k: form[k].value for k in form}
-        return params
+    def forms(self) -> MultiDict:
+        """ Form fields of an urlencoded or ``multipart/form-data`` body. """
+        forms = self.environ.get('kobin.request.forms')
+        if forms is None:
+            self._parse_forms()
+            forms = self.environ['kobin.request.forms']
+        return forms
+
+    @property
+    def files(self) -> MultiDict:
+        """ Uploaded :class:`kobin.multipart.FileUpload` objects of a
+            ``multipart/form-data`` body. """
+        files = self.environ.get('kobin.request.files')
+        if files is None:
+            self._parse_forms()
+            files = self.environ['kobin.request.files']
+        return files
+
+    @property
+    def POST(self) -> MultiDict:
+        """ :attr:`forms` and :attr:`files` combined. """
+        post = self.environ.get('kobin.request.post')
+        if post is None:
+            post = MultiDict(self.forms.allitems() + self.files.allitems())
+            self.environ['kobin.request.post'] = post
+        return post
 
     @property
     def body(self) -> str:
-        if self._body is None:
-            self._body = self.environ['wsgi.input'].read(int(self.environ.get('CONTENT_LENGTH', 0))).decode('utf-8')
-        return self._body
+        return self.raw_body.decode('utf-8')
+
+    @property
+    def raw_body(self) -> bytes:
+        """ The request body as bytes, read once and cached. """
+        body = self.environ.get('kobin.request.body')
+        if body is None:
+            body = b''.join(self.iter_body())
+            self.environ['kobin.request.body'] = body
+        return body
+
+    def iter_body(self, chunk_size: int=64 * 1024) -> Iterator[bytes]:
+        """ Read the request body in chunks of at most ``chunk_size`` bytes
+            without keeping it. Bodies larger than ``MAX_BODY_SIZE`` are
+            refused with 413. Without ``CONTENT_LENGTH``, the body is read
+            to its end only when the server sets ``wsgi.input_terminated``.
+            The body can be read once; :attr:`raw_body` keeps it.
+        """
+        from .exceptions import HTTPError
+        environ = self.environ
+        body = environ.get('kobin.request.body')
+        if body is not None:
+            yield body
+            return
+        if environ.get('kobin.request.consumed'):
+            raise RuntimeError('The request body was already read.')
+        if environ.get('kobin.asgi.receive') is not None:
+            raise RuntimeError('Read the body of an ASGI request with "await request.aread()".')
+        max_body_size = self._config('MAX_BODY_SIZE')
+        if environ.get('CONTENT_LENGTH'):
+            remaining = int(environ['CONTENT_LENGTH'])  # type: Union[None, int]
+            if remaining > max_body_size:
+                raise HTTPError(413, 'Request body too large.')
+            if remaining <= 0:
+                return
+        elif environ.get('wsgi.input_terminated'):
+            remaining = None
+        else:
+            return
+        environ['kobin.request.consumed'] = True
+        stream = environ['wsgi.input']
+        size = 0
+        while remaining is None or remaining > 0:
+            chunk = stream.read(chunk_size if remaining is None else min(chunk_size, remaining))
+            if not chunk:
+                break
+            if remaining is None:
+                size += len(chunk)
+                if size > max_body_size:
+                    raise HTTPError(413, 'Request body too large.')
+            else:
+                remaining -= len(chunk)
+            yield chunk
+
+    async def aread(self) -> bytes:
+        """ The request body as bytes, received without blocking when the
+            request comes through :meth:`kobin.app.Kobin.asgi`, and cached.
+        """
+        body = self.environ.get('kobin.request.body')
+        if body is None:
+            body = b''.join([chunk async for chunk in self.aiter_body()])
+            self.environ['kobin.request.body'] = body
+        return body
+
+    async def aiter_body(self):
+        """ The asynchronous counterpart of :meth:`iter_body`. """
+        environ = self.environ
+        receive = environ.get('kobin.asgi.receive')
+        if receive is None or 'kobin.request.body' in environ:
+            for chunk in self.iter_body():
+                yield chunk
+            return
+        from .exceptions import HTTPError
+        max_body_size = self._config('MAX_BODY_SIZE')
+        if int(environ.get('CONTENT_LENGTH') or 0) > max_body_size:
+            raise HTTPError(413, 'Request body too large.')
+        environ['kobin.asgi.receive'] = None
+        environ['kobin.request.consumed'] = True
+        size = 0
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                raise HTTPError(400, 'Client disconnected.')
+            chunk = message.get('body', b'')
+            size += len(chunk)
+            if size > max_body_size:
+                raise HTTPError(413, 'Request body too large.')
+            if chunk:
+                yield chunk
+            if not message.get('more_body', False):
+                break
 
     @property
-    def json(self) -> Dict:
-        return json.loads(self.body)
+    def json(self) -> Any:
+        """ The body parsed with ``JSON_LOADS`` (:func:`json.loads` by default), cached. """
+        data = self.environ.get('kobin.request.json', _MISSING)
+        if data is _MISSING:
+            data = self._config('JSON_LOADS')(self.raw_body)
+            self.environ['kobin.request.json'] = data
+        return data
 
     @property
     def url(self) -> str:
@@ -93,8 +367,21 @@ class Request:
 
     @property
     def cookies(self) -> Dict[str, str]:
-        cookies = SimpleCookie(self.environ.get('HTTP_COOKIE', '')).values()  # type: ignore
-        return {c.key: c.value for c in cookies}
+        """ Cookies sent by the client, parsed once per request. """
+        cookies = self.environ.get('kobin.request.cookies')
+        if cookies is None:
+            cookies = parse_cookie(self.environ.get('HTTP_COOKIE', ''))
+            self.environ['kobin.request.cookies'] = cookies
+        return cookies
+
+    @property
+    def headers(self) -> 'RequestHeaders':
+        """ A case-insensitive mapping of the request headers, built once per request. """
+        headers = self.environ.get('kobin.request.headers')
+        if headers is None:
+            headers = RequestHeaders(self.environ)
+            self.environ['kobin.request.headers'] = headers
+        return headers
 
     def get_cookie(self, key: str, default: str=None, secret=None) -> str:
         value = self.cookies.get(key)
@@ -113,7 +400,7 @@ class Request:
         todelete = ()
 
         if key == 'wsgi.input':
-            todelete = ('body', 'forms', 'files', 'params', 'post', 'json')
+            todelete = ('body', 'consumed', 'forms', 'files', 'params', 'post', 'json')
         elif key == 'QUERY_STRING':
             todelete = ('query', 'params')
         elif key.startswith('HTTP_'):
@@ -132,11 +419,18 @@ class Request:
 
 
 class LocalRequest(Request):
-    """ A thread local subclass of :class:`Request`
+    """ A :class:`Request` whose state is the request bound to the current
+        context, so that one global object serves every thread and task.
     """
-    bind = Request.__init__
-    environ = _local_property()
-    _body = _local_property()
+    __slots__ = ()
+    environ = _context_property('request', 'environ')
+
+    def __init__(self) -> None:
+        pass
+
+    def bind(self, environ: Dict=None) -> None:
+        context = _context.get(None)
+        _context.set(_Context(Request(environ), context and context.response))
 
 
 ##################################################################################
@@ -145,25 +439,134 @@ class LocalRequest(Request):
 
 HTTP_CODES = http_client.responses.copy()
 _HTTP_STATUS_LINES = dict((k, '%d %s' % (k, v)) for (k, v) in HTTP_CODES.items())
+_BODYLESS_STATUS = (204, 304)
 
 
-class Response:
+def _wsgi_str(value: str) -> str:
+    """ Encode a header value as the latin1 'native string' WSGI expects. """
+    return value if value.isascii() else value.encode('utf8').decode('latin1')
+
+
+class ResponseHeaders:
+    """ Response headers kept as an ordered list of WSGI ready ``(name, value)``
+        pairs, plus an index by lowercased name for O(1) lookups. Values are
+        encoded for WSGI once, when they are set. The interface follows
+        :class:`wsgiref.headers.Headers`; lookups return the values as set.
+    """
+    __slots__ = ('_list', '_index')
+
+    def __init__(self, headers: Iterable[Tuple[str, str]]=()) -> None:
+        self._list = []  # type: List[Tuple[str, str]]
+        self._index = {}  # type: Dict[str, List[str]]
+        for name, value in headers:
+            self.append(name, value)
+
+    def append(self, name: str, value: Any) -> None:
+        value = str(value)
+        self._list.append((name, _wsgi_str(value)))
+        self._index.setdefault(name.lower(), []).append(value)
+
+    def add_header(self, name: str, value: Any, **params: Any) -> None:
+        """ Add a header, e.g. ``add_header('Content-Disposition', 'attachment', filename='a.txt')``. """
+        parts = [] if value is None else [str(value)]
+        for key, param in params.items():
+            key = key.replace('_', '-')
+            if param is None:
+                parts.append(key)
+            else:
+                parts.append('{}="{}"'.format(key, str(param).replace('\\', '\\\\').replace('"', '\\"')))
+        self.append(name, '; '.join(parts))
+
+    def __contains__(self, name) -> bool:
+        return name.lower() in self._index
+
+    def __getitem__(self, name: str) -> str:
+        """ The first value of the header, or None. """
+        values = self._index.get(name.lower())
+        return values[0] if values else None
+
+    def get(self, name: str, default: str=None) -> str:
+        values = self._index.get(name.lower())
+        return values[0] if values else default
+
+    def get_all(self, name: str) -> List[str]:
+        return list(self._index.get(name.lower(), ()))
+
+    def __setitem__(self, name: str, value: Any) -> None:
+        del self[name]
+        self.append(name, value)
+
+    def __delitem__(self, name: str) -> None:
+        lower = name.lower()
+        if self._index.pop(lower, None) is not None:
+            self._list = [(k, v) for k, v in self._list if k.lower() != lower]
+
+    def setdefault(self, name: str, value: Any) -> str:
+        current = self.get(name)
+        if current is None:
+            self.append(name, value)
+            return str(value)
+        return current
+
+    def copy(self) -> 'ResponseHeaders':
+        headers = ResponseHeaders()
+        headers._list = list(self._list)
+        headers._index = {k: list(v) for k, v in self._index.items()}
+        return headers
+
+    def keys(self) -> List[str]:
+        return [k for k, _ in self._list]
+
+    def values(self) -> List[str]:
+        return [v for _, v in self._list]
+
+    def items(self) -> List[Tuple[str, str]]:
+        """ The WSGI ready ``(name, value)`` pairs, in order. """
+        return list(self._list)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.keys())
+
+    def __len__(self) -> int:
+        return len(self._list)
+
+    def __repr__(self):
+        return '<{cls}: {items!r}>'.format(cls=self.__class__.__name__, items=self._list)
+
+
+class BaseResponse:
+    """ The behaviour shared by :class:`Response` and :class:`kobin.exceptions.HTTPError`.
+        It declares no instance layout of its own, so that ``HTTPError`` can
+        also derive from ``Exception``. Headers and cookies are created when
+        first used; a response that sets neither allocates nothing for them.
+    """
+    __slots__ = ()
     default_status = 200
     default_content_type = 'text/html; charset=UTF-8'
 
     def __init__(self, body: str='', status: int=None, headers: Dict=None,
                  **more_headers) -> None:
-        self.headers = Headers()
         self.body = body
         self._status_code = status or self.default_status
-        self._cookies = SimpleCookie()  # type: ignore
+        self._cookies = None  # type: SimpleCookie
+        self._headers = None  # type: ResponseHeaders
 
-        if headers:
-            for name, value in headers.items():
-                self.headers.add_header(name, value)
-        if more_headers:
+        if headers or more_headers:
+            self._headers = ResponseHeaders()
+            for name, value in (headers or {}).items():
+                self._headers.append(name, value)
             for name, value in more_headers.items():
-                self.headers.add_header(name, value)
+                self._headers.append(name, value)
+
+    @property
+    def headers(self) -> ResponseHeaders:
+        if self._headers is None:
+            self._headers = ResponseHeaders()
+        return self._headers
+
+    @headers.setter
+    def headers(self, headers: ResponseHeaders) -> None:
+        self._headers = headers
 
     @property
     def status_code(self):
@@ -173,10 +576,12 @@ class Response:
     @property
     def status(self):
         """ The HTTP status line as a string (e.g. ``404 Not Found``)."""
+        status = _HTTP_STATUS_LINES.get(self._status_code)
+        if status is not None:
+            return status
         if not 100 <= self._status_code <= 999:
             raise ValueError('Status code out of range.')
-        status = _HTTP_STATUS_LINES.get(self._status_code)
-        return str(status or ('{} Unknown'.format(self._status_code)))
+        return '{} Unknown'.format(self._status_code)
 
     @status.setter
     def status(self, status_code: int):
@@ -187,20 +592,24 @@ class Response:
     @property
     def headerlist(self) -> List[Tuple[str, str]]:
         """ WSGI conform list of (header, value) tuples. """
-        out = []  # type: List[Tuple[str, str]]
-        if 'Content-Type' not in self.headers:
-            self.headers.add_header('Content-Type', self.default_content_type)
-        out += [(key, value)
-                for key in self.headers.keys()
-                for value in self.headers.get_all(key)]
+        headers = self._headers
+        if headers is None:
+            out = []  # type: List[Tuple[str, str]]
+        else:
+            out = headers.items()
+        if (headers is None or 'content-type' not in headers._index) and \
+                self._status_code not in _BODYLESS_STATUS:
+            out.append(('Content-Type', self.default_content_type))
         if self._cookies:
             for c in self._cookies.values():
-                out.append(('Set-Cookie', c.OutputString()))
-        return [(k, v.encode('utf8').decode('latin1')) for (k, v) in out]
+                out.append(('Set-Cookie', _wsgi_str(c.OutputString())))
+        return out
 
     def set_cookie(self, key: str, value: Any, expires: str=None, path: str=None, **options: Dict[str, Any]) -> None:
         from datetime import timedelta, datetime, date
         import time
+        if self._cookies is None:
+            self._cookies = SimpleCookie()  # type: ignore
         self._cookies[key] = value
         if expires:
             self._cookies[key]['expires'] = expires
@@ -224,28 +633,40 @@ class Response:
         kwargs['expires'] = 0
         self.set_cookie(key, '', **kwargs)
 
-    def apply(self, other):
-        self.status = other._status_code
+    def apply(self, other) -> None:
+        """ Take over the status, headers, cookies and body of ``other``. """
+        self._status_code = other._status_code
         self._cookies = other._cookies
-        self.headers = other.headers
+        self._headers = other._headers
         self.body = other.body
 
 
+class Response(BaseResponse):
+    __slots__ = ('body', '_status_code', '_headers', '_cookies')
+
+
 class LocalResponse(Response):
-    """ A thread-local subclass ob :class:`BaseResponse` with a different set
-        of attributes for each thread
+    """ A :class:`Response` whose state is the response bound to the current
+        context, so that one global object serves every thread and task.
     """
-    bind = Response.__init__
-    _status_code = _local_property()
-    headers = _local_property()
-    _cookies = _local_property()
-    body = _local_property()
+    __slots__ = ()
+    _status_code = _context_property('response', '_status_code')
+    headers = _context_property('response', 'headers')
+    _headers = _context_property('response', '_headers')
+    _cookies = _context_property('response', '_cookies')
+    body = _context_property('response', 'body')
+
+    def __init__(self) -> None:
+        pass
+
+    def bind(self, *args, **kwargs) -> None:
+        context = _context.get(None)
+        _context.set(_Context(context and context.request, Response(*args, **kwargs)))
 
 
 ##################################################################################
-# Make Request and Response object to thread local ###############################
+# Make Request and Response object context local #################################
 ##################################################################################
 
 request = LocalRequest()  # type: LocalRequest
 response = LocalResponse()  # type: LocalResponse
-local = threading.local()  # type: ignore
@@ -1,7 +1,16 @@
-from .environs import Response
+from .environs import BaseResponse
 
+# Bodies of the errors raised while routing, formatted with the request path.
+ERROR_BODIES = {
+    404: 'Not found: {}',
+    405: 'Method not allowed: {}',
+}
 
-class HTTPError(Response, Exception):
+# ERROR_BODIES split around the path once, so that a body is a concatenation.
+_BODY_PARTS = {status: tuple(body.split('{}', 1)) for status, body in ERROR_BODIES.items()}
+
+
+class HTTPError(BaseResponse, Exception):
     default_status = 500
 
     def __init__(self, status: int, body: str,
@@ -9,3 +18,9 @@ class HTTPError(Response, Exception):
         super().__init__(status=status or self.default_status, body=body, *args, **kwargs)  # type: ignore
         self.exception = exception
         self.traceback = traceback
+
+    @classmethod
+    def for_path(cls, status: int, path: str) -> 'HTTPError':
+        """ The error for ``status`` with its body made from :data:`ERROR_BODIES`. """
+        head, tail = _BODY_PARTS[status]
+        return cls(status, head + path + tail)
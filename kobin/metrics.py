@@ -0,0 +1,222 @@
+import bisect
+import itertools
+import threading
+from time import perf_counter
+from typing import Any, Callable, Dict, List, Tuple, Union
+
+HOOK_EVENTS = ('before_request', 'after_match', 'after_handler', 'after_response')
+
+# Upper bounds in seconds of the latency histogram buckets, from 100µs to 10s.
+DEFAULT_BUCKETS = (
+    0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+    0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)
+
+
+class Timings:
+    """ :func:`time.perf_counter` readings taken while a request is handled.
+        Unreached points are None. ``template`` accumulates the time spent in
+        :func:`kobin.templates.render_template`, and ``weight`` is the number
+        of requests this one stands for when only 1 in N requests is sampled.
+    """
+    __slots__ = ('start', 'matched', 'handled', 'finished', 'template', 'weight')
+
+    def __init__(self, weight: int=1) -> None:
+        self.start = perf_counter()
+        self.matched = None  # type: float
+        self.handled = None  # type: float
+        self.finished = None  # type: float
+        self.template = 0.0
+        self.weight = weight
+
+    @property
+    def routing(self) -> Union[None, float]:
+        return None if self.matched is None else self.matched - self.start
+
+    @property
+    def handler(self) -> Union[None, float]:
+        if self.handled is None or self.matched is None:
+            return None
+        return self.handled - self.matched
+
+    @property
+    def response(self) -> Union[None, float]:
+        """ Time spent after the handler: conditional requests, body, compression and headers. """
+        if self.finished is None or self.handled is None:
+            return None
+        return self.finished - self.handled
+
+    @property
+    def total(self) -> Union[None, float]:
+        return None if self.finished is None else self.finished - self.start
+
+
+class Hooks:
+    """ Instrumentation callbacks of an application, called as
+        ``hook(environ, timings)``. With ``sample_rate`` N, only one request
+        in N is timed and passed to the hooks; the others cost a counter
+        increment.
+    """
+    def __init__(self, sample_rate: int=1) -> None:
+        self.callbacks = {event: [] for event in HOOK_EVENTS}  # type: Dict[str, List[Callable]]
+        self.sample_rate = max(int(sample_rate), 1)
+        self.active = False
+        self._counter = itertools.count()
+
+    def add(self, event: str, callback: Callable[[Dict[str, Any], Timings], None]) -> None:
+        if event not in self.callbacks:
+            raise ValueError('Unknown hook event: {}'.format(event))
+        self.callbacks[event].append(callback)
+        self.active = True
+
+    def start(self, environ: Dict[str, Any]) -> Union[None, Timings]:
+        """ Begin timing a request, or return None when it is not sampled. """
+        if self.sample_rate > 1 and next(self._counter) % self.sample_rate:
+            return None
+        timings = environ['kobin.timings'] = Timings(self.sample_rate)
+        self.fire('before_request', environ, timings)
+        return timings
+
+    def fire(self, event: str, environ: Dict[str, Any], timings: Timings) -> None:
+        for callback in self.callbacks[event]:
+            callback(environ, timings)
+
+
+class Histogram:
+    """ Latency histogram with fixed buckets. Quantiles are interpolated
+        inside the bucket they fall in, so they are as precise as the buckets.
+    """
+    def __init__(self, buckets: Tuple[float, ...]=DEFAULT_BUCKETS) -> None:
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, weight: int=1) -> None:
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += weight
+            self.sum += value * weight
+            self.count += weight
+
+    def quantile(self, q: float) -> Union[None, float]:
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            if seen + count >= rank and count:
+                lower = self.buckets[index - 1] if index else 0.0
+                upper = self.buckets[index] if index < len(self.buckets) else self.buckets[-1]
+                return lower + (upper - lower) * (rank - seen) / count
+            seen += count
+        return self.buckets[-1]
+
+
+def _labels(labels: Tuple[Tuple[str, str], ...], extra: str='') -> str:
+    parts = ['{}="{}"'.format(k, str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+             for k, v in labels]
+    if extra:
+        parts.append(extra)
+    return '{' + ','.join(parts) + '}' if parts else ''
+
+
+class MetricsRegistry:
+    """ In-process counters and histograms, keyed by name and labels. """
+    def __init__(self, buckets: Tuple[float, ...]=DEFAULT_BUCKETS) -> None:
+        self.buckets = buckets
+        self.counters = {}  # type: Dict[str, Dict[Tuple, float]]
+        self.histograms = {}  # type: Dict[str, Dict[Tuple, Histogram]]
+        self._lock = threading.Lock()
+
+    def inc(self, name: str, amount: float=1, **labels: str) -> None:
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            values = self.counters.setdefault(name, {})
+            values[key] = values.get(key, 0) + amount
+
+    def observe(self, name: str, value: float, weight: int=1, **labels: str) -> None:
+        key = tuple(sorted(labels.items()))
+        histogram = self.histograms.get(name, {}).get(key)
+        if histogram is None:
+            with self._lock:
+                histogram = self.histograms.setdefault(name, {}).setdefault(key, Histogram(self.buckets))
+        histogram.observe(value, weight)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """ Counters and histogram summaries (count, sum, p50, p95, p99) as plain data. """
+        with self._lock:
+            counters = {name: dict(values) for name, values in self.counters.items()}
+            histograms = {name: dict(values) for name, values in self.histograms.items()}
+        return {
+            'counters': counters,
+            'histograms': {
+                name: {key: {'count': h.count, 'sum': h.sum, 'p50': h.quantile(0.5),
+                             'p95': h.quantile(0.95), 'p99': h.quantile(0.99)}
+                       for key, h in values.items()}
+                for name, values in histograms.items()
+            },
+        }
+
+    def render_prometheus(self) -> str:
+        """ The metrics in the Prometheus text exposition format. """
+        lines = []  # type: List[str]
+        with self._lock:
+            counters = {name: dict(values) for name, values in self.counters.items()}
+            histograms = {name: dict(values) for name, values in self.histograms.items()}
+        for name in sorted(counters):
+            lines.append('# TYPE {} counter'.format(name))
+            for key, value in sorted(counters[name].items()):
+                lines.append('{}{} {}'.format(name, _labels(key), value))
+        for name in sorted(histograms):
+            lines.append('# TYPE {} histogram'.format(name))
+            for key, h in sorted(histograms[name].items()):
+                cumulative = 0
+                for bound, count in zip(h.buckets + (float('inf'), ), h.counts):
+                    cumulative += count
+                    le = '+Inf' if bound == float('inf') else repr(bound)
+                    lines.append('{}_bucket{} {}'.format(name, _labels(key, 'le="{}"'.format(le)), cumulative))
+                lines.append('{}_sum{} {}'.format(name, _labels(key), h.sum))
+                lines.append('{}_count{} {}'.format(name, _labels(key), h.count))
+        return '\n'.join(lines) + '\n'
+
+
+def route_label(environ: Dict[str, Any]) -> str:
+    route = environ.get('kobin.route')
+    if route is None:
+        return 'unmatched'
+    return route.name or route.rule
+
+
+class RequestMetrics:
+    """ ``after_response`` hook recording ``kobin_requests_total`` by route,
+        method and status, and per route histograms of the total latency and
+        of each phase in ``kobin_request_duration_seconds``.
+    """
+    def __init__(self, registry: MetricsRegistry) -> None:
+        self.registry = registry
+
+    def __call__(self, environ: Dict[str, Any], timings: Timings) -> None:
+        from .environs import response
+        route = route_label(environ)
+        registry = self.registry
+        registry.inc('kobin_requests_total', timings.weight, route=route,
+                     method=environ.get('REQUEST_METHOD', 'GET'), status=str(response.status_code))
+        for phase in ('total', 'routing', 'handler', 'response'):
+            value = getattr(timings, phase)
+            if value is not None:
+                registry.observe('kobin_request_duration_seconds', value, timings.weight,
+                                 route=route, phase=phase)
+        if timings.template:
+            registry.observe('kobin_request_duration_seconds', timings.template, timings.weight,
+                             route=route, phase='template')
+
+
+def prometheus_view(registry: MetricsRegistry) -> Callable[[], str]:
+    """ A route callback exposing ``registry`` to Prometheus. """
+    def metrics() -> str:
+        from .environs import response
+        response.headers['Content-Type'] = 'text/plain; version=0.0.4; charset=utf-8'
+        return registry.render_prometheus()
+    return metrics
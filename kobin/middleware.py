@@ -0,0 +1,116 @@
+""" Middlewares wrap the call of route callbacks inside the application.
+
+A middleware is a factory receiving the next handler of the chain and
+returning a handler, called as ``handler(callback, url_vars)``::
+
+    def cors(call_next):
+        def handler(callback, url_vars):
+            output = call_next(callback, url_vars)
+            response.headers['Access-Control-Allow-Origin'] = '*'
+            return output
+        return handler
+
+    def auth(call_next):
+        def handler(callback, url_vars):
+            if 'Authorization' not in request.headers:
+                raise HTTPError(401, 'Unauthorized.')  # short-circuits the chain
+            return call_next(callback, url_vars)
+        return handler
+
+Factories are called once when the chain is composed, not per request.
+A handler may return without calling ``call_next`` to short-circuit the
+rest of the chain and the callback.
+
+``async def`` callbacks go through a second chain, composed with
+:func:`compose_async`, where ``call_next`` is a coroutine function. A
+factory receiving one should return an ``async def`` handler awaiting it,
+so that its code after ``call_next`` and its ``try`` blocks see the
+output and the exceptions of the callback::
+
+    def timing(call_next):
+        if inspect.iscoroutinefunction(call_next):
+            async def async_handler(callback, url_vars):
+                start = time.perf_counter()
+                output = await call_next(callback, url_vars)
+                response.headers['X-Time'] = str(time.perf_counter() - start)
+                return output
+            return async_handler
+
+        def handler(callback, url_vars):
+            start = time.perf_counter()
+            output = call_next(callback, url_vars)
+            response.headers['X-Time'] = str(time.perf_counter() - start)
+            return output
+        return handler
+
+A plain handler in that chain still runs, and the awaitable returned by
+its ``call_next`` is awaited after it returns, so only its code before
+``call_next`` applies to ``async def`` callbacks.
+"""
+import functools
+import inspect
+from typing import Any, Awaitable, Callable, Dict, Sequence
+
+Handler = Callable[[Callable, Dict[str, Any]], Any]
+Middleware = Callable[[Handler], Handler]
+
+
+def call_callback(callback: Callable, url_vars: Dict[str, Any]) -> Any:
+    """ The innermost handler of every chain. """
+    return callback(**url_vars) if url_vars else callback()
+
+
+def compose(middlewares: Sequence[Middleware], handler: Handler=call_callback) -> Handler:
+    """ Compose ``middlewares`` around ``handler`` into one handler,
+        the first middleware being the outermost.
+    """
+    for middleware in reversed(middlewares):
+        handler = middleware(handler)
+    return handler
+
+
+async def call_callback_async(callback: Callable[..., Awaitable], url_vars: Dict[str, Any]) -> Any:
+    """ The innermost handler of every chain of ``async def`` callbacks. """
+    return await (callback(**url_vars) if url_vars else callback())
+
+
+def _awaiting(handler: Handler) -> Handler:
+    async def async_handler(callback, url_vars):
+        output = handler(callback, url_vars)
+        if inspect.isawaitable(output):
+            output = await output
+        return output
+    return async_handler
+
+
+def compose_async(middlewares: Sequence[Middleware], handler: Handler=call_callback_async) -> Handler:
+    """ Like :func:`compose`, for ``async def`` callbacks: the handlers of the
+        chain are coroutine functions, plain handlers being adapted.
+    """
+    for middleware in reversed(middlewares):
+        handler = middleware(handler)
+        if not inspect.iscoroutinefunction(handler):
+            handler = _awaiting(handler)
+    return handler
+
+
+def with_middlewares(middlewares: Sequence[Middleware]) -> Callable[[Callable], Callable]:
+    """ Decorator running a route callback through its own ``middlewares``,
+        composed once when the route is registered.
+    """
+    def decorator(callback: Callable) -> Callable:
+        if inspect.iscoroutinefunction(callback):
+            async_handler = compose_async(middlewares)
+
+            @functools.wraps(callback)
+            async def async_wrapper(**kwargs):
+                return await async_handler(callback, kwargs)
+            return async_wrapper
+
+        handler = compose(middlewares)
+
+        @functools.wraps(callback)
+        def wrapper(**kwargs):
+            return handler(callback, kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,176 @@
+import re
+import shutil
+import tempfile
+from typing import Any, BinaryIO, Dict, Iterable, List, Tuple
+
+_OPTION_RE = re.compile(r';\s*([^\s;=]+)\s*=\s*("(?:\\.|[^"\\])*"|[^;]*)')
+MAX_HEADER_SIZE = 8 * 1024
+
+
+class MultipartError(ValueError):
+    """ Raised for malformed or oversized ``multipart/form-data`` bodies.
+        ``status`` is the HTTP status code the request should be answered with.
+    """
+    def __init__(self, message: str, status: int=400) -> None:
+        super().__init__(message)
+        self.status = status
+
+
+def parse_options_header(value: str) -> Tuple[str, Dict[str, str]]:
+    """ Split a header such as ``Content-Type`` into its lowercased value and options. """
+    main, _, rest = value.partition(';')
+    options = {}  # type: Dict[str, str]
+    for key, val in _OPTION_RE.findall(';' + rest):
+        val = val.strip()
+        if len(val) >= 2 and val[0] == val[-1] == '"':
+            val = val[1:-1].replace('\\\\', '\\').replace('\\"', '"')
+        options[key.lower()] = val
+    return main.strip().lower(), options
+
+
+class FileUpload:
+    """ A file part of a ``multipart/form-data`` body.
+        Small files are kept in memory; larger ones are spilled to a
+        temporary file on disk.
+    """
+    def __init__(self, file: BinaryIO, name: str, filename: str,
+                 content_type: str, headers: Dict[str, str]) -> None:
+        self.file = file
+        self.name = name
+        self.filename = filename
+        self.content_type = content_type
+        self.headers = headers
+
+    @property
+    def value(self) -> bytes:
+        """ The whole content of the file. """
+        self.file.seek(0)
+        data = self.file.read()
+        self.file.seek(0)
+        return data
+
+    def save(self, path: str, chunk_size: int=64 * 1024) -> None:
+        self.file.seek(0)
+        with open(path, 'wb') as f:
+            shutil.copyfileobj(self.file, f, chunk_size)
+        self.file.seek(0)
+
+    def __repr__(self):
+        return '<{cls}: {name} {filename!r}>'.format(
+            cls=self.__class__.__name__, name=self.name, filename=self.filename
+        )
+
+
+class _Part:
+    __slots__ = ('headers', 'name', 'filename', 'content_type', 'data', 'file', 'size')
+
+    def __init__(self, headers: Dict[str, str], spool_size: int) -> None:
+        self.headers = headers
+        disposition, options = parse_options_header(headers.get('content-disposition', ''))
+        if disposition != 'form-data' or 'name' not in options:
+            raise MultipartError('Part without a form-data Content-Disposition.')
+        self.name = options['name']
+        self.filename = options.get('filename')
+        self.content_type = headers.get('content-type', 'text/plain' if self.filename is None
+                                        else 'application/octet-stream')
+        self.data = bytearray()
+        self.file = None if self.filename is None else tempfile.SpooledTemporaryFile(max_size=spool_size)
+        self.size = 0
+
+    def write(self, chunk: bytes) -> None:
+        self.size += len(chunk)
+        if self.file is None:
+            self.data += chunk
+        else:
+            self.file.write(chunk)
+
+
+def _parse_part_headers(raw: bytes) -> Dict[str, str]:
+    headers = {}  # type: Dict[str, str]
+    for line in raw.decode('utf-8', 'replace').split('\r\n'):
+        name, sep, value = line.partition(':')
+        if not sep:
+            raise MultipartError('Malformed part header.')
+        headers[name.strip().lower()] = value.strip()
+    return headers
+
+
+def parse_multipart(chunks: Iterable[bytes], boundary: str, charset: str='utf-8',
+                    spool_size: int=512 * 1024, max_parts: int=1000, max_memory: int=1024 * 1024) \
+        -> Tuple[List[Tuple[str, str]], List[Tuple[str, FileUpload]]]:
+    """ Parse a ``multipart/form-data`` body given as an iterable of chunks,
+        so only one chunk plus the data of the current part is held at a
+        time. File parts larger than ``spool_size`` are spilled to disk.
+        ``max_parts`` limits the number of parts and ``max_memory`` the total
+        size of the non-file fields.
+        Returns the form fields and the uploaded files as lists of pairs.
+    """
+    if not boundary or len(boundary) > 200:
+        raise MultipartError('Invalid multipart boundary.')
+    delimiter = b'\r\n--' + boundary.encode('latin1')
+    fields = []  # type: List[Tuple[str, str]]
+    files = []  # type: List[Tuple[str, FileUpload]]
+    memory = 0
+    part = None  # type: Any
+    buf = b'\r\n'  # lets the first delimiter be found like the following ones
+    chunks = iter(chunks)
+    state = 'preamble'
+
+    while True:
+        chunk = next(chunks, None)
+        eof = chunk is None
+        if not eof:
+            buf += chunk
+
+        while True:
+            if state == 'preamble':
+                index = buf.find(delimiter)
+                if index < 0:
+                    buf = buf[-len(delimiter):]
+                    break
+                buf = buf[index + len(delimiter):]
+                state = 'delimiter'
+            if state == 'delimiter':
+                if len(buf) < 2:
+                    break
+                if buf[:2] == b'--':
+                    return fields, files
+                if buf[:2] != b'\r\n':
+                    raise MultipartError('Malformed multipart delimiter.')
+                buf = buf[2:]
+                state = 'headers'
+            if state == 'headers':
+                index = buf.find(b'\r\n\r\n')
+                if index < 0:
+                    if len(buf) > MAX_HEADER_SIZE:
+                        raise MultipartError('Multipart part headers too large.')
+                    break
+                if len(fields) + len(files) >= max_parts:
+                    raise MultipartError('Too many multipart parts.', status=413)
+                part = _Part(_parse_part_headers(buf[:index]), spool_size)
+                buf = buf[index + 4:]
+                state = 'body'
+            if state == 'body':
+                index = buf.find(delimiter)
+                end = index if index >= 0 else max(len(buf) - len(delimiter) + 1, 0)
+                if end:
+                    part.write(buf[:end])
+                    buf = buf[end:]
+                    if part.file is None:
+                        memory += end
+                        if memory > max_memory:
+                            raise MultipartError('Multipart form fields too large.', status=413)
+                if index < 0:
+                    break
+                buf = buf[len(delimiter):]
+                if part.file is None:
+                    fields.append((part.name, part.data.decode(charset, 'replace')))
+                else:
+                    part.file.seek(0)
+                    files.append((part.name, FileUpload(part.file, part.name, part.filename,
+                                                        part.content_type, part.headers)))
+                part = None
+                state = 'delimiter'
+
+        if eof:
+            raise MultipartError('Unexpected end of multipart body.')
@@ -1,3 +1,6 @@
+import threading
+import uuid
+from collections import OrderedDict
 from urllib.parse import urljoin
 from typing import Callable, Dict, List, Tuple, Union, Any, get_type_hints  # type: ignore
 
@@ -6,6 +9,7 @@ from .environs import request, response
 from kobin.exceptions import HTTPError
 
 DEFAULT_ARG_TYPE = str
+_MISSING = object()
 
 
 def redirect(url):
@@ -20,49 +24,94 @@ def split_by_slash(path: str) -> List[str]:
     return stripped_path.split('/')
 
 
+def _is_url_var(segment: str) -> bool:
+    return segment.startswith('{') and segment.endswith('}')
+
+
+def _is_subclass(obj: Any, cls: type) -> bool:
+    return isinstance(obj, type) and issubclass(obj, cls)
+
+
+class Path(str):
+    """ Annotate the last url var of a rule with this type to let it match
+        the rest of the path, slashes included.
+    """
+
+
+DEFAULT_CONVERTERS = {
+    str: str,
+    int: int,
+    float: float,
+    uuid.UUID: uuid.UUID,
+    Path: Path,
+}  # type: Dict[Any, Callable[[str], Any]]
+
+
 class Route:
     """ This class wraps a route callback along with route specific metadata.
         It is also responsible for turing an URL path rule into a regular
         expression usable by the Router.
     """
     def __init__(self, rule: str, method: str, name: str,
-                 callback: Union[str, bytes]) -> None:
+                 callback: Union[str, bytes],
+                 converters: Dict[Any, Callable[[str], Any]]=None) -> None:
         self.rule = rule
         self.method = method.upper()
         self.name = name
         self.callback = callback
+        self.index = 0  # registration order, assigned by Router.add
+        self.segments = split_by_slash(rule)
+        self.url_var_names = [s.lstrip('{').rstrip('}')
+                              for s in self.segments if _is_url_var(s)]
 
-    @property
-    def callback_types(self) -> Dict[str, Any]:
-        return get_type_hints(self.callback)  # type: ignore
+        try:
+            self.callback_types = get_type_hints(callback)  # type: Dict[str, Any]
+        except TypeError:
+            self.callback_types = {}
+        if converters is None:
+            converters = DEFAULT_CONVERTERS
+        self.converters = []  # type: List[Tuple[str, Callable[[str], Any]]]
+        for var_name in self.url_var_names:
+            arg_type = self.callback_types.get(var_name, DEFAULT_ARG_TYPE)
+            self.converters.append((var_name, converters.get(arg_type, arg_type)))
+        self.catch_all = bool(self.url_var_names) and _is_url_var(self.segments[-1]) and \
+            _is_subclass(self.callback_types.get(self.url_var_names[-1]), Path)
+
+    def convert(self, values: List[str]) -> Dict[str, Any]:
+        """ Apply the converter table to url var values given in rule order.
+            A converter raises ValueError when the value is not acceptable.
+        """
+        return {name: converter(value) for (name, converter), value in zip(self.converters, values)}
 
     def get_typed_url_vars(self, url_vars: Dict[str, str]) -> Dict[str, Any]:
+        converters = dict(self.converters)
         typed_url_vars = {}  # type: Dict[str, Any]
         for k, v in url_vars.items():
-            arg_type = self.callback_types.get(k, DEFAULT_ARG_TYPE)
-            typed_url_vars[k] = arg_type(v)
+            typed_url_vars[k] = converters.get(k, DEFAULT_ARG_TYPE)(v)
         return typed_url_vars
 
     def _match_method(self, method: str) -> bool:
         return self.method == method.upper()
 
     def _match_path(self, path: str) -> Union[None, Dict[str, Any]]:
-        split_rule = split_by_slash(self.rule)
+        split_rule = self.segments
         split_path = split_by_slash(path)
-        url_vars = {}  # type: Dict[str, str]
 
+        if self.catch_all and len(split_path) >= len(split_rule):
+            rest = '/'.join(split_path[len(split_rule) - 1:])
+            split_path = split_path[:len(split_rule) - 1] + [rest]
         if len(split_rule) != len(split_path):
             return  # type: ignore
 
+        values = []  # type: List[str]
         for r, p in zip(split_rule, split_path):
-            if r.startswith('{') and r.endswith('}'):
-                url_var_key = r.lstrip('{').rstrip('}')
-                url_vars[url_var_key] = p
+            if _is_url_var(r):
+                values.append(p)
                 continue
             if r != p:
                 return  # type: ignore
         try:
-            typed_url_vars = self.get_typed_url_vars(url_vars)
+            typed_url_vars = self.convert(values)
         except ValueError:
             return  # type: ignore
         return typed_url_vars
@@ -70,31 +119,213 @@ class Route:
     def match(self, method: str, path: str) -> Dict[str, Any]:
         if not self._match_method(method):
             return None
+        return self._match_path(path)
 
-        url_vars = self._match_path(path)
-        if url_vars is not None:
-            return self.get_typed_url_vars(url_vars)
 
+def _options(allow: str) -> Callable[[], str]:
+    def options() -> str:
+        response.headers['Allow'] = allow
+        return ''
+    return options
+
+
+class _Node:
+    """ A node of the segment trie built by :class:`Router`.
+        ``children`` holds static segments, ``wildcard`` the node shared by
+        every ``{var}`` segment at this depth, ``routes`` the routes whose
+        rule ends here and ``catch_all`` the routes whose trailing
+        :class:`Path` var swallows the rest of the path, both indexed by
+        HTTP method in registration order.
+    """
+    __slots__ = ('children', 'wildcard', 'routes', 'catch_all')
 
-class Router:
     def __init__(self) -> None:
+        self.children = {}  # type: Dict[str, _Node]
+        self.wildcard = None  # type: _Node
+        self.routes = {}  # type: Dict[str, List[Route]]
+        self.catch_all = {}  # type: Dict[str, List[Route]]
+
+    def insert(self, route: Route) -> None:
+        node = self
+        segments = route.segments[:-1] if route.catch_all else route.segments
+        for segment in segments:
+            if _is_url_var(segment):
+                if node.wildcard is None:
+                    node.wildcard = _Node()
+                node = node.wildcard
+            else:
+                node = node.children.setdefault(segment, _Node())
+        index = node.catch_all if route.catch_all else node.routes
+        index.setdefault(route.method, []).append(route)
+
+    def find(self, segments: List[str], depth: int, values: List[str],
+             endpoints: List[Tuple[Dict[str, List[Route]], List[str]]]) -> None:
+        """ Collect the method index of every rule with the same shape as
+            ``segments`` together with the url var values captured on the way down.
+        """
+        if self.catch_all and depth < len(segments):
+            endpoints.append((self.catch_all, values + ['/'.join(segments[depth:])]))
+        if depth == len(segments):
+            if self.routes:
+                endpoints.append((self.routes, values))
+            return
+        segment = segments[depth]
+        child = self.children.get(segment)
+        if child is not None:
+            child.find(segments, depth + 1, values, endpoints)
+        if self.wildcard is not None:
+            self.wildcard.find(segments, depth + 1, values + [segment], endpoints)
+
+
+def _select(endpoints: List[Tuple[Dict[str, List[Route]], List[str]]],
+            method: str) -> Union[None, Tuple[Route, Dict[str, Any]]]:
+    candidates = [(route.index, route, values)
+                  for index, values in endpoints for route in index.get(method, ())]
+    if len(candidates) > 1:
+        candidates.sort(key=lambda c: c[0])
+    for _, route, values in candidates:
+        try:
+            url_vars = route.convert(values)
+        except ValueError:
+            continue
+        return route, url_vars
+    return None
+
+
+def _allowed(endpoints: List[Tuple[Dict[str, List[Route]], List[str]]]) -> Tuple[str, ...]:
+    """ The methods served for a path, given its endpoints, in alphabetical order. """
+    methods = set()
+    for index, values in endpoints:
+        for method, routes in index.items():
+            if method not in methods and any(_accepts(route, values) for route in routes):
+                methods.add(method)
+    if not methods:
+        return ()
+    if 'GET' in methods:
+        methods.add('HEAD')
+    methods.add('OPTIONS')
+    return tuple(sorted(methods))
+
+
+def _accepts(route: Route, values: List[str]) -> bool:
+    try:
+        route.convert(values)
+    except ValueError:
+        return False
+    return True
+
+
+class Router:
+    """ Rules are compiled into a segment trie when they are added, so a
+        lookup costs O(path depth) however many routes exist. When several
+        routes could serve a path, the one registered first wins.
+
+        The routes ending at each node of the trie are indexed by HTTP method.
+        A path served for other methods only raises 405 with an ``Allow``
+        header, and OPTIONS is answered with that header unless a route
+        handles it. HEAD requests are served by GET routes when no HEAD route
+        matches; the application drops their body.
+
+        With ``cache_size`` set, the results of the most recently matched
+        ``(REQUEST_METHOD, PATH_INFO)`` pairs are kept in a LRU cache which is
+        cleared whenever a route is added. 404 and 405 results are cached only
+        when ``cache_not_found`` is set, so scanners can't evict hot entries.
+    """
+    def __init__(self, cache_size: int=0, cache_not_found: bool=False) -> None:
         self.routes = []  # type: List['Route']
+        self.tree = _Node()
+        self.converters = dict(DEFAULT_CONVERTERS)
+        self.cache_size = cache_size
+        self.cache_not_found = cache_not_found
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self._cache = OrderedDict()  # type: OrderedDict
+        self._cache_lock = threading.Lock()
+
+    def add_converter(self, arg_type: Any, converter: Callable[[str], Any]) -> None:
+        """ Convert url vars annotated with ``arg_type`` using ``converter``
+            in routes added from now on. The converter receives the raw
+            string and raises ValueError to reject it.
+        """
+        self.converters[arg_type] = converter
 
-    def match(self, environ: Dict[str, str]) \
+    def _lookup(self, method: str, path: str) -> Tuple[Union[None, Route], Any]:
+        """ ``(route, url_vars)`` of the route serving the request, otherwise
+            ``(None, allowed)`` with the methods served for ``path``, if any.
+        """
+        endpoints = []  # type: List[Tuple[Dict[str, List[Route]], List[str]]]
+        self.tree.find(split_by_slash(path), 0, [], endpoints)
+        result = _select(endpoints, method)
+        if result is None and method == 'HEAD':
+            result = _select(endpoints, 'GET')
+        if result is not None:
+            return result
+        return None, _allowed(endpoints)
+
+    def match(self, environ: Dict[str, Any]) \
             -> Tuple[Callable[..., Union[str, bytes]], Dict[str, Any]]:
+        """ Find the callback and typed url vars for the request described by
+            ``environ``. The matched :class:`Route` is stored as ``environ['kobin.route']``.
+        """
         method = environ['REQUEST_METHOD'].upper()
         path = environ['PATH_INFO'] or '/'
 
-        for route in self.routes:
-            url_vars = route.match(method, path)
-            if url_vars is not None:
-                return route.callback, url_vars  # type: ignore
-        raise HTTPError(status=404, body='Not found: {}'.format(request.path))
+        if not self.cache_size:
+            result = self._lookup(method, path)
+        else:
+            key = (method, path)
+            with self._cache_lock:
+                result = self._cache.get(key, _MISSING)
+                if result is _MISSING:
+                    self.cache_misses += 1
+                else:
+                    self._cache.move_to_end(key)
+                    self.cache_hits += 1
+            if result is _MISSING:
+                result = self._lookup(method, path)
+                if result[0] is not None or self.cache_not_found:
+                    self._cache_put(key, result)
+            if result[0] is not None:
+                route, url_vars = result
+                environ['kobin.route'] = route
+                return route.callback, dict(url_vars)
+
+        route, url_vars = result
+        if route is not None:
+            environ['kobin.route'] = route
+            return route.callback, url_vars
+        allowed = url_vars
+        if not allowed:
+            raise HTTPError.for_path(404, '/' + path.lstrip('/'))
+        allow = ', '.join(allowed)
+        if method == 'OPTIONS':
+            return _options(allow), {}
+        error = HTTPError.for_path(405, '/' + path.lstrip('/'))
+        error.headers['Allow'] = allow
+        raise error
+
+    def _cache_put(self, key: Tuple[str, str], result: Any) -> None:
+        with self._cache_lock:
+            self._cache[key] = result
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def cache_clear(self) -> None:
+        with self._cache_lock:
+            self._cache.clear()
+
+    def cache_info(self) -> Dict[str, int]:
+        return {'hits': self.cache_hits, 'misses': self.cache_misses,
+                'maxsize': self.cache_size, 'currsize': len(self._cache)}
 
     def add(self, method: str, rule: str, name: str, callback: Union[str, bytes]) -> None:
         """ Add a new rule or replace the target for an existing rule. """
-        route = Route(method=method.upper(), rule=rule, name=name, callback=callback)
+        route = Route(method=method.upper(), rule=rule, name=name, callback=callback,
+                      converters=self.converters)
+        route.index = len(self.routes)
         self.routes.append(route)
+        self.tree.insert(route)
+        self.cache_clear()
 
     def reverse(self, name, **kwargs) -> str:
         for route in self.routes:
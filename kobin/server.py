@@ -0,0 +1,618 @@
+""" A pre-forking, multi-threaded HTTP/1.1 server for WSGI applications.
+
+The master process binds one listening socket and forks worker processes
+that inherit it, so a single box can use all its cores. Each worker
+accepts connections on the shared socket and serves them from a bounded
+thread pool, keeping HTTP/1.1 connections alive between requests. An
+idle keep-alive connection doesn't hold a thread: it is watched by a
+selector and handed back to the pool when its next request arrives.
+
+Signals sent to the master:
+
+* ``SIGHUP``: reload. The master re-executes its own command line so that
+  the application is imported again, then starts a new set of workers
+  from the new code and gracefully stops the old ones.
+* ``SIGTERM``/``SIGINT``: gracefully stop the workers and exit.
+
+A worker stopped gracefully stops accepting connections and finishes the
+requests in flight within ``graceful_timeout`` seconds.
+"""
+import io
+import os
+import selectors
+import signal
+import socket
+import socketserver
+import sys
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler
+from typing import Any, Callable, Dict, List, Sequence, Tuple
+from urllib.parse import unquote
+
+BUFFER_SIZE = 64 * 1024
+LISTEN_FD_ENV = 'KOBIN_LISTEN_FD'
+WORKER_PIDS_ENV = 'KOBIN_WORKER_PIDS'
+
+
+class FileWrapper:
+    """ ``wsgi.file_wrapper`` which lets the server send real files with sendfile. """
+    def __init__(self, filelike, block_size: int=BUFFER_SIZE) -> None:
+        self.filelike = filelike
+        self.block_size = block_size
+
+    def __iter__(self):
+        while True:
+            data = self.filelike.read(self.block_size)
+            if not data:
+                break
+            yield data
+
+    def close(self) -> None:
+        close = getattr(self.filelike, 'close', None)
+        if close is not None:
+            close()
+
+
+class _Input(io.RawIOBase):
+    """ ``wsgi.input`` which never reads past the body of the current request,
+        so the next request of a keep-alive connection stays intact.
+    """
+    def __init__(self, rfile, length: int) -> None:
+        self.rfile = rfile
+        self.remaining = length
+
+    def readable(self) -> bool:
+        return True
+
+    def read(self, size: int=-1) -> bytes:
+        if size is None or size < 0 or size > self.remaining:
+            size = self.remaining
+        if size == 0:
+            return b''
+        data = self.rfile.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def readinto(self, buffer) -> int:
+        data = self.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+    def readline(self, size: int=-1) -> bytes:
+        if size is None or size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.rfile.readline(size)
+        self.remaining -= len(data)
+        return data
+
+    def drain(self) -> None:
+        while self.remaining > 0 and self.read(BUFFER_SIZE):
+            pass
+
+
+class WSGIRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    server_version = 'kobin'
+
+    def __init__(self, request, client_address, server) -> None:
+        # Unlike BaseRequestHandler, the connection isn't served here: the
+        # server calls handle() each time the connection becomes readable.
+        self.request = request
+        self.client_address = client_address
+        self.server = server
+        self.close_connection = False
+        self.setup()
+
+    def setup(self) -> None:
+        self.timeout = self.server.keepalive_timeout
+        super().setup()
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def handle(self) -> None:
+        """ Serve the requests waiting on the connection, then return so that
+            the connection can be parked until the next one arrives.
+        """
+        while True:
+            self.close_connection = True
+            self.handle_one_request()
+            if self.close_connection or not self._pending():
+                return
+
+    def _pending(self) -> bool:
+        """ Whether the client already sent more data, which may sit in the
+            buffer of ``rfile`` where a selector can't see it.
+        """
+        self.connection.setblocking(False)
+        try:
+            return bool(self.rfile.peek(1))
+        except OSError:
+            return False
+        finally:
+            self.connection.settimeout(self.timeout)
+
+    def handle_one_request(self) -> None:
+        try:
+            self.raw_requestline = self.rfile.readline(65537)
+        except (socket.timeout, ConnectionError):
+            self.close_connection = True
+            return
+        if len(self.raw_requestline) > 65536:
+            self.send_error(414)
+            return
+        if not self.raw_requestline:
+            self.close_connection = True
+            return
+        if not self.parse_request():
+            return
+        if 'chunked' in self.headers.get('Transfer-Encoding', '').lower():
+            self.send_error(411)
+            return
+        if self.server.stopping:
+            self.close_connection = True
+        self.run_wsgi()
+
+    def make_environ(self) -> Dict[str, Any]:
+        path, _, query = self.path.partition('?')
+        server_name, server_port = self.server.server_address[:2]
+        environ = {
+            'REQUEST_METHOD': self.command,
+            'SCRIPT_NAME': '',
+            'PATH_INFO': unquote(path, 'latin1'),
+            'QUERY_STRING': query,
+            'SERVER_NAME': str(server_name),
+            'SERVER_PORT': str(server_port),
+            'SERVER_PROTOCOL': self.request_version,
+            'REMOTE_ADDR': self.client_address[0] if self.client_address else '',
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': 'http',
+            'wsgi.errors': sys.stderr,
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': self.server.multiprocess,
+            'wsgi.run_once': False,
+            'wsgi.file_wrapper': FileWrapper,
+        }  # type: Dict[str, Any]
+        for name, value in self.headers.items():
+            key = name.upper().replace('-', '_')
+            if key not in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+                key = 'HTTP_' + key
+            if key in environ:
+                value = environ[key] + ',' + value
+            environ[key] = value
+        environ['wsgi.input'] = _Input(self.rfile, int(environ.get('CONTENT_LENGTH') or 0))
+        return environ
+
+    def run_wsgi(self) -> None:
+        environ = self.make_environ()
+        state = {}  # type: Dict[str, Any]
+
+        def start_response(status: str, headers: List[Tuple[str, str]], exc_info=None):
+            if exc_info and state.get('sent'):
+                raise exc_info[1].with_traceback(exc_info[2])
+            state['status'] = status
+            state['headers'] = headers
+            return write
+
+        def write(data: bytes) -> None:
+            if not state.get('sent'):
+                self._send_headers(state, environ, None)
+            self._write_body(state, data)
+
+        try:
+            result = self.server.app(environ, start_response)
+            try:
+                self._send_result(state, environ, result)
+            finally:
+                close = getattr(result, 'close', None)
+                if close is not None:
+                    close()
+        except (ConnectionError, socket.timeout):
+            self.close_connection = True
+            return
+        except Exception:
+            self.close_connection = True
+            if not state.get('sent'):
+                self.send_error(500)
+            raise
+        environ['wsgi.input'].drain()
+
+    def _send_result(self, state: Dict[str, Any], environ: Dict[str, Any], result) -> None:
+        if isinstance(result, (list, tuple)) and len(result) <= 1:
+            body = result[0] if result else b''
+            if not state.get('sent'):
+                self._send_headers(state, environ, len(body))
+            self._write_body(state, body)
+        elif isinstance(result, FileWrapper) and hasattr(result.filelike, 'fileno') and not state.get('sent'):
+            self._send_headers(state, environ, None)
+            if state['chunked'] or self.command == 'HEAD':
+                for data in result:
+                    self._write_body(state, data)
+            else:
+                self.wfile.flush()
+                self.connection.sendfile(result.filelike, result.filelike.tell())
+        else:
+            for data in result:
+                if not state.get('sent'):
+                    self._send_headers(state, environ, None)
+                self._write_body(state, data)
+            if not state.get('sent'):
+                self._send_headers(state, environ, 0)
+        if state.get('chunked'):
+            self.wfile.write(b'0\r\n\r\n')
+        self.wfile.flush()
+
+    def _send_headers(self, state: Dict[str, Any], environ: Dict[str, Any], length: int) -> None:
+        if 'status' not in state:
+            raise RuntimeError('start_response() was not called.')
+        code, _, reason = state['status'].partition(' ')
+        names = {name.lower() for name, _ in state['headers']}
+        self.send_response_only(int(code), reason)
+        for name, value in state['headers']:
+            self.send_header(name, value)
+        state['chunked'] = False
+        bodyless = self.command == 'HEAD' or int(code) in (204, 304) or int(code) < 200
+        if 'content-length' not in names and not bodyless:
+            if length is not None:
+                self.send_header('Content-Length', str(length))
+            elif self.request_version == 'HTTP/1.1':
+                self.send_header('Transfer-Encoding', 'chunked')
+                state['chunked'] = True
+            else:
+                self.close_connection = True
+        if 'date' not in names:
+            self.send_header('Date', self.date_time_string())
+        if self.close_connection:
+            self.send_header('Connection', 'close')
+        elif self.request_version != 'HTTP/1.1':
+            self.send_header('Connection', 'keep-alive')
+        self.end_headers()
+        state['sent'] = True
+        state['head'] = self.command == 'HEAD'
+
+    def _write_body(self, state: Dict[str, Any], data: bytes) -> None:
+        if not data or state['head']:
+            return
+        if state['chunked']:
+            self.wfile.write(b'%x\r\n' % len(data) + data + b'\r\n')
+        else:
+            self.wfile.write(data)
+
+    def log_message(self, format: str, *args) -> None:
+        if self.server.access_log:
+            super().log_message(format, *args)
+
+
+class _Connection:
+    __slots__ = ('request', 'client_address', 'handler', 'deadline')
+
+    def __init__(self, request: socket.socket, client_address: Any) -> None:
+        self.request = request
+        self.client_address = client_address
+        self.handler = None  # type: WSGIRequestHandler
+        self.deadline = 0.0
+
+
+class WorkerServer(socketserver.TCPServer):
+    """ Serves an already listening socket with a pool of ``threads`` threads.
+        Connections waiting for a request are parked in a selector and
+        dispatched to the pool only once readable, so idle keep-alive clients
+        never hold a thread. A connection left idle for ``keepalive_timeout``
+        seconds is closed.
+    """
+    def __init__(self, sock: socket.socket, app: Callable, threads: int=8,
+                 keepalive_timeout: float=5, access_log: bool=False, multiprocess: bool=False) -> None:
+        socketserver.BaseServer.__init__(self, sock.getsockname(), WSGIRequestHandler)
+        self.socket = sock
+        self.app = app
+        self.keepalive_timeout = keepalive_timeout
+        self.access_log = access_log
+        self.multiprocess = multiprocess
+        self.stopping = False
+        self.executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='kobin-worker')
+        self._active = 0
+        self._idle = threading.Condition()
+        self._lock = threading.Lock()
+        self._polling = False
+        self._parking = []  # type: List[_Connection]
+        self._waker, self._wakeup = socket.socketpair()
+        self._waker.setblocking(False)
+
+    def serve_forever(self, poll_interval: float=0.5) -> None:
+        self._polling = True
+        poller = threading.Thread(target=self._poll, name='kobin-poller', daemon=True)
+        poller.start()
+        try:
+            super().serve_forever(poll_interval)
+        finally:
+            with self._lock:
+                self._polling = False
+            self._wake()
+            poller.join()
+
+    def process_request(self, request, client_address) -> None:
+        self._park(_Connection(request, client_address))
+
+    def _park(self, conn: _Connection) -> None:
+        conn.deadline = time.monotonic() + self.keepalive_timeout
+        with self._lock:
+            polling = self._polling
+            if polling:
+                self._parking.append(conn)
+        if polling:
+            self._wake()
+        else:
+            self._close(conn)
+
+    def _wake(self) -> None:
+        try:
+            self._wakeup.send(b'\0')
+        except OSError:
+            pass
+
+    def _poll(self) -> None:
+        selector = selectors.DefaultSelector()
+        selector.register(self._waker, selectors.EVENT_READ)
+        # Connections are parked with the same timeout, so the oldest comes first.
+        parked = OrderedDict()  # type: OrderedDict
+        parking = []  # type: List[_Connection]
+        try:
+            while True:
+                with self._lock:
+                    if not self._polling:
+                        break
+                    parking, self._parking = self._parking, []
+                for conn in parking:
+                    selector.register(conn.request, selectors.EVENT_READ, conn)
+                    parked[conn.request] = conn
+                parking = []
+                timeout = None
+                if parked:
+                    timeout = max(next(iter(parked.values())).deadline - time.monotonic(), 0)
+                for key, _ in selector.select(timeout):
+                    if key.data is None:
+                        try:
+                            self._waker.recv(BUFFER_SIZE)
+                        except BlockingIOError:
+                            pass
+                        continue
+                    selector.unregister(key.fileobj)
+                    del parked[key.fileobj]
+                    self._dispatch(key.data)
+                now = time.monotonic()
+                while parked:
+                    sock, conn = next(iter(parked.items()))
+                    if conn.deadline > now:
+                        break
+                    selector.unregister(sock)
+                    del parked[sock]
+                    self._close(conn)
+        finally:
+            with self._lock:
+                self._polling = False
+                parking += self._parking
+                self._parking = []
+            for conn in list(parked.values()) + parking:
+                self._close(conn)
+            selector.close()
+
+    def _dispatch(self, conn: _Connection) -> None:
+        with self._idle:
+            self._active += 1
+        self.executor.submit(self._serve, conn)
+
+    def _serve(self, conn: _Connection) -> None:
+        keep = False
+        try:
+            if conn.handler is None:
+                conn.handler = self.RequestHandlerClass(conn.request, conn.client_address, self)
+            conn.handler.handle()
+            keep = not (conn.handler.close_connection or self.stopping)
+        except Exception:
+            self.handle_error(conn.request, conn.client_address)
+        finally:
+            if keep:
+                self._park(conn)
+            else:
+                self._close(conn)
+            with self._idle:
+                self._active -= 1
+                self._idle.notify_all()
+
+    def _close(self, conn: _Connection) -> None:
+        if conn.handler is not None:
+            try:
+                conn.handler.finish()
+            except OSError:
+                pass
+        self.shutdown_request(conn.request)
+
+    def stop(self) -> None:
+        """ Stop accepting connections. Must not be called from the thread
+            running :meth:`serve_forever`. """
+        self.stopping = True
+        self.shutdown()
+
+    def drain(self, timeout: float) -> bool:
+        """ Wait up to ``timeout`` seconds for the connections in flight. """
+        with self._idle:
+            finished = self._idle.wait_for(lambda: self._active == 0, timeout)
+        self.executor.shutdown(wait=False)
+        self._waker.close()
+        self._wakeup.close()
+        return finished
+
+    def server_close(self) -> None:
+        pass  # the listening socket is shared with the other workers
+
+
+def create_socket(host: str, port: int, backlog: int=2048) -> socket.socket:
+    family = socket.AF_INET6 if ':' in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    if hasattr(socket, 'SO_REUSEPORT'):
+        try:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        except OSError:
+            pass
+    sock.bind((host, port))
+    sock.listen(backlog)
+    return sock
+
+
+def _run_worker(sock: socket.socket, app: Callable, threads: int, keepalive_timeout: float,
+                graceful_timeout: float, access_log: bool, multiprocess: bool) -> None:
+    server = WorkerServer(sock, app, threads, keepalive_timeout, access_log, multiprocess)
+
+    def stop(signum, frame):
+        threading.Thread(target=server.stop, daemon=True).start()
+
+    if threading.current_thread() is threading.main_thread():
+        signal.signal(signal.SIGTERM, stop)
+        signal.signal(signal.SIGINT, stop)
+        if hasattr(signal, 'SIGHUP'):
+            signal.signal(signal.SIGHUP, signal.SIG_IGN)
+    try:
+        server.serve_forever(poll_interval=0.5)
+    finally:
+        server.drain(graceful_timeout)
+
+
+class Arbiter:
+    """ The master process: forks the workers, replaces the ones that die
+        and handles the signals described in :mod:`kobin.server`.
+    """
+    def __init__(self, app: Callable, sock: socket.socket, workers: int, threads: int,
+                 keepalive_timeout: float, graceful_timeout: float, access_log: bool,
+                 inherited: Sequence[int]=()) -> None:
+        self.app = app
+        self.sock = sock
+        self.workers = workers
+        self.threads = threads
+        self.keepalive_timeout = keepalive_timeout
+        self.graceful_timeout = graceful_timeout
+        self.access_log = access_log
+        self.pids = set()  # type: set
+        self.retiring = {}  # type: Dict[int, float]
+        self.signals = []  # type: List[int]
+        self.inherited = list(inherited)
+
+    def spawn(self) -> None:
+        pid = os.fork()
+        if pid:
+            self.pids.add(pid)
+            return
+        try:
+            _run_worker(self.sock, self.app, self.threads, self.keepalive_timeout,
+                        self.graceful_timeout, self.access_log, True)
+            code = 0
+        except BaseException:
+            import traceback
+            traceback.print_exc()
+            code = 1
+        finally:
+            sys.stdout.flush()
+            sys.stderr.flush()
+        os._exit(code)
+
+    def retire(self, pids) -> None:
+        for pid in pids:
+            self.pids.discard(pid)
+            self.retiring[pid] = time.monotonic() + self.graceful_timeout
+            self._kill(pid, signal.SIGTERM)
+
+    def reexec(self) -> None:
+        """ Replace the master with a fresh interpreter running the same
+            command line, so that the application is imported again. The
+            listening socket and the pids of the current workers are handed
+            over through the environment; the new master retires these
+            workers once it started its own.
+        """
+        argv = getattr(sys, 'orig_argv', None) or [sys.executable] + sys.argv
+        env = dict(os.environ)
+        env[LISTEN_FD_ENV] = str(self.sock.fileno())
+        env[WORKER_PIDS_ENV] = ','.join(str(pid) for pid in list(self.pids) + list(self.retiring))
+        self.sock.set_inheritable(True)
+        sys.stdout.flush()
+        sys.stderr.flush()
+        try:
+            os.execve(sys.executable, argv, env)
+        except OSError:
+            import traceback
+            traceback.print_exc()
+            self.sock.set_inheritable(False)
+
+    def _kill(self, pid: int, sig: int) -> None:
+        try:
+            os.kill(pid, sig)
+        except ProcessLookupError:
+            pass
+
+    def reap(self) -> None:
+        while True:
+            try:
+                pid, _ = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if not pid:
+                return
+            self.pids.discard(pid)
+            self.retiring.pop(pid, None)
+
+    def run(self) -> None:
+        for sig in (signal.SIGTERM, signal.SIGINT, signal.SIGHUP):
+            signal.signal(sig, lambda signum, frame: self.signals.append(signum))
+        stopping = False
+        if self.inherited:
+            while len(self.pids) < self.workers:
+                self.spawn()
+            self.retire(self.inherited)
+        while True:
+            self.reap()
+            while self.signals:
+                signum = self.signals.pop(0)
+                if signum == signal.SIGHUP and not stopping:
+                    self.reexec()
+                elif signum in (signal.SIGTERM, signal.SIGINT):
+                    stopping = True
+                    self.retire(list(self.pids))
+            now = time.monotonic()
+            for pid, deadline in list(self.retiring.items()):
+                if now > deadline:
+                    self._kill(pid, signal.SIGKILL)
+            if stopping:
+                if not self.retiring:
+                    break
+            else:
+                while len(self.pids) < self.workers:
+                    self.spawn()
+            time.sleep(0.1)
+        self.sock.close()
+
+
+def serve(app: Callable, host: str='127.0.0.1', port: int=8080, workers: int=1, threads: int=8,
+          keepalive_timeout: float=5, graceful_timeout: float=30, access_log: bool=False) -> None:
+    """ Serve ``app`` with ``workers`` processes of ``threads`` threads each.
+        With ``workers=0``, or where fork is not available, requests are
+        served by the current process.
+
+        When started by the ``SIGHUP`` reload of a master, the listening
+        socket and the workers to retire are taken from the environment.
+    """
+    fd = os.environ.pop(LISTEN_FD_ENV, None)
+    if fd is None:
+        sock = create_socket(host, port)
+    else:
+        sock = socket.socket(fileno=int(fd))
+        sock.set_inheritable(False)
+    inherited = [int(pid) for pid in os.environ.pop(WORKER_PIDS_ENV, '').split(',') if pid]
+    print('Kobin is listening on http://{}:{}/ ({} workers, {} threads each)'.format(
+        host, sock.getsockname()[1], workers, threads), file=sys.stderr)
+    if workers <= 0 or not hasattr(os, 'fork'):
+        try:
+            _run_worker(sock, app, threads, keepalive_timeout, graceful_timeout, access_log, False)
+        finally:
+            sock.close()
+        return
+    Arbiter(app, sock, workers, threads, keepalive_timeout, graceful_timeout, access_log, inherited).run()
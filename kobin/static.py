@@ -0,0 +1,235 @@
+import mimetypes
+import os
+import stat
+import time
+from email.utils import formatdate
+from typing import Any, Dict, Iterator, List, Tuple, Union
+
+from .compression import negotiate
+from .conditional import is_not_modified
+
+# Precompressed siblings looked up next to every file, in order of preference.
+PRECOMPRESSED = (('br', '.br'), ('gzip', '.gz'))
+_UNSATISFIABLE = (-1, -1)
+
+
+class StaticFile:
+    """ A file found in ``STATICFILES_DIRS``, with the headers derived from its stat. """
+    __slots__ = ('path', 'size', 'mtime', 'content_type', 'etag', 'last_modified', 'encodings')
+
+    def __init__(self, path: str, st: os.stat_result, encodings: Dict[str, Tuple[str, int]]) -> None:
+        self.path = path
+        self.size = st.st_size
+        self.mtime = st.st_mtime_ns
+        content_type, _ = mimetypes.guess_type(path)
+        content_type = content_type or 'application/octet-stream'
+        if content_type.startswith('text/') or content_type == 'application/javascript':
+            content_type += '; charset=UTF-8'
+        self.content_type = content_type
+        self.etag = '"{:x}-{:x}"'.format(st.st_mtime_ns, st.st_size)
+        self.last_modified = formatdate(st.st_mtime, usegmt=True)
+        self.encodings = encodings
+
+
+def safe_join(directory: str, path: str) -> Union[None, str]:
+    """ Join a slash separated url ``path`` to ``directory``, or return None
+        when one of its segments could leave the directory.
+    """
+    parts = []  # type: List[str]
+    for part in path.split('/'):
+        if not part or part == '.':
+            continue
+        if part == '..' or '\0' in part or os.sep in part or (os.altsep and os.altsep in part) \
+                or os.path.splitdrive(part)[0]:
+            return None
+        parts.append(part)
+    if not parts:
+        return None
+    return os.path.join(directory, *parts)
+
+
+def parse_range(header: str, size: int) -> Union[None, Tuple[int, int]]:
+    """ The first and last byte of a single ``Range: bytes=...`` header.
+        Returns None when the header should be ignored and ``_UNSATISFIABLE``
+        when no byte of the file is in the range.
+    """
+    unit, _, spec = header.partition('=')
+    if unit.strip().lower() != 'bytes' or ',' in spec:
+        return None
+    first, sep, last = spec.strip().partition('-')
+    if not sep:
+        return None
+    try:
+        if not first:
+            suffix = int(last)
+            if suffix <= 0 or size == 0:
+                return _UNSATISFIABLE
+            return max(size - suffix, 0), size - 1
+        start = int(first)
+        end = int(last) if last else size - 1
+    except ValueError:
+        return None
+    if end < start:
+        return None if last else _UNSATISFIABLE
+    if start >= size:
+        return _UNSATISFIABLE
+    return start, min(end, size - 1)
+
+
+def _iter_range(f, length: int, chunk_size: int=64 * 1024) -> Iterator[bytes]:
+    try:
+        while length > 0:
+            chunk = f.read(min(chunk_size, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+    finally:
+        f.close()
+
+
+class StaticFiles:
+    """ Serve the files of ``directories`` under the url prefix ``root``.
+        Path resolution and stat results are cached for ``cache_ttl``
+        seconds, so a hot asset costs no filesystem lookup until then.
+        Whole files are returned as file objects, which servers send with
+        ``wsgi.file_wrapper``/sendfile. Single byte ranges, ETag and
+        Last-Modified validation and precompressed ``.br``/``.gz`` siblings
+        are supported.
+    """
+    def __init__(self, directories: List[str], root: str='/static/', cache_ttl: float=2,
+                 cache_size: int=4096, cache_control: str=None) -> None:
+        self.directories = [os.path.abspath(d) for d in directories]
+        self.root = '/' + root.strip('/') + '/'
+        self.cache_ttl = cache_ttl
+        self.cache_size = cache_size
+        self.cache_control = cache_control
+        self._cache = {}  # type: Dict[str, Tuple[float, Union[None, StaticFile]]]
+
+    def find(self, path: str) -> Union[None, StaticFile]:
+        """ The file for ``path``, relative to the static root. Misses are cached too. """
+        now = time.monotonic()
+        cached = self._cache.get(path)
+        if cached is not None and now - cached[0] < self.cache_ttl:
+            return cached[1]
+        found = self._find(path)
+        if len(self._cache) >= self.cache_size:
+            self._cache.clear()
+        self._cache[path] = (now, found)
+        return found
+
+    def _find(self, path: str) -> Union[None, StaticFile]:
+        for directory in self.directories:
+            filename = safe_join(directory, path)
+            if filename is None:
+                return None
+            try:
+                st = os.stat(filename)
+            except OSError:
+                continue
+            if not stat.S_ISREG(st.st_mode):
+                continue
+            encodings = {}  # type: Dict[str, Tuple[str, int]]
+            for encoding, suffix in PRECOMPRESSED:
+                try:
+                    sibling = os.stat(filename + suffix)
+                except OSError:
+                    continue
+                if stat.S_ISREG(sibling.st_mode) and sibling.st_mtime >= st.st_mtime:
+                    encodings[encoding] = (filename + suffix, sibling.st_size)
+            return StaticFile(filename, st, encodings)
+        return None
+
+    def serve(self, environ: Dict[str, Any], response: Any) -> Any:
+        """ The output for a static file request, after setting the status and
+            headers of ``response``. None when the request is not for an
+            existing static file, so that it falls through to the router.
+        """
+        path = environ.get('PATH_INFO') or '/'
+        if not path.startswith(self.root):
+            return None
+        method = environ.get('REQUEST_METHOD', 'GET').upper()
+        if method not in ('GET', 'HEAD'):
+            return None
+        relative = path[len(self.root):]
+        static_file = self.find(relative)
+        if static_file is None:
+            return None
+
+        filename, size, etag = static_file.path, static_file.size, static_file.etag
+        range_header = environ.get('HTTP_RANGE')
+        encoding = None
+        if static_file.encodings and range_header is None:
+            encoding = negotiate(environ.get('HTTP_ACCEPT_ENCODING', ''), list(static_file.encodings))
+            if encoding is not None:
+                filename, size = static_file.encodings[encoding]
+                etag = '{}-{}"'.format(etag[:-1], encoding)
+
+        f = None
+        not_modified = is_not_modified(environ, etag, static_file.last_modified)
+        if method == 'GET' and not not_modified:
+            try:
+                f = open(filename, 'rb')
+            except OSError:
+                self._cache.pop(relative, None)
+                return None
+            st = os.fstat(f.fileno())
+            if st.st_size != size or (encoding is None and st.st_mtime_ns != static_file.mtime):
+                # Changed since it was cached: start over with a fresh stat.
+                f.close()
+                self._cache.pop(relative, None)
+                return self.serve(environ, response)
+
+        headers = response.headers
+        headers['ETag'] = etag
+        headers['Last-Modified'] = static_file.last_modified
+        headers['Accept-Ranges'] = 'bytes'
+        if static_file.encodings:
+            headers['Vary'] = 'Accept-Encoding'
+        if self.cache_control:
+            headers['Cache-Control'] = self.cache_control
+        if not_modified:
+            response.status = 304
+            return b''
+        headers['Content-Type'] = static_file.content_type
+        if encoding is not None:
+            headers['Content-Encoding'] = encoding
+
+        byte_range = None
+        if range_header is not None:
+            if_range = environ.get('HTTP_IF_RANGE')
+            if if_range is None or if_range in (etag, static_file.last_modified):
+                byte_range = parse_range(range_header, size)
+        if byte_range == _UNSATISFIABLE:
+            if f is not None:
+                f.close()
+            response.status = 416
+            headers['Content-Range'] = 'bytes */{}'.format(size)
+            headers['Content-Length'] = '0'
+            return b''
+        if byte_range is not None:
+            start, end = byte_range
+            response.status = 206
+            headers['Content-Range'] = 'bytes {}-{}/{}'.format(start, end, size)
+            headers['Content-Length'] = str(end - start + 1)
+        else:
+            headers['Content-Length'] = str(size)
+        if f is None:
+            return b''
+        if byte_range is not None:
+            f.seek(start)
+            return _iter_range(f, end - start + 1)
+        return f
+
+
+def create_static_files(config: Dict[str, Any]) -> Union[None, StaticFiles]:
+    """ The :class:`StaticFiles` of an application, configured by ``STATIC_ROOT``,
+        ``STATICFILES_DIRS`` and ``STATIC_CACHE_*``. None when ``STATIC_ROOT``
+        or ``STATICFILES_DIRS`` is empty.
+    """
+    if not config.get('STATIC_ROOT') or not config.get('STATICFILES_DIRS'):
+        return None
+    return StaticFiles(config['STATICFILES_DIRS'], config['STATIC_ROOT'],
+                       cache_ttl=config.get('STATIC_CACHE_TTL', 2),
+                       cache_size=config.get('STATIC_CACHE_SIZE', 4096),
+                       cache_control=config.get('STATIC_CACHE_CONTROL'))
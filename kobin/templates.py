@@ -1,8 +1,133 @@
-from jinja2 import Environment, FileSystemLoader  # type: ignore
+import argparse
+import importlib
+import os
+import sys
+from time import perf_counter
+from typing import Any, Dict, Iterator, List
+from jinja2 import (  # type: ignore
+    ChoiceLoader, Environment, FileSystemLoader, FileSystemBytecodeCache, ModuleLoader
+)
+
+from .environs import _context
+
+
+def create_environment(config: Dict[str, Any]) -> Environment:
+    """ Build the Jinja2 environment used by an application.
+        Compiled templates are kept in memory (``TEMPLATE_CACHE_SIZE``) and,
+        when ``TEMPLATE_BYTECODE_CACHE_DIR`` is set, in a bytecode cache on disk.
+        Templates are only checked for changes with ``TEMPLATE_AUTO_RELOAD``.
+        Modules written by :func:`compile_templates` into ``TEMPLATE_MODULE_DIR``
+        are loaded before the template sources.
+    """
+    bytecode_cache = None
+    bytecode_cache_dir = config.get('TEMPLATE_BYTECODE_CACHE_DIR')
+    if bytecode_cache_dir:
+        os.makedirs(bytecode_cache_dir, exist_ok=True)
+        bytecode_cache = FileSystemBytecodeCache(bytecode_cache_dir)
+    loader = FileSystemLoader(config['TEMPLATE_DIRS'])
+    if config.get('TEMPLATE_MODULE_DIR'):
+        loader = ChoiceLoader([ModuleLoader(config['TEMPLATE_MODULE_DIR']), loader])
+    return Environment(
+        loader=loader,
+        cache_size=config.get('TEMPLATE_CACHE_SIZE', 400),
+        auto_reload=config.get('TEMPLATE_AUTO_RELOAD', False),
+        bytecode_cache=bytecode_cache,
+    )
+
+
+def list_templates(config: Dict[str, Any]) -> List[str]:
+    """ Names of every template found in ``TEMPLATE_DIRS``. """
+    return FileSystemLoader(config['TEMPLATE_DIRS']).list_templates()
+
+
+def compile_templates(config: Dict[str, Any], target: str) -> Dict[str, float]:
+    """ Compile every template into python modules under ``target``, which
+        can be loaded by setting ``TEMPLATE_MODULE_DIR``.
+        Returns the compilation time of each template in seconds.
+    """
+    env = create_environment(dict(config, TEMPLATE_MODULE_DIR=None, TEMPLATE_BYTECODE_CACHE_DIR=None))
+    os.makedirs(target, exist_ok=True)
+    timings = {}  # type: Dict[str, float]
+    for name in list_templates(config):
+        start = perf_counter()
+        source, filename, _ = env.loader.get_source(env, name)
+        code = env.compile(source, name, filename, raw=True, defer_init=True)
+        with open(os.path.join(target, ModuleLoader.get_module_filename(name)), 'w', encoding='utf-8') as f:
+            f.write(code)
+        timings[name] = perf_counter() - start
+    return timings
+
+
+def warmup_templates(env: Environment, config: Dict[str, Any]) -> Dict[str, float]:
+    """ Load every template into the in-memory cache of ``env``.
+        Returns the loading time of each template in seconds.
+    """
+    timings = {}  # type: Dict[str, float]
+    for name in list_templates(config):
+        start = perf_counter()
+        env.get_template(name)
+        timings[name] = perf_counter() - start
+    return timings
 
 
 def render_template(template_name: str, **kwargs) -> str:
     """ Get a rendered template as string iterator. """
-    from . import current_config  # type: ignore
-    env = Environment(loader=FileSystemLoader(current_config()['TEMPLATE_DIRS']))  # type: ignore
-    return env.get_template(template_name).render(**kwargs)
+    from . import current_app  # type: ignore
+    env = current_app().template_env
+    context = _context.get(None)
+    timings = context.request.get('kobin.timings') if context is not None else None
+    if timings is None:
+        return env.get_template(template_name).render(**kwargs)
+    start = perf_counter()
+    try:
+        return env.get_template(template_name).render(**kwargs)
+    finally:
+        timings.template += perf_counter() - start
+
+
+def stream_template(template_name: str, buffer_size: int=None, **kwargs) -> Iterator[str]:
+    """ Get a rendered template as string iterator, produced while the
+        template is being rendered. With ``buffer_size``, tiny chunks are
+        joined until they reach about that many characters.
+    """
+    from . import current_app  # type: ignore
+    env = current_app().template_env
+    chunks = env.get_template(template_name).generate(**kwargs)
+    if buffer_size:
+        return _coalesce(chunks, buffer_size)
+    return chunks
+
+
+def _coalesce(chunks: Iterator[str], buffer_size: int) -> Iterator[str]:
+    buf = []  # type: List[str]
+    size = 0
+    for chunk in chunks:
+        buf.append(chunk)
+        size += len(chunk)
+        if size >= buffer_size:
+            yield ''.join(buf)
+            buf = []
+            size = 0
+    if buf:
+        yield ''.join(buf)
+
+
+def main(argv: List[str]=None) -> None:
+    """ Entry point of ``kobin-templates``.
+
+        $ kobin-templates myproject.app:app --target compiled_templates
+    """
+    parser = argparse.ArgumentParser(description='Precompile the templates of a Kobin application.')
+    parser.add_argument('app', help='Application to load, e.g. "myproject.app:app".')
+    parser.add_argument('--target', help='Directory for the compiled template modules. '
+                                         'When omitted, templates are only compiled in memory.')
+    args = parser.parse_args(argv)
+
+    sys.path.insert(0, os.getcwd())
+    module_name, _, attr = args.app.partition(':')
+    app = getattr(importlib.import_module(module_name), attr or 'app')
+
+    timings = app.precompile_templates(args.target)
+    for name, seconds in sorted(timings.items()):
+        print('{:10.2f} ms  {}'.format(seconds * 1000, name))
+    print('{:10.2f} ms  total ({} templates)'.format(sum(timings.values()) * 1000, len(timings)))
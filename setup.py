@@ -24,7 +24,7 @@ __classifiers__ = (
     'Topic :: Software Development :: Libraries :: Application Frameworks',
     'Programming Language :: Python',
     'Programming Language :: Python :: 3',
-    'Programming Language :: Python :: 3.5',
+    'Programming Language :: Python :: 3.7',
 )
 
 
@@ -56,8 +56,13 @@ setup(
     description='Kobin is a small and statically-typed web framework.',
     long_description=README + '\n\n' + CHANGES,
     classifiers=__classifiers__,
-    packages=find_packages(exclude=['test*']),
+    packages=find_packages(exclude=['test*', 'benchmarks*']),
     install_requires=['jinja2'],
+    extras_require={'brotli': ['brotli']},
+    python_requires='>=3.7',
+    entry_points={
+        'console_scripts': ['kobin-templates = kobin.templates:main'],
+    },
     keywords='web framework wsgi',
     license=__license__,
     include_package_data=True,
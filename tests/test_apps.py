@@ -1,6 +1,8 @@
+import io
 import os
 from unittest import TestCase
 from kobin import Kobin, Config, response
+from kobin.server import FileWrapper
 
 
 class KobinTests(TestCase):
@@ -54,6 +56,91 @@ class KobinTests(TestCase):
         expected = [b'hello']
         self.assertEqual(actual, expected)
 
+    def test_wsgi_head(self):
+        headers = []
+        test_env = {'REQUEST_METHOD': 'HEAD', 'PATH_INFO': '/'}
+        actual = self.app.wsgi(test_env, lambda status, headerlist: headers.extend(headerlist))
+        self.assertEqual(actual, [])
+        self.assertIn(('Content-Length', '5'), headers)
+
+    def test_wsgi_405_method_not_allowed(self):
+        statuses = []
+        test_env = {'REQUEST_METHOD': 'POST', 'PATH_INFO': '/'}
+        body = self.app.wsgi(test_env, lambda status, headerlist: statuses.append((status, headerlist)))
+        self.assertEqual(body, [b'Method not allowed: /'])
+        self.assertEqual(statuses[0][0], '405 Method Not Allowed')
+        self.assertIn(('Allow', 'GET, HEAD, OPTIONS'), statuses[0][1])
+
+    def test_wsgi_streams_generator(self):
+        @self.app.route('/stream')
+        def stream():
+            yield 'hello, '
+            yield b'world'
+
+        test_env = {'REQUEST_METHOD': 'GET', 'PATH_INFO': '/stream'}
+        actual = self.app.wsgi(test_env, self.dummy_start_response)
+        self.assertNotIsInstance(actual, list)
+        self.assertEqual(list(actual), [b'hello, ', b'world'])
+
+    def test_wsgi_streams_file(self):
+        @self.app.route('/file')
+        def file():
+            return io.BytesIO(b'x' * 100000)
+
+        test_env = {'REQUEST_METHOD': 'GET', 'PATH_INFO': '/file'}
+        actual = list(self.app.wsgi(test_env, self.dummy_start_response))
+        self.assertEqual(len(actual), 2)
+        self.assertEqual(b''.join(actual), b'x' * 100000)
+
+    def test_wsgi_uses_file_wrapper(self):
+        @self.app.route('/file')
+        def file():
+            return io.BytesIO(b'hello')
+
+        def file_wrapper(f, block_size):
+            return ('wrapped', f.read())
+
+        test_env = {'REQUEST_METHOD': 'GET', 'PATH_INFO': '/file', 'wsgi.file_wrapper': file_wrapper}
+        actual = self.app.wsgi(test_env, self.dummy_start_response)
+        self.assertEqual(actual, ('wrapped', b'hello'))
+
+    def test_wsgi_keeps_file_wrapper_when_timed(self):
+        @self.app.route('/file')
+        def file():
+            return io.BytesIO(b'hello')
+
+        events = []
+        self.app.add_hook('after_response', lambda environ, timings: events.append(environ['PATH_INFO']))
+        test_env = {'REQUEST_METHOD': 'GET', 'PATH_INFO': '/file', 'wsgi.file_wrapper': FileWrapper}
+        actual = self.app.wsgi(test_env, self.dummy_start_response)
+        self.assertIsInstance(actual, FileWrapper)
+        self.assertEqual(b''.join(actual), b'hello')
+        self.assertEqual(events, [])
+        actual.close()
+        self.assertEqual(events, ['/file'])
+        self.assertTrue(actual.filelike.closed)
+
+    def test_wsgi_encodes_text_file(self):
+        @self.app.route('/file')
+        def file():
+            return io.StringIO('héllo')
+
+        test_env = {'REQUEST_METHOD': 'GET', 'PATH_INFO': '/file', 'wsgi.file_wrapper': lambda f, size: None}
+        actual = self.app.wsgi(test_env, self.dummy_start_response)
+        self.assertEqual(b''.join(actual), 'héllo'.encode('utf-8'))
+
+    def test_wsgi_500_for_unsupported_output(self):
+        statuses = []
+
+        @self.app.route('/none')
+        def none():
+            return None
+
+        test_env = {'REQUEST_METHOD': 'GET', 'PATH_INFO': '/none'}
+        actual = self.app.wsgi(test_env, lambda status, headerlist: statuses.append(status))
+        self.assertEqual(statuses, ['500 Internal Server Error'])
+        self.assertEqual(actual, [b'Internal server error.'])
+
 
 class ConfigTests(TestCase):
     def setUp(self):
@@ -0,0 +1,156 @@
+import asyncio
+import threading
+from unittest import TestCase
+
+from kobin import Kobin, request, response
+from kobin.asgi import ASGITestClient, build_environ
+from kobin.environs import Request
+
+
+class ASGITests(TestCase):
+    def setUp(self):
+        self.app = Kobin()
+        self.client = ASGITestClient(self.app.asgi)
+
+    def test_sync_callback(self):
+        @self.app.route('/users/{user_id}')
+        def user(user_id: int):
+            return 'user {} in {}'.format(user_id, threading.current_thread().name)
+
+        status, headers, body = self.client.request('GET', '/users/1')
+        self.assertEqual(status, 200)
+        self.assertIn(('Content-Type', 'text/html; charset=UTF-8'), headers)
+        self.assertTrue(body.startswith(b'user 1 in kobin'))
+
+    def test_async_callback(self):
+        @self.app.route('/')
+        async def index():
+            await asyncio.sleep(0)
+            response.headers.add_header('X-Thread', threading.current_thread().name)
+            return 'hello'
+
+        status, headers, body = self.client.request('GET', '/')
+        self.assertEqual(body, b'hello')
+        self.assertIn(('X-Thread', threading.current_thread().name), headers)
+
+    def test_async_body(self):
+        @self.app.route('/echo', method='POST')
+        async def echo():
+            return await request.aread()
+
+        status, headers, body = self.client.request('POST', '/echo', body=b'x' * 100, chunk_size=30)
+        self.assertEqual(body, b'x' * 100)
+
+    def test_sync_callback_reads_body(self):
+        @self.app.route('/form', method='POST')
+        def form():
+            return request.forms['key1']
+
+        status, headers, body = self.client.request(
+            'POST', '/form', body=b'key1=value1',
+            headers={'Content-Type': 'application/x-www-form-urlencoded'})
+        self.assertEqual(body, b'value1')
+
+    def test_sync_callback_streams_body(self):
+        @self.app.route('/upload', method='POST')
+        def upload():
+            sizes = [len(chunk) for chunk in request.iter_body(chunk_size=40)]
+            cached = 'kobin.request.body' in request.environ
+            return '{} {}'.format(sizes, cached)
+
+        status, headers, body = self.client.request('POST', '/upload', body=b'x' * 100, chunk_size=30)
+        self.assertEqual(body, b'[40, 40, 20] False')
+
+    def test_body_read_twice(self):
+        errors = []
+
+        @self.app.route('/echo', method='POST')
+        async def echo():
+            size = sum([len(chunk) async for chunk in request.aiter_body()])
+            try:
+                request.body
+            except RuntimeError as e:
+                errors.append(str(e))
+            return str(size)
+
+        status, headers, body = self.client.request('POST', '/echo', body=b'x' * 10)
+        self.assertEqual(body, b'10')
+        self.assertEqual(errors, ['The request body was already read.'])
+
+    def test_async_streaming_response(self):
+        @self.app.route('/stream')
+        async def stream():
+            async def chunks():
+                yield 'a'
+                yield b'b'
+            return chunks()
+
+        status, headers, body = self.client.request('GET', '/stream')
+        self.assertEqual(body, b'ab')
+
+    def test_sync_streaming_response(self):
+        @self.app.route('/stream')
+        def stream():
+            yield 'a'
+            yield 'b'
+
+        status, headers, body = self.client.request('GET', '/stream')
+        self.assertEqual(body, b'ab')
+
+    def test_head(self):
+        @self.app.route('/')
+        async def index():
+            return 'hello'
+
+        status, headers, body = self.client.request('HEAD', '/')
+        self.assertEqual(status, 200)
+        self.assertEqual(body, b'')
+        self.assertIn(('Content-Length', '5'), headers)
+
+    def test_404_not_found(self):
+        status, headers, body = self.client.request('GET', '/this_is_not_found')
+        self.assertEqual(status, 404)
+        self.assertEqual(body, b'Not found: /this_is_not_found')
+
+    def test_500_internal_server_error(self):
+        @self.app.route('/')
+        async def index():
+            raise ValueError
+
+        status, headers, body = self.client.request('GET', '/')
+        self.assertEqual(status, 500)
+
+    def test_concurrent_requests_are_isolated(self):
+        @self.app.route('/{name}')
+        async def hello(name: str):
+            await asyncio.sleep(0.01)
+            return request.path
+
+        async def main():
+            return await asyncio.gather(*[self.client.arequest('GET', '/{}'.format(i)) for i in range(5)])
+
+        results = asyncio.run(main())
+        self.assertEqual([r[2] for r in results], [b'/0', b'/1', b'/2', b'/3', b'/4'])
+
+
+class BuildEnvironTests(TestCase):
+    def test_build_environ(self):
+        scope = {
+            'type': 'http', 'method': 'GET', 'path': '/app/hello', 'root_path': '/app',
+            'query_string': b'a=1', 'headers': [(b'content-type', b'text/plain'), (b'x-foo', b'bar')],
+        }
+        environ = build_environ(scope, None)
+        self.assertEqual(environ['PATH_INFO'], '/hello')
+        self.assertEqual(environ['QUERY_STRING'], 'a=1')
+        self.assertEqual(environ['CONTENT_TYPE'], 'text/plain')
+        self.assertEqual(environ['HTTP_X_FOO'], 'bar')
+
+    def test_repeated_headers(self):
+        scope = {
+            'type': 'http', 'method': 'GET', 'path': '/',
+            'headers': [(b'cookie', b'a=1'), (b'cookie', b'b=2'), (b'accept', b'text/html'), (b'accept', b'*/*')],
+        }
+        environ = build_environ(scope, None)
+        self.assertEqual(environ['HTTP_COOKIE'], 'a=1; b=2')
+        self.assertEqual(environ['HTTP_ACCEPT'], 'text/html,*/*')
+        self.assertEqual(Request(environ).cookies, {'a': '1', 'b': '2'})
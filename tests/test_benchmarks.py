@@ -0,0 +1,44 @@
+from unittest import TestCase
+from benchmarks.runner import Case, combine, compare, measure, percentile, run
+
+
+class RunnerTests(TestCase):
+    def test_percentile(self):
+        ordered = [float(i) for i in range(1, 101)]
+        self.assertEqual(percentile(ordered, 50), 50.0)
+        self.assertEqual(percentile(ordered, 99), 99.0)
+        self.assertEqual(percentile([1.0], 99), 1.0)
+
+    def test_measure(self):
+        calls = []
+        result = measure(Case('append', calls.append, lambda: 1), duration=0, min_samples=10, warmup=0)
+        self.assertEqual(result['samples'], 10)
+        self.assertEqual(calls, [1] * 10)
+        self.assertLessEqual(result['p50_us'], result['p99_us'])
+
+    def test_compare(self):
+        baseline = {'results': {'a': {'p50_us': 10.0}, 'b': {'p50_us': 10.0}, 'gone': {'p50_us': 1.0}}}
+        current = {'results': {'a': {'p50_us': 10.5}, 'b': {'p50_us': 12.0}, 'new': {'p50_us': 1.0}}}
+        rows = compare(baseline, current, threshold=0.1)
+        self.assertEqual([(name, regressed) for name, _, _, _, regressed in rows],
+                         [('a', False), ('b', True)])
+
+    def test_combine(self):
+        result = combine([{'p50_us': 12.0}, {'p50_us': 10.0}, {'p50_us': 11.0}])
+        self.assertEqual(result['p50_us'], 11.0)
+        self.assertEqual(result['min_p50_us'], 10.0)
+        self.assertAlmostEqual(result['spread'], 0.2)
+        self.assertEqual(result['repeats'], 3)
+
+    def test_run_repeats(self):
+        calls = []
+        results = run([Case('append', lambda: calls.append(1))], duration=0, repeat=3)
+        self.assertEqual(results['results']['append']['repeats'], 3)
+        self.assertEqual(len(calls), 3 * (100 + 20))
+
+    def test_compare_ignores_noise(self):
+        baseline = {'results': {'a': {'p50_us': 10.0, 'min_p50_us': 10.0, 'spread': 0.3}}}
+        current = {'results': {'a': {'p50_us': 12.0, 'min_p50_us': 12.0, 'spread': 0.05}}}
+        self.assertEqual(compare(baseline, current, threshold=0.1)[0][4], False)
+        current['results']['a']['min_p50_us'] = 14.0
+        self.assertEqual(compare(baseline, current, threshold=0.1)[0][4], True)
@@ -0,0 +1,152 @@
+import asyncio
+import os
+import tempfile
+import threading
+import time
+from unittest import TestCase
+from kobin import Kobin, response
+from kobin.asgi import ASGITestClient
+from kobin.caching import FileCache, MemoryCache, cached
+
+
+class MemoryCacheTests(TestCase):
+    def test_get_and_set(self):
+        cache = MemoryCache()
+        cache.set('key', 'value', 10)
+        self.assertEqual(cache.get('key'), 'value')
+        self.assertIsNone(cache.get('missing'))
+
+    def test_expired(self):
+        cache = MemoryCache()
+        cache.set('key', 'value', -1)
+        self.assertIsNone(cache.get('key'))
+
+    def test_bounded(self):
+        cache = MemoryCache(maxsize=2)
+        for key in 'abc':
+            cache.set(key, key, 10)
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual(cache.get('c'), 'c')
+
+
+class FileCacheTests(TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.cache = FileCache(self.directory.name)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_shared_between_instances(self):
+        self.cache.set('key', (200, b'body'), 10)
+        self.assertEqual(FileCache(self.directory.name).get('key'), (200, b'body'))
+
+    def test_expired(self):
+        self.cache.set('key', 'value', -1)
+        self.assertIsNone(self.cache.get('key'))
+
+    def test_delete(self):
+        self.cache.set('key', 'value', 10)
+        self.cache.delete('key')
+        self.assertIsNone(self.cache.get('key'))
+
+    def test_expired_file_is_removed_on_read(self):
+        self.cache.set('key', 'value', -1)
+        self.cache.get('key')
+        self.assertEqual(os.listdir(self.directory.name), [])
+
+    def test_sweep(self):
+        cache = FileCache(self.directory.name, maxsize=2, sweep_interval=0)
+        cache.set('expired', 'value', -1)
+        for key, ttl in (('a', 10), ('b', 30), ('c', 20)):
+            cache.set(key, key, ttl)
+        self.assertEqual(len(os.listdir(self.directory.name)), 2)
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual(cache.get('b'), 'b')
+        self.assertEqual(cache.get('c'), 'c')
+
+
+class CachedRouteTests(TestCase):
+    def setUp(self):
+        self.app = Kobin()
+        self.calls = []
+        self.headers = {}
+
+        @self.app.route('/', cache=60)
+        def index():
+            self.calls.append('index')
+            response.headers['X-Rendered'] = str(len(self.calls))
+            return 'hello'
+
+        @self.app.route('/items')
+        @cached(60, query=['page'], vary=['Accept-Language'])
+        def items():
+            self.calls.append('items')
+            return 'items'
+
+        @self.app.route('/login', cache=60)
+        def login():
+            self.calls.append('login')
+            response.set_cookie('session', 'secret')
+            return 'login'
+
+    def start_response(self, status, headerlist):
+        self.headers = dict(headerlist)
+
+    def get(self, path, query='', **headers):
+        env = {'REQUEST_METHOD': 'GET', 'PATH_INFO': path, 'QUERY_STRING': query}
+        env.update(headers)
+        return b''.join(self.app.wsgi(env, self.start_response))
+
+    def test_cache_option(self):
+        self.assertEqual(self.get('/'), b'hello')
+        self.assertEqual(self.get('/'), b'hello')
+        self.assertEqual(self.calls, ['index'])
+        self.assertEqual(self.headers['X-Rendered'], '1')
+
+    def test_selected_query_params(self):
+        self.get('/items', 'page=1&utm_source=a')
+        self.get('/items', 'page=1&utm_source=b')
+        self.get('/items', 'page=2')
+        self.assertEqual(self.calls, ['items', 'items'])
+
+    def test_vary_headers(self):
+        self.get('/items', HTTP_ACCEPT_LANGUAGE='ja')
+        self.get('/items', HTTP_ACCEPT_LANGUAGE='en')
+        self.get('/items', HTTP_ACCEPT_LANGUAGE='ja')
+        self.assertEqual(self.calls, ['items', 'items'])
+
+    def test_response_with_cookies_is_not_cached(self):
+        self.get('/login')
+        self.get('/login')
+        self.assertEqual(self.calls, ['login', 'login'])
+
+    def test_single_flight(self):
+        @self.app.route('/slow', cache=60)
+        def slow():
+            self.calls.append('slow')
+            time.sleep(0.05)
+            return 'slow'
+
+        threads = [threading.Thread(target=self.get, args=('/slow', )) for _ in range(5)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(self.calls, ['slow'])
+
+    def test_async_single_flight(self):
+        @self.app.route('/async', cache=60)
+        async def slow():
+            self.calls.append('async')
+            await asyncio.sleep(0.05)
+            return 'async'
+
+        client = ASGITestClient(self.app.asgi)
+
+        async def requests():
+            return await asyncio.gather(*[client.arequest('GET', '/async') for _ in range(5)])
+
+        results = asyncio.run(requests())
+        self.assertEqual([body for _, _, body in results], [b'async'] * 5)
+        self.assertEqual(self.calls, ['async'])
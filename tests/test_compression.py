@@ -0,0 +1,144 @@
+import gzip
+import zlib
+from unittest import TestCase
+from kobin import Kobin, response
+from kobin.asgi import ASGITestClient
+from kobin.compression import negotiate
+
+
+class NegotiateTests(TestCase):
+    def test_gzip(self):
+        self.assertEqual(negotiate('gzip, deflate', ('br', 'gzip')), 'gzip')
+
+    def test_prefers_higher_quality(self):
+        self.assertEqual(negotiate('br;q=0.5, gzip', ('br', 'gzip')), 'gzip')
+
+    def test_server_preference_on_tie(self):
+        self.assertEqual(negotiate('gzip, br', ('br', 'gzip')), 'br')
+
+    def test_refused(self):
+        self.assertIsNone(negotiate('gzip;q=0', ('gzip', )))
+        self.assertIsNone(negotiate('', ('gzip', )))
+
+    def test_wildcard(self):
+        self.assertEqual(negotiate('*', ('gzip', )), 'gzip')
+
+
+class CompressionTests(TestCase):
+    def setUp(self):
+        self.app = Kobin()
+        self.app.config['COMPRESSION'] = True
+        self.app.config['COMPRESSION_MIN_SIZE'] = 100
+        self.headers = {}
+
+        @self.app.route('/', name='index')
+        def index():
+            return 'hello ' * 100
+
+        @self.app.route('/short')
+        def short():
+            return 'hello'
+
+        @self.app.route('/image')
+        def image():
+            response.headers['Content-Type'] = 'image/png'
+            return b'\x89PNG' * 100
+
+        @self.app.route('/stream')
+        def stream():
+            for i in range(3):
+                yield 'chunk {} '.format(i) * 10
+
+    def start_response(self, status, headerlist):
+        self.headers = dict(headerlist)
+
+    def get(self, path, accept_encoding='gzip'):
+        env = {'REQUEST_METHOD': 'GET', 'PATH_INFO': path, 'HTTP_ACCEPT_ENCODING': accept_encoding}
+        return list(self.app.wsgi(env, self.start_response))
+
+    def test_compress(self):
+        body = b''.join(self.get('/'))
+        self.assertEqual(gzip.decompress(body), b'hello ' * 100)
+        self.assertEqual(self.headers['Content-Encoding'], 'gzip')
+        self.assertEqual(self.headers['Content-Length'], str(len(body)))
+        self.assertEqual(self.headers['Vary'], 'Accept-Encoding')
+
+    def test_etag_becomes_weak(self):
+        self.app.config['AUTO_ETAG'] = True
+        self.get('/')
+        self.assertTrue(self.headers['ETag'].startswith('W/"'))
+
+    def test_not_accepted(self):
+        self.assertEqual(self.get('/', accept_encoding=''), [b'hello ' * 100])
+        self.assertNotIn('Content-Encoding', self.headers)
+        self.assertEqual(self.headers['Vary'], 'Accept-Encoding')
+
+    def test_below_min_size(self):
+        self.assertEqual(self.get('/short'), [b'hello'])
+        self.assertNotIn('Content-Encoding', self.headers)
+
+    def test_excluded_content_type(self):
+        self.assertEqual(self.get('/image'), [b'\x89PNG' * 100])
+        self.assertNotIn('Content-Encoding', self.headers)
+
+    def test_excluded_route(self):
+        self.app.config['COMPRESSION_EXCLUDED_ROUTES'] = ('index', )
+        self.assertEqual(self.get('/'), [b'hello ' * 100])
+        self.assertNotIn('Content-Encoding', self.headers)
+
+    def test_disabled(self):
+        self.app.config['COMPRESSION'] = False
+        self.assertEqual(self.get('/'), [b'hello ' * 100])
+        self.assertNotIn('Vary', self.headers)
+
+    def test_stream_is_flushed_per_chunk(self):
+        chunks = self.get('/stream')
+        self.assertEqual(self.headers['Content-Encoding'], 'gzip')
+        self.assertNotIn('Content-Length', self.headers)
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        self.assertEqual(decompressor.decompress(chunks[0]), b'chunk 0 ' * 10)
+        rest = b''.join(decompressor.decompress(c) for c in chunks[1:])
+        self.assertEqual(rest, b'chunk 1 ' * 10 + b'chunk 2 ' * 10)
+
+    def test_asgi(self):
+        client = ASGITestClient(self.app.asgi)
+        status, headers, body = client.request('GET', '/', headers={'Accept-Encoding': 'gzip'})
+        self.assertEqual(dict(headers)['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(body), b'hello ' * 100)
+
+    def test_asgi_min_size_counts_encoded_bytes(self):
+        @self.app.route('/accents')
+        def accents():
+            return 'é' * 60  # 60 characters, 120 bytes
+
+        client = ASGITestClient(self.app.asgi)
+        status, headers, body = client.request('GET', '/accents', headers={'Accept-Encoding': 'gzip'})
+        self.assertEqual(dict(headers)['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(body), 'é'.encode('utf-8') * 60)
+
+    def test_asgi_closes_body_on_error(self):
+        closed = []
+
+        class Body:
+            def __init__(self):
+                self.chunks = ['x' * 200]
+
+            def __aiter__(self):
+                return self
+
+            async def __anext__(self):
+                if not self.chunks:
+                    raise ValueError('broken')
+                return self.chunks.pop()
+
+            async def aclose(self):
+                closed.append(True)
+
+        @self.app.route('/broken')
+        async def broken():
+            return Body()
+
+        client = ASGITestClient(self.app.asgi)
+        with self.assertRaises(ValueError):
+            client.request('GET', '/broken', headers={'Accept-Encoding': 'gzip'})
+        self.assertEqual(closed, [True])
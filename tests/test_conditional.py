@@ -0,0 +1,93 @@
+from unittest import TestCase
+from kobin import Kobin, response
+from kobin.conditional import etag, etag_matches, make_etag
+
+
+class EtagMatchesTests(TestCase):
+    def test_match(self):
+        self.assertTrue(etag_matches('"a", "b"', '"b"'))
+
+    def test_weak_comparison(self):
+        self.assertTrue(etag_matches('W/"a"', '"a"'))
+        self.assertTrue(etag_matches('"a"', 'W/"a"'))
+
+    def test_wildcard(self):
+        self.assertTrue(etag_matches('*', '"a"'))
+
+    def test_no_match(self):
+        self.assertFalse(etag_matches('"a"', '"b"'))
+
+
+class ConditionalTests(TestCase):
+    def setUp(self):
+        self.app = Kobin()
+        self.app.config['AUTO_ETAG'] = True
+        self.calls = []
+        self.status = None
+        self.headers = {}
+
+        @self.app.route('/')
+        def index():
+            return 'hello'
+
+        @self.app.route('/modified')
+        def modified():
+            response.headers['Last-Modified'] = 'Sat, 01 Oct 2016 00:00:00 GMT'
+            return 'hello'
+
+        @self.app.route('/posts/{post_id}')
+        @etag(lambda post_id: post_id * 10)
+        def post(post_id: int):
+            self.calls.append(post_id)
+            return 'post {}'.format(post_id)
+
+    def start_response(self, status, headerlist):
+        self.status = status
+        self.headers = dict(headerlist)
+
+    def get(self, path, **headers):
+        env = {'REQUEST_METHOD': 'GET', 'PATH_INFO': path}
+        env.update(headers)
+        return b''.join(self.app.wsgi(env, self.start_response))
+
+    def test_auto_etag(self):
+        self.assertEqual(self.get('/'), b'hello')
+        self.assertEqual(self.headers['ETag'], make_etag(b'hello'))
+
+    def test_auto_etag_disabled(self):
+        self.app.config['AUTO_ETAG'] = False
+        self.get('/')
+        self.assertNotIn('ETag', self.headers)
+
+    def test_if_none_match(self):
+        body = self.get('/', HTTP_IF_NONE_MATCH=make_etag(b'hello'))
+        self.assertEqual(body, b'')
+        self.assertEqual(self.status, '304 Not Modified')
+        self.assertNotIn('Content-Type', self.headers)
+        self.assertEqual(self.headers['ETag'], make_etag(b'hello'))
+
+    def test_if_none_match_changed(self):
+        self.assertEqual(self.get('/', HTTP_IF_NONE_MATCH=make_etag(b'old')), b'hello')
+        self.assertEqual(self.status, '200 OK')
+
+    def test_if_modified_since(self):
+        self.app.config['AUTO_ETAG'] = False
+        self.get('/modified', HTTP_IF_MODIFIED_SINCE='Sun, 02 Oct 2016 00:00:00 GMT')
+        self.assertEqual(self.status, '304 Not Modified')
+        self.get('/modified', HTTP_IF_MODIFIED_SINCE='Fri, 30 Sep 2016 00:00:00 GMT')
+        self.assertEqual(self.status, '200 OK')
+
+    def test_post_is_not_conditional(self):
+        env = {'REQUEST_METHOD': 'POST', 'PATH_INFO': '/', 'HTTP_IF_NONE_MATCH': '*'}
+        self.app.route('/', method='POST', callback=lambda: 'posted')
+        self.assertEqual(b''.join(self.app.wsgi(env, self.start_response)), b'posted')
+
+    def test_version_key_skips_callback(self):
+        self.assertEqual(self.get('/posts/1'), b'post 1')
+        tag = self.headers['ETag']
+        self.assertEqual(self.get('/posts/1', HTTP_IF_NONE_MATCH=tag), b'')
+        self.assertEqual(self.status, '304 Not Modified')
+        self.assertEqual(self.calls, [1])
+
+    def test_version_key_keeps_url_var_types(self):
+        self.assertEqual(self.get('/posts/not-integer').startswith(b'Not found'), True)
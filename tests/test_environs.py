@@ -1,7 +1,15 @@
+import asyncio
+import contextvars
+import io
+import threading
+import time
 from unittest import TestCase
 from unittest.mock import MagicMock
 
-from kobin.environs import Request, Response
+from kobin import Kobin
+from kobin.exceptions import HTTPError
+
+from kobin.environs import MultiDict, Request, Response, ResponseHeaders, bind, request, response
 
 
 class RequestTests(TestCase):
@@ -36,6 +44,33 @@ class RequestTests(TestCase):
         expected = 'bar'
         self.assertEqual(actual, expected)
 
+    def test_cookies_are_cached(self):
+        request = Request({'HTTP_COOKIE': 'foo="bar"'})
+        self.assertIs(request.cookies, request.cookies)
+
+    def test_cookies_cache_is_cleared_when_header_changes(self):
+        request = Request({'HTTP_COOKIE': 'foo=bar'})
+        self.assertEqual(request.get_cookie('foo'), 'bar')
+        request['HTTP_COOKIE'] = 'foo=baz'
+        self.assertEqual(request.get_cookie('foo'), 'baz')
+
+    def test_cookies_skip_malformed_pairs(self):
+        request = Request({'HTTP_COOKIE': 'broken; a=1; b="x\\"y\\054z"; {bad}=2; a=3'})
+        self.assertEqual(request.cookies, {'a': '1', 'b': 'x"y,z', '{bad}': '2'})
+
+    def test_headers(self):
+        request = Request({'HTTP_X_REQUEST_ID': 'abc', 'CONTENT_TYPE': 'text/plain', 'PATH_INFO': '/'})
+        self.assertEqual(request.headers['x-request-id'], 'abc')
+        self.assertEqual(request.headers['Content-Type'], 'text/plain')
+        self.assertEqual(sorted(request.headers), ['Content-Type', 'X-Request-Id'])
+        self.assertNotIn('Path-Info', request.headers)
+
+    def test_headers_cache_is_cleared_when_header_changes(self):
+        request = Request({'HTTP_ACCEPT': 'text/html'})
+        self.assertEqual(request.headers['Accept'], 'text/html')
+        request['HTTP_ACCEPT'] = 'application/json'
+        self.assertEqual(request.headers['Accept'], 'application/json')
+
     def test_path_property(self):
         request = Request({'PATH_INFO': '/hoge'})
         self.assertEqual(request.path, '/hoge')
@@ -77,6 +112,60 @@ class RequestTests(TestCase):
         self.assertEqual(request.POST['key1'], 'value1')
         self.assertEqual(request.POST['key2'], 'value2')
 
+    def _multipart_request(self, body):
+        return Request({
+            'REQUEST_METHOD': 'POST',
+            'QUERY_STRING': '',
+            'wsgi.input': io.BytesIO(body),
+            'CONTENT_TYPE': 'multipart/form-data; boundary=xyz',
+            'CONTENT_LENGTH': str(len(body)),
+        })
+
+    def test_POST_multipart(self):
+        body = (b'--xyz\r\n'
+                b'Content-Disposition: form-data; name="key1"\r\n\r\n'
+                b'value1\r\n'
+                b'--xyz\r\n'
+                b'Content-Disposition: form-data; name="upload"; filename="a.txt"\r\n'
+                b'Content-Type: text/plain\r\n\r\n'
+                b'file content\r\n'
+                b'--xyz--\r\n')
+        request = self._multipart_request(body)
+        self.assertEqual(request.forms['key1'], 'value1')
+        upload = request.files['upload']
+        self.assertEqual(upload.filename, 'a.txt')
+        self.assertEqual(upload.content_type, 'text/plain')
+        self.assertEqual(upload.value, b'file content')
+        self.assertEqual(request.POST['key1'], 'value1')
+        self.assertIs(request.POST['upload'], upload)
+
+    def test_POST_multipart_is_cached(self):
+        body = (b'--xyz\r\n'
+                b'Content-Disposition: form-data; name="key1"\r\n\r\n'
+                b'value1\r\n'
+                b'--xyz--\r\n')
+        request = self._multipart_request(body)
+        self.assertIs(request.forms, request.forms)
+        self.assertIs(request.POST, request.POST)
+
+    def test_POST_multipart_too_many_parts(self):
+        part = (b'--xyz\r\n'
+                b'Content-Disposition: form-data; name="key"\r\n\r\n'
+                b'value\r\n')
+        request = self._multipart_request(part * 3 + b'--xyz--\r\n')
+        app = Kobin()
+        app.config['MULTIPART_MAX_PARTS'] = 2
+        request['kobin.app'] = app
+        with self.assertRaises(HTTPError) as cm:
+            request.forms
+        self.assertEqual(cm.exception.status_code, 413)
+
+    def test_POST_multipart_malformed(self):
+        request = self._multipart_request(b'--xyz\r\nbroken')
+        with self.assertRaises(HTTPError) as cm:
+            request.POST
+        self.assertEqual(cm.exception.status_code, 400)
+
     def test_GET_a_parameter(self):
         request = Request({
             'REQUEST_METHOD': 'GET',
@@ -96,6 +185,22 @@ class RequestTests(TestCase):
         self.assertEqual(request.GET['key1'], 'value1')
         self.assertEqual(request.GET['key2'], 'value2')
 
+    def test_GET_repeated_parameters(self):
+        request = Request({'QUERY_STRING': 'key=value1&key=value2&empty='})
+        self.assertEqual(request.GET['key'], 'value2')
+        self.assertEqual(request.GET.getall('key'), ['value1', 'value2'])
+        self.assertEqual(request.GET['empty'], '')
+
+    def test_GET_is_cached(self):
+        request = Request({'QUERY_STRING': 'key1=value1'})
+        self.assertIs(request.GET, request.GET)
+
+    def test_GET_cache_is_cleared_when_query_string_changes(self):
+        request = Request({'QUERY_STRING': 'key1=value1'})
+        self.assertEqual(request.GET['key1'], 'value1')
+        request['QUERY_STRING'] = 'key1=value2'
+        self.assertEqual(request.GET['key1'], 'value2')
+
     def test_body(self):
         wsgi_input_mock = MagicMock()
         wsgi_input_mock.read.return_value = b'{"key1": "value1"}'
@@ -120,6 +225,59 @@ class RequestTests(TestCase):
         })
         self.assertEqual(request.json["key1"], "value1")
 
+    def test_raw_body(self):
+        request = Request({
+            'wsgi.input': io.BytesIO(b'\xe3\x81\x82'),
+            'CONTENT_LENGTH': '3',
+        })
+        self.assertEqual(request.raw_body, b'\xe3\x81\x82')
+        self.assertEqual(request.body, '\u3042')
+
+    def test_iter_body_reads_in_chunks(self):
+        request = Request({
+            'wsgi.input': io.BytesIO(b'x' * 10 + b'ignored'),
+            'CONTENT_LENGTH': '10',
+        })
+        self.assertEqual(list(request.iter_body(chunk_size=4)), [b'xxxx', b'xxxx', b'xx'])
+
+    def test_body_too_large(self):
+        app = Kobin()
+        app.config['MAX_BODY_SIZE'] = 5
+        request = Request({
+            'wsgi.input': io.BytesIO(b'x' * 10),
+            'CONTENT_LENGTH': '10',
+            'kobin.app': app,
+        })
+        with self.assertRaises(HTTPError) as cm:
+            request.body
+        self.assertEqual(cm.exception.status_code, 413)
+
+    def test_json_is_cached(self):
+        wsgi_input_mock = MagicMock()
+        wsgi_input_mock.read.return_value = b'{"key1": "value1"}'
+        request = Request({
+            'wsgi.input': wsgi_input_mock,
+            'CONTENT_LENGTH': len(b'{"key1": "value1"}'),
+        })
+        self.assertIs(request.json, request.json)
+        self.assertEqual(wsgi_input_mock.read.call_count, 1)
+
+    def test_json_with_custom_loads(self):
+        app = Kobin()
+        app.config['JSON_LOADS'] = lambda body: ('loaded', body)
+        request = Request({
+            'wsgi.input': io.BytesIO(b'{}'),
+            'CONTENT_LENGTH': '2',
+            'kobin.app': app,
+        })
+        self.assertEqual(request.json, ('loaded', b'{}'))
+
+    def test_body_cache_is_cleared_when_input_changes(self):
+        request = Request({'wsgi.input': io.BytesIO(b'foo'), 'CONTENT_LENGTH': '3'})
+        self.assertEqual(request.body, 'foo')
+        request['wsgi.input'] = io.BytesIO(b'bar')
+        self.assertEqual(request.body, 'bar')
+
     def test_url(self):
         request = Request({
             'HTTP_X_FORWARDED_PROTO': 'http',
@@ -131,6 +289,30 @@ class RequestTests(TestCase):
         self.assertEqual(actual, "http://localhost/hoge?key1=value1&key2=value2")
 
 
+class MultiDictTests(TestCase):
+    def test_getitem_returns_last_value(self):
+        d = MultiDict([('a', '1'), ('a', '2')])
+        self.assertEqual(d['a'], '2')
+        self.assertEqual(len(d), 1)
+
+    def test_setitem_replaces_values(self):
+        d = MultiDict([('a', '1'), ('a', '2')])
+        d['a'] = '3'
+        self.assertEqual(d.getall('a'), ['3'])
+
+    def test_allitems(self):
+        d = MultiDict([('a', '1'), ('b', '2'), ('a', '3')])
+        self.assertEqual(d.allitems(), [('a', '1'), ('a', '3'), ('b', '2')])
+
+    def test_getall_missing_key(self):
+        self.assertEqual(MultiDict().getall('a'), [])
+
+    def test_getall_returns_a_copy(self):
+        d = MultiDict([('a', '1')])
+        d.getall('a').append('2')
+        self.assertEqual(d.getall('a'), ['1'])
+
+
 class ResponseTests(TestCase):
     def test_constructor_body(self):
         response = Response('')
@@ -179,3 +361,106 @@ class ResponseTests(TestCase):
         response = Response(headers={'key1': 'value1'})
         expected_content_type = ('key1', 'value1')
         self.assertIn(expected_content_type, response.headerlist)
+
+    def test_headerlist_does_not_modify_headers(self):
+        response = Response()
+        response.headerlist
+        self.assertNotIn('Content-Type', response.headers)
+
+    def test_headerlist_keeps_repeated_headers_once(self):
+        response = Response()
+        response.headers.add_header('Vary', 'Accept')
+        response.headers.add_header('Vary', 'Cookie')
+        vary = [v for k, v in response.headerlist if k == 'Vary']
+        self.assertEqual(vary, ['Accept', 'Cookie'])
+
+    def test_headerlist_encodes_non_ascii_values(self):
+        response = Response()
+        response.headers['X-Name'] = 'こんにちは'
+        self.assertIn(('X-Name', 'こんにちは'.encode('utf8').decode('latin1')), response.headerlist)
+        self.assertEqual(response.headers['x-name'], 'こんにちは')
+
+    def test_headers_and_cookies_are_created_when_used(self):
+        response = Response()
+        self.assertFalse(hasattr(response, '__dict__'))
+        self.assertIsNone(response._headers)
+        self.assertIsNone(response._cookies)
+        response.headers.add_header('key', 'value')
+        self.assertIsNotNone(response._headers)
+
+    def test_apply_http_error(self):
+        response = Response()
+        response.apply(HTTPError.for_path(404, '/hoge'))
+        self.assertEqual(response.status, '404 Not Found')
+        self.assertEqual(response.body, 'Not found: /hoge')
+        self.assertEqual(response.headerlist, [('Content-Type', 'text/html; charset=UTF-8')])
+
+
+class ResponseHeadersTests(TestCase):
+    def test_lookup_is_case_insensitive(self):
+        headers = ResponseHeaders([('Content-Type', 'text/plain')])
+        self.assertIn('content-type', headers)
+        self.assertEqual(headers['CONTENT-TYPE'], 'text/plain')
+
+    def test_missing_header(self):
+        headers = ResponseHeaders()
+        self.assertIsNone(headers['X-Missing'])
+        self.assertEqual(headers.get('X-Missing', 'default'), 'default')
+
+    def test_setitem_replaces_all_values(self):
+        headers = ResponseHeaders([('Vary', 'Accept'), ('X-A', '1'), ('vary', 'Cookie')])
+        headers['Vary'] = 'Origin'
+        self.assertEqual(headers.items(), [('X-A', '1'), ('Vary', 'Origin')])
+        self.assertEqual(headers.get_all('vary'), ['Origin'])
+
+    def test_delitem(self):
+        headers = ResponseHeaders([('X-A', '1'), ('X-B', '2')])
+        del headers['x-a']
+        self.assertEqual(headers.keys(), ['X-B'])
+        self.assertNotIn('X-A', headers)
+
+    def test_add_header_with_params(self):
+        headers = ResponseHeaders()
+        headers.add_header('Content-Disposition', 'attachment', filename='a.txt')
+        self.assertEqual(headers['Content-Disposition'], 'attachment; filename="a.txt"')
+
+
+class ContextTests(TestCase):
+    def test_outside_of_context(self):
+        def path():
+            return request.path
+        self.assertRaises(RuntimeError, contextvars.Context().run, path)
+
+    def test_bound_per_thread(self):
+        paths = {}
+
+        def handle(path):
+            bind({'PATH_INFO': path})
+            time.sleep(0.01)
+            response.status = 404 if path == '/b' else 200
+            paths[path] = (request.path, response.status_code)
+
+        threads = [threading.Thread(target=handle, args=(p, )) for p in ('/a', '/b')]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(paths, {'/a': ('/a', 200), '/b': ('/b', 404)})
+
+    def test_bound_per_task(self):
+        async def handle(path):
+            bind({'PATH_INFO': path})
+            await asyncio.sleep(0)
+            return request.path
+
+        async def main():
+            return await asyncio.gather(handle('/a'), handle('/b'))
+
+        self.assertEqual(asyncio.run(main()), ['/a', '/b'])
+
+    def test_request_bind_keeps_response(self):
+        def run():
+            response.bind(status=201)
+            request.bind({'PATH_INFO': '/a'})
+            return request.path, response.status_code
+        self.assertEqual(contextvars.Context().run(run), ('/a', 201))
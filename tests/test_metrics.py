@@ -0,0 +1,121 @@
+from unittest import TestCase
+from kobin import Kobin
+from kobin.metrics import Histogram, MetricsRegistry
+
+
+class HistogramTests(TestCase):
+    def test_quantiles(self):
+        histogram = Histogram(buckets=(1.0, 2.0, 3.0, 4.0))
+        for value in (0.5, 1.5, 2.5, 3.5):
+            histogram.observe(value)
+        self.assertEqual(histogram.count, 4)
+        self.assertEqual(histogram.quantile(0.5), 2.0)
+        self.assertEqual(histogram.quantile(1.0), 4.0)
+
+    def test_empty(self):
+        self.assertIsNone(Histogram().quantile(0.5))
+
+    def test_weight(self):
+        histogram = Histogram(buckets=(1.0, ))
+        histogram.observe(0.5, weight=10)
+        self.assertEqual(histogram.count, 10)
+        self.assertEqual(histogram.sum, 5.0)
+
+
+class MetricsRegistryTests(TestCase):
+    def test_counter(self):
+        registry = MetricsRegistry()
+        registry.inc('hits', route='index')
+        registry.inc('hits', 2, route='index')
+        self.assertEqual(registry.snapshot()['counters']['hits'], {(('route', 'index'), ): 3})
+
+    def test_render_prometheus(self):
+        registry = MetricsRegistry(buckets=(0.1, 1.0))
+        registry.inc('kobin_requests_total', route='index')
+        registry.observe('latency', 0.5, route='index')
+        text = registry.render_prometheus()
+        self.assertIn('# TYPE kobin_requests_total counter', text)
+        self.assertIn('kobin_requests_total{route="index"} 1', text)
+        self.assertIn('latency_bucket{route="index",le="0.1"} 0', text)
+        self.assertIn('latency_bucket{route="index",le="1.0"} 1', text)
+        self.assertIn('latency_bucket{route="index",le="+Inf"} 1', text)
+        self.assertIn('latency_count{route="index"} 1', text)
+
+
+class HooksTests(TestCase):
+    def setUp(self):
+        self.app = Kobin()
+        self.events = []
+
+        @self.app.route('/', name='index')
+        def index():
+            return 'hello'
+
+    def get(self, path):
+        env = {'REQUEST_METHOD': 'GET', 'PATH_INFO': path}
+        body = self.app.wsgi(env, lambda status, headers: None)
+        try:
+            return b''.join(body)
+        finally:
+            if hasattr(body, 'close'):
+                body.close()
+
+    def record(self, event):
+        self.app.add_hook(event, lambda environ, timings: self.events.append((event, timings)))
+
+    def test_events(self):
+        for event in ('before_request', 'after_match', 'after_handler', 'after_response'):
+            self.record(event)
+        self.get('/')
+        self.assertEqual([e for e, _ in self.events],
+                         ['before_request', 'after_match', 'after_handler', 'after_response'])
+        timings = self.events[-1][1]
+        self.assertGreaterEqual(timings.routing, 0)
+        self.assertGreaterEqual(timings.handler, 0)
+        self.assertGreaterEqual(timings.total, timings.handler)
+
+    def test_after_response_fires_when_body_is_closed(self):
+        self.record('after_response')
+        body = self.app.wsgi({'REQUEST_METHOD': 'GET', 'PATH_INFO': '/'}, lambda status, headers: None)
+        self.assertEqual(list(body), [b'hello'])
+        self.assertEqual(self.events, [])
+        body.close()
+        self.assertEqual([e for e, _ in self.events], ['after_response'])
+
+    def test_not_found_is_not_matched(self):
+        self.record('after_match')
+        self.record('after_response')
+        self.get('/missing')
+        self.assertEqual([e for e, _ in self.events], ['after_response'])
+
+    def test_unknown_event(self):
+        self.assertRaises(ValueError, self.app.add_hook, 'after_everything', print)
+
+    def test_sampling(self):
+        self.app.config['METRICS_SAMPLE_RATE'] = 3
+        self.record('after_response')
+        for _ in range(6):
+            self.get('/')
+        self.assertEqual(len(self.events), 2)
+        self.assertEqual(self.events[0][1].weight, 3)
+
+    def test_request_metrics(self):
+        self.app.config['METRICS'] = True
+        self.app.config['METRICS_PATH'] = '/metrics'
+        self.get('/')
+        self.get('/')
+        snapshot = self.app.metrics.snapshot()
+        counters = snapshot['counters']['kobin_requests_total']
+        self.assertEqual(counters[(('method', 'GET'), ('route', 'index'), ('status', '200'))], 2)
+        total = snapshot['histograms']['kobin_request_duration_seconds'][(('phase', 'total'), ('route', 'index'))]
+        self.assertEqual(total['count'], 2)
+        self.assertIsNotNone(total['p99'])
+        self.assertIn(b'kobin_requests_total{method="GET",route="index",status="200"} 2', self.get('/metrics'))
+
+    def test_metrics_route_is_registered_by_setup(self):
+        self.app.config['METRICS'] = True
+        self.app.config['METRICS_PATH'] = '/metrics'
+        self.app.setup_instrumentation()
+        self.assertEqual([route.name for route in self.app.router.routes], ['index', 'kobin_metrics'])
+        self.get('/')
+        self.assertEqual(len(self.app.router.routes), 2)
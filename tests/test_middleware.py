@@ -0,0 +1,149 @@
+import inspect
+from unittest import TestCase
+from kobin import Kobin, HTTPError, request, response
+from kobin.asgi import ASGITestClient
+from kobin.environs import bind
+from kobin.middleware import compose
+
+
+def tag(name, calls):
+    def middleware(call_next):
+        calls.append('compose ' + name)
+
+        def handler(callback, url_vars):
+            calls.append(name)
+            output = call_next(callback, url_vars)
+            response.headers.append('X-Middleware', name)
+            return output
+        return handler
+    return middleware
+
+
+def auth(call_next):
+    def handler(callback, url_vars):
+        if 'Authorization' not in request.headers:
+            raise HTTPError(401, 'Unauthorized.')
+        return call_next(callback, url_vars)
+    return handler
+
+
+def unavailable(call_next):
+    if inspect.iscoroutinefunction(call_next):
+        async def async_handler(callback, url_vars):
+            try:
+                output = await call_next(callback, url_vars)
+            except RuntimeError:
+                raise HTTPError(503, 'Unavailable.')
+            response.headers['X-Output'] = output
+            return output
+        return async_handler
+
+    def handler(callback, url_vars):
+        try:
+            output = call_next(callback, url_vars)
+        except RuntimeError:
+            raise HTTPError(503, 'Unavailable.')
+        response.headers['X-Output'] = output
+        return output
+    return handler
+
+
+class MiddlewareTests(TestCase):
+    def setUp(self):
+        self.app = Kobin()
+        self.calls = []
+        self.headers = {}
+
+        @self.app.route('/users/{user_id}')
+        def user(user_id: int):
+            self.calls.append('user')
+            return 'user {}'.format(user_id)
+
+    def start_response(self, status, headerlist):
+        self.status = status
+        self.headers = headerlist
+
+    def get(self, path, **headers):
+        env = {'REQUEST_METHOD': 'GET', 'PATH_INFO': path}
+        env.update(headers)
+        return b''.join(self.app.wsgi(env, self.start_response))
+
+    def test_compose_order(self):
+        handler = compose([tag('outer', self.calls), tag('inner', self.calls)])
+        self.assertEqual(self.calls, ['compose inner', 'compose outer'])
+        self.calls.clear()
+        bind({'REQUEST_METHOD': 'GET', 'PATH_INFO': '/'})
+        self.assertEqual(handler(lambda name: name, {'name': 'ok'}), 'ok')
+
+    def test_chain_is_composed_once(self):
+        self.app.add_middleware(tag('outer', self.calls))
+        self.app.add_middleware(tag('inner', self.calls))
+        self.assertEqual(self.get('/users/1'), b'user 1')
+        self.assertEqual(self.get('/users/2'), b'user 2')
+        self.assertEqual(self.calls, ['compose inner', 'compose outer',
+                                      'outer', 'inner', 'user', 'outer', 'inner', 'user'])
+        self.assertEqual([v for k, v in self.headers if k == 'X-Middleware'], ['inner', 'outer'])
+
+    def test_short_circuit(self):
+        self.app.middleware(auth)
+        self.get('/users/1')
+        self.assertEqual(self.status, '401 Unauthorized')
+        self.assertEqual(self.calls, [])
+        self.assertEqual(self.get('/users/1', HTTP_AUTHORIZATION='token'), b'user 1')
+
+    def test_route_middlewares(self):
+        self.app.add_middleware(tag('app', self.calls))
+
+        @self.app.route('/private/{name}', middlewares=[auth, tag('route', self.calls)])
+        def private(name: str):
+            return 'private ' + name
+
+        self.assertEqual(self.get('/private/a', HTTP_AUTHORIZATION='token'), b'private a')
+        self.assertEqual([v for k, v in self.headers if k == 'X-Middleware'], ['route', 'app'])
+        self.get('/private/a')
+        self.assertEqual(self.status, '401 Unauthorized')
+        self.calls.clear()
+        self.assertEqual(self.get('/users/1'), b'user 1')
+        self.assertEqual(self.calls, ['app', 'user'])
+
+    def test_asgi(self):
+        self.app.add_middleware(auth)
+
+        @self.app.route('/async', middlewares=[tag('route', self.calls)])
+        async def index():
+            return 'async'
+
+        client = ASGITestClient(self.app.asgi)
+        status, headers, body = client.request('GET', '/async', headers={'Authorization': 'token'})
+        self.assertEqual(body, b'async')
+        self.assertIn(('X-Middleware', 'route'), headers)
+        status, headers, body = client.request('GET', '/users/1')
+        self.assertEqual(status, 401)
+
+    def test_asgi_async_middleware(self):
+        self.app.add_middleware(unavailable)
+
+        @self.app.route('/async')
+        async def index():
+            return 'async'
+
+        @self.app.route('/broken')
+        async def broken():
+            raise RuntimeError('broken')
+
+        client = ASGITestClient(self.app.asgi)
+        status, headers, body = client.request('GET', '/async')
+        self.assertEqual(body, b'async')
+        self.assertIn(('X-Output', 'async'), headers)
+        status, headers, body = client.request('GET', '/broken')
+        self.assertEqual(status, 503)
+        status, headers, body = client.request('GET', '/users/1')
+        self.assertIn(('X-Output', 'user 1'), headers)
+
+    def test_asgi_async_route_middleware(self):
+        @self.app.route('/broken', middlewares=[unavailable])
+        async def broken():
+            raise RuntimeError('broken')
+
+        status, headers, body = ASGITestClient(self.app.asgi).request('GET', '/broken')
+        self.assertEqual(status, 503)
@@ -0,0 +1,53 @@
+from unittest import TestCase
+
+from kobin.multipart import MultipartError, parse_multipart, parse_options_header
+
+
+def build_body(*parts):
+    body = b''
+    for headers, content in parts:
+        body += b'--xyz\r\n' + headers + b'\r\n\r\n' + content + b'\r\n'
+    return body + b'--xyz--\r\n'
+
+
+def iter_chunks(body, chunk_size=64 * 1024):
+    return [body[i:i + chunk_size] for i in range(0, len(body), chunk_size)]
+
+
+class ParseOptionsHeaderTests(TestCase):
+    def test_options(self):
+        actual = parse_options_header('form-data; name="upload"; filename="a;b.txt"')
+        self.assertEqual(actual, ('form-data', {'name': 'upload', 'filename': 'a;b.txt'}))
+
+    def test_unquoted_option(self):
+        actual = parse_options_header('multipart/form-data; boundary=xyz')
+        self.assertEqual(actual, ('multipart/form-data', {'boundary': 'xyz'}))
+
+
+class ParseMultipartTests(TestCase):
+    def test_read_in_small_chunks(self):
+        body = build_body(
+            (b'Content-Disposition: form-data; name="key1"', b'value1'),
+            (b'Content-Disposition: form-data; name="upload"; filename="a.bin"', b'\r\n--xy' * 100),
+        )
+        fields, files = parse_multipart(iter_chunks(body, 7), 'xyz')
+        self.assertEqual(fields, [('key1', 'value1')])
+        self.assertEqual(files[0][1].value, b'\r\n--xy' * 100)
+
+    def test_large_file_is_spilled_to_disk(self):
+        content = b'x' * 2048
+        body = build_body((b'Content-Disposition: form-data; name="upload"; filename="a.bin"', content))
+        fields, files = parse_multipart(iter_chunks(body), 'xyz', spool_size=1024)
+        upload = files[0][1]
+        self.assertTrue(upload.file._rolled)
+        self.assertEqual(upload.value, content)
+
+    def test_fields_exceed_max_memory(self):
+        body = build_body((b'Content-Disposition: form-data; name="key1"', b'x' * 100))
+        with self.assertRaises(MultipartError) as cm:
+            parse_multipart(iter_chunks(body), 'xyz', max_memory=10)
+        self.assertEqual(cm.exception.status, 413)
+
+    def test_unexpected_end(self):
+        body = build_body((b'Content-Disposition: form-data; name="key1"', b'value1'))[:-10]
+        self.assertRaises(MultipartError, parse_multipart, iter_chunks(body), 'xyz')
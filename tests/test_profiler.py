@@ -0,0 +1,88 @@
+import os
+import pstats
+import tempfile
+from unittest import TestCase
+from kobin import Kobin
+from kobin.asgi import ASGITestClient
+from kobin.profiler import Profiler, create_profiler
+
+
+class ProfilerTests(TestCase):
+    def setUp(self):
+        self.app = Kobin()
+        self.directory = tempfile.TemporaryDirectory()
+        self.app.config['PROFILER_DIR'] = self.directory.name
+
+        @self.app.route('/users/{name}', name='user')
+        def user(name):
+            if self.app.config['PROFILER'] == 'sampling':
+                self.app.profiler.sample()
+            return 'hello ' + name
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def get(self, path):
+        env = {'REQUEST_METHOD': 'GET', 'PATH_INFO': path}
+        body = self.app.wsgi(env, lambda status, headers: None)
+        try:
+            return b''.join(body)
+        finally:
+            if hasattr(body, 'close'):
+                body.close()
+
+    def test_disabled(self):
+        self.assertIsNone(self.app.profiler)
+
+    def test_unknown_mode(self):
+        self.assertRaises(ValueError, create_profiler, {'PROFILER': 'dtrace'})
+
+    def test_cprofile(self):
+        self.app.config['PROFILER'] = 'cprofile'
+        self.app.config['PROFILER_FRACTION'] = 1.0
+        self.get('/users/a')
+        self.get('/users/b')
+        self.assertEqual(self.app.profiler.profiled, {'user': 2})
+        paths = self.app.profiler.dump()
+        self.assertEqual(paths, [os.path.join(self.directory.name, 'user.{}.pstats'.format(os.getpid()))])
+        functions = [f[2] for f in pstats.Stats(paths[0]).stats]
+        self.assertIn('user', functions)
+
+    def test_cprofile_fraction(self):
+        self.app.config['PROFILER'] = 'cprofile'
+        self.app.config['PROFILER_FRACTION'] = 0.0
+        self.get('/users/a')
+        self.assertEqual(self.app.profiler.profiled, {})
+
+    def test_sampling(self):
+        self.app.config['PROFILER'] = 'sampling'
+        self.app.config['PROFILER_INTERVAL'] = 60
+        self.get('/users/a')
+        lines = self.app.profiler.collapsed()
+        self.assertEqual(len(lines), 1)
+        self.assertTrue(lines[0].startswith('user;'))
+        self.assertIn('test_profiler.py:user;profiler.py:sample 1', lines[0])
+        paths = self.app.profiler.dump()
+        with open(paths[0]) as f:
+            self.assertEqual(f.read(), lines[0] + '\n')
+
+    def test_abstract(self):
+        self.assertRaises(TypeError, Profiler)
+
+    def test_sample_rate(self):
+        self.app.config['PROFILER'] = 'cprofile'
+        self.app.config['PROFILER_FRACTION'] = 1.0
+        self.app.config['PROFILER_SAMPLE_RATE'] = 2
+        self.app.config['METRICS_SAMPLE_RATE'] = 3
+        for name in 'abcd':
+            self.get('/users/' + name)
+        self.assertEqual(self.app.profiler.profiled, {'user': 2})
+
+    def test_asgi_sync_handler_is_profiled_in_its_thread(self):
+        self.app.config['PROFILER'] = 'cprofile'
+        self.app.config['PROFILER_FRACTION'] = 1.0
+        status, _, body = ASGITestClient(self.app.asgi).request('GET', '/users/a')
+        self.assertEqual(body, b'hello a')
+        self.assertEqual(self.app.profiler.profiled, {'user': 1})
+        functions = [f[2] for f in self.app.profiler.stats['user'].stats]
+        self.assertIn('user', functions)
@@ -1,5 +1,9 @@
+import contextvars
+import uuid
 from unittest import TestCase
-from kobin.routes import Route, Router
+from unittest.mock import patch
+from kobin.environs import bind, response
+from kobin.routes import Path, Route, Router
 from kobin.exceptions import HTTPError
 
 
@@ -34,6 +38,27 @@ class RouteTests(TestCase):
         route = Route('/hoge/{num}', 'GET', 'hoge', dummy_func)
         self.assertTrue(route.match('GET', 'hoge/1/'))
 
+    def test_match_returns_typed_url_vars(self):
+        def dummy_func(num: int):
+            return num
+        route = Route('/hoge/{num}', 'GET', 'hoge', dummy_func)
+        self.assertEqual(route.match('GET', '/hoge/1'), {'num': 1})
+
+    def test_match_path_with_path_type(self):
+        def dummy_func(filepath: Path):
+            return filepath
+        route = Route('/static/{filepath}', 'GET', 'static', dummy_func)
+        self.assertEqual(route.match('GET', '/static/css/style.css'), {'filepath': 'css/style.css'})
+
+    def test_type_hints_are_resolved_once(self):
+        def dummy_func(num: int):
+            return num
+        with patch('kobin.routes.get_type_hints', return_value={'num': int}) as mock_get_type_hints:
+            route = Route('/hoge/{num}', 'GET', 'hoge', dummy_func)
+            route.match('GET', '/hoge/1')
+            route.match('GET', '/hoge/2')
+        self.assertEqual(mock_get_type_hints.call_count, 1)
+
 
 class RouterTests(TestCase):
     def setUp(self):
@@ -64,3 +89,202 @@ class RouterTests(TestCase):
         self.router.add('GET', '/tests/{name}', 'hoge', dummy_func)
         test_env = {'REQUEST_METHOD': 'GET', 'PATH_INFO': '/this_is_not_found'}
         self.assertRaises(HTTPError, self.router.match, test_env)
+
+    def test_404_outside_request_context(self):
+        test_env = {'REQUEST_METHOD': 'GET', 'PATH_INFO': '/this_is_not_found'}
+        with self.assertRaises(HTTPError) as cm:
+            contextvars.Context().run(self.router.match, test_env)
+        self.assertEqual(cm.exception.body, 'Not found: /this_is_not_found')
+
+    def test_match_prefers_first_registered_route(self):
+        def user(name):
+            return name
+
+        def me():
+            return 'me'
+
+        self.router.add('GET', '/users/{name}', 'user', user)
+        self.router.add('GET', '/users/me', 'me', me)
+        test_env = {'REQUEST_METHOD': 'GET', 'PATH_INFO': '/users/me'}
+        actual_target, actual_args = self.router.match(test_env)
+        self.assertEqual(actual_target, user)
+        self.assertEqual(actual_args, {'name': 'me'})
+
+    def test_match_static_route_registered_before_dynamic_route(self):
+        def me():
+            return 'me'
+
+        def user(name):
+            return name
+
+        self.router.add('GET', '/users/me', 'me', me)
+        self.router.add('GET', '/users/{name}', 'user', user)
+        test_env = {'REQUEST_METHOD': 'GET', 'PATH_INFO': '/users/me'}
+        actual_target, actual_args = self.router.match(test_env)
+        self.assertEqual(actual_target, me)
+        self.assertEqual(actual_args, {})
+
+    def test_match_falls_through_when_cast_fails(self):
+        def by_id(user_id: int):
+            return user_id
+
+        def by_name(name: str):
+            return name
+
+        self.router.add('GET', '/users/{user_id}', 'by_id', by_id)
+        self.router.add('GET', '/users/{name}', 'by_name', by_name)
+        test_env = {'REQUEST_METHOD': 'GET', 'PATH_INFO': '/users/kobin'}
+        actual_target, actual_args = self.router.match(test_env)
+        self.assertEqual(actual_target, by_name)
+        self.assertEqual(actual_args, {'name': 'kobin'})
+
+    def test_match_route_registered_for_other_method(self):
+        def dummy_func():
+            return 'hoge'
+
+        self.router.add('POST', '/tests', 'hoge', dummy_func)
+        test_env = {'REQUEST_METHOD': 'GET', 'PATH_INFO': '/tests'}
+        self.assertRaises(HTTPError, self.router.match, test_env)
+
+    def test_match_dynamic_routes_with_uuid(self):
+        def dummy_func(key: uuid.UUID):
+            return key
+
+        self.router.add('GET', '/tests/{key}', 'hoge', dummy_func)
+        key = uuid.uuid4()
+        test_env = {'REQUEST_METHOD': 'GET', 'PATH_INFO': '/tests/{}'.format(key)}
+        actual_target, actual_args = self.router.match(test_env)
+        self.assertEqual(actual_args, {'key': key})
+
+    def test_404_when_uuid_is_invalid(self):
+        def dummy_func(key: uuid.UUID):
+            return key
+
+        self.router.add('GET', '/tests/{key}', 'hoge', dummy_func)
+        test_env = {'REQUEST_METHOD': 'GET', 'PATH_INFO': '/tests/not-uuid'}
+        self.assertRaises(HTTPError, self.router.match, test_env)
+
+    def test_match_dynamic_routes_with_path(self):
+        def dummy_func(version: int, filepath: Path):
+            return filepath
+
+        self.router.add('GET', '/files/{version}/{filepath}', 'hoge', dummy_func)
+        test_env = {'REQUEST_METHOD': 'GET', 'PATH_INFO': '/files/2/docs/index.html'}
+        actual_target, actual_args = self.router.match(test_env)
+        self.assertEqual(actual_args, {'version': 2, 'filepath': 'docs/index.html'})
+
+    def test_match_dynamic_routes_with_custom_converter(self):
+        class Slug(str):
+            pass
+
+        def to_slug(value):
+            if not value.islower():
+                raise ValueError(value)
+            return Slug(value)
+
+        def dummy_func(slug: Slug):
+            return slug
+
+        self.router.add_converter(Slug, to_slug)
+        self.router.add('GET', '/tests/{slug}', 'hoge', dummy_func)
+        actual_target, actual_args = self.router.match({'REQUEST_METHOD': 'GET', 'PATH_INFO': '/tests/kobin'})
+        self.assertEqual(actual_args, {'slug': 'kobin'})
+        test_env = {'REQUEST_METHOD': 'GET', 'PATH_INFO': '/tests/Kobin'}
+        self.assertRaises(HTTPError, self.router.match, test_env)
+
+
+class RouterMethodTests(TestCase):
+    def setUp(self):
+        self.router = Router()
+
+        def get_user(user_id: int):
+            return 'get'
+
+        def put_user(user_id: int):
+            return 'put'
+        self.router.add('GET', '/users/{user_id}', 'get_user', get_user)
+        self.router.add('PUT', '/users/{user_id}', 'put_user', put_user)
+
+    def match(self, method, path):
+        environ = {'REQUEST_METHOD': method, 'PATH_INFO': path}
+        bind(environ)
+        return self.router.match(environ)
+
+    def test_405_method_not_allowed(self):
+        with self.assertRaises(HTTPError) as cm:
+            self.match('DELETE', '/users/1')
+        self.assertEqual(cm.exception.status_code, 405)
+        self.assertEqual(cm.exception.body, 'Method not allowed: /users/1')
+        self.assertEqual(cm.exception.headers['Allow'], 'GET, HEAD, OPTIONS, PUT')
+
+    def test_404_when_no_method_accepts_the_url_vars(self):
+        with self.assertRaises(HTTPError) as cm:
+            self.match('DELETE', '/users/kobin')
+        self.assertEqual(cm.exception.status_code, 404)
+
+    def test_head_uses_get_route(self):
+        callback, url_vars = self.match('HEAD', '/users/1')
+        self.assertEqual(callback(**url_vars), 'get')
+
+    def test_head_route_is_preferred(self):
+        self.router.add('HEAD', '/users/{user_id}', 'head_user', lambda user_id: 'head')
+        callback, url_vars = self.match('HEAD', '/users/1')
+        self.assertEqual(callback(**url_vars), 'head')
+
+    def test_options(self):
+        callback, url_vars = self.match('OPTIONS', '/users/1')
+        self.assertEqual(callback(**url_vars), '')
+        self.assertEqual(response.headers['Allow'], 'GET, HEAD, OPTIONS, PUT')
+
+    def test_options_route_is_preferred(self):
+        self.router.add('OPTIONS', '/users/{user_id}', 'options_user', lambda user_id: 'options')
+        callback, url_vars = self.match('OPTIONS', '/users/1')
+        self.assertEqual(callback(**url_vars), 'options')
+
+    def test_405_is_not_cached_by_default(self):
+        self.router.cache_size = 2
+        self.assertRaises(HTTPError, self.match, 'DELETE', '/users/1')
+        self.assertEqual(self.router.cache_info()['currsize'], 0)
+
+
+class RouterCacheTests(TestCase):
+    def setUp(self):
+        self.router = Router(cache_size=2)
+
+        def dummy_func(num: int):
+            return num
+        self.router.add('GET', '/tests/{num}', 'hoge', dummy_func)
+
+    def test_cache_hit(self):
+        test_env = {'REQUEST_METHOD': 'GET', 'PATH_INFO': '/tests/1'}
+        self.router.match(test_env)
+        actual_target, actual_args = self.router.match(test_env)
+        self.assertEqual(actual_args, {'num': 1})
+        self.assertEqual(self.router.cache_hits, 1)
+        self.assertEqual(self.router.cache_misses, 1)
+
+    def test_cache_is_bounded(self):
+        for num in range(5):
+            self.router.match({'REQUEST_METHOD': 'GET', 'PATH_INFO': '/tests/{}'.format(num)})
+        self.assertEqual(self.router.cache_info()['currsize'], 2)
+
+    def test_cache_is_cleared_when_route_is_added(self):
+        test_env = {'REQUEST_METHOD': 'GET', 'PATH_INFO': '/tests/1'}
+        self.router.match(test_env)
+
+        def dummy_func():
+            return 'hoge'
+        self.router.add('GET', '/hoge', 'hoge', dummy_func)
+        self.assertEqual(self.router.cache_info()['currsize'], 0)
+
+    def test_404_is_not_cached_by_default(self):
+        test_env = {'REQUEST_METHOD': 'GET', 'PATH_INFO': '/this_is_not_found'}
+        self.assertRaises(HTTPError, self.router.match, test_env)
+        self.assertEqual(self.router.cache_info()['currsize'], 0)
+
+    def test_404_is_cached_with_cache_not_found(self):
+        self.router.cache_not_found = True
+        test_env = {'REQUEST_METHOD': 'GET', 'PATH_INFO': '/this_is_not_found'}
+        self.assertRaises(HTTPError, self.router.match, test_env)
+        self.assertRaises(HTTPError, self.router.match, test_env)
+        self.assertEqual(self.router.cache_hits, 1)
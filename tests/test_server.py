@@ -0,0 +1,227 @@
+import http.client
+import io
+import os
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from unittest import TestCase, skipUnless
+
+from kobin import Kobin, request, response
+from kobin.server import WorkerServer, create_socket
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class WorkerServerTests(TestCase):
+    def setUp(self):
+        self.app = Kobin()
+
+        @self.app.route('/')
+        def index():
+            return 'hello'
+
+        @self.app.route('/echo', method='POST')
+        def echo():
+            return request.body
+
+        @self.app.route('/stream')
+        def stream():
+            yield 'a'
+            yield 'b'
+
+        @self.app.route('/file')
+        def file():
+            response.headers.add_header('Content-Length', '5')
+            return io.BytesIO(b'12345')
+
+        self.sock = create_socket('127.0.0.1', 0)
+        self.server = WorkerServer(self.sock, self.app, threads=2)
+        self.thread = threading.Thread(target=self.server.serve_forever, kwargs={'poll_interval': 0.05})
+        self.thread.start()
+        self.conn = http.client.HTTPConnection('127.0.0.1', self.sock.getsockname()[1], timeout=5)
+
+    def tearDown(self):
+        self.conn.close()
+        self.server.stop()
+        self.thread.join()
+        self.server.drain(1)
+        self.sock.close()
+
+    def test_keep_alive(self):
+        for _ in range(2):
+            self.conn.request('GET', '/')
+            res = self.conn.getresponse()
+            self.assertEqual(res.status, 200)
+            self.assertEqual(res.getheader('Content-Length'), '5')
+            self.assertEqual(res.read(), b'hello')
+        self.assertIsNotNone(self.conn.sock)
+
+    def test_request_body(self):
+        self.conn.request('POST', '/echo', body=b'key=value')
+        self.assertEqual(self.conn.getresponse().read(), b'key=value')
+        self.conn.request('GET', '/')
+        self.assertEqual(self.conn.getresponse().read(), b'hello')
+
+    def test_chunked_response(self):
+        self.conn.request('GET', '/stream')
+        res = self.conn.getresponse()
+        self.assertEqual(res.getheader('Transfer-Encoding'), 'chunked')
+        self.assertEqual(res.read(), b'ab')
+
+    def test_file_response(self):
+        self.conn.request('GET', '/file')
+        self.assertEqual(self.conn.getresponse().read(), b'12345')
+
+    def test_not_found(self):
+        self.conn.request('GET', '/this_is_not_found')
+        res = self.conn.getresponse()
+        self.assertEqual(res.status, 404)
+        self.assertEqual(res.read(), b'Not found: /this_is_not_found')
+
+    def test_idle_connections_do_not_hold_threads(self):
+        port = self.sock.getsockname()[1]
+        idle = [http.client.HTTPConnection('127.0.0.1', port, timeout=5) for _ in range(2)]
+        try:
+            for conn in idle:
+                conn.request('GET', '/')
+                self.assertEqual(conn.getresponse().read(), b'hello')
+            start = time.monotonic()
+            self.conn.request('GET', '/')
+            self.assertEqual(self.conn.getresponse().read(), b'hello')
+            self.assertLess(time.monotonic() - start, 1)
+        finally:
+            for conn in idle:
+                conn.close()
+
+    def test_pipelined_requests(self):
+        with socket.create_connection(self.sock.getsockname(), timeout=5) as sock:
+            sock.sendall(b'GET / HTTP/1.1\r\nHost: x\r\n\r\n' * 2)
+            data = b''
+            while data.count(b'hello') < 2:
+                chunk = sock.recv(4096)
+                self.assertTrue(chunk)
+                data += chunk
+
+    def test_idle_connection_is_closed(self):
+        self.server.keepalive_timeout = 0.1
+        self.conn.request('GET', '/')
+        self.assertEqual(self.conn.getresponse().read(), b'hello')
+        self.conn.sock.settimeout(2)
+        self.assertEqual(self.conn.sock.recv(1), b'')
+
+
+@skipUnless(hasattr(os, 'fork'), 'requires fork')
+class PreforkServerTests(TestCase):
+    script = '''
+import os
+from kobin import Kobin
+from kobin.server import serve
+app = Kobin()
+
+@app.route('/')
+def index():
+    return str(os.getpid())
+
+serve(app, '127.0.0.1', {port}, workers=2, threads=2, graceful_timeout=2)
+'''
+
+    def test_workers_share_socket_and_stop_gracefully(self):
+        sock = create_socket('127.0.0.1', 0)
+        port = sock.getsockname()[1]
+        sock.close()
+        proc = subprocess.Popen([sys.executable, '-c', self.script.format(port=port)], cwd=ROOT_DIR,
+                                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            pids = set()
+            deadline = time.monotonic() + 10
+            while len(pids) < 2 and time.monotonic() < deadline:
+                try:
+                    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=5)
+                    conn.request('GET', '/')
+                    pids.add(int(conn.getresponse().read()))
+                    conn.close()
+                except ConnectionError:
+                    time.sleep(0.1)
+            self.assertTrue(pids)
+            self.assertNotIn(proc.pid, pids)
+        finally:
+            proc.send_signal(signal.SIGTERM)
+            self.assertEqual(proc.wait(timeout=10), 0)
+
+    def test_sighup_reloads_the_application(self):
+        sock = create_socket('127.0.0.1', 0)
+        port = sock.getsockname()[1]
+        sock.close()
+        script = self.script.replace('str(os.getpid())', "'{version}'")
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'app.py')
+            with open(path, 'w') as f:
+                f.write(script.format(port=port, version='v1'))
+            env = dict(os.environ, PYTHONPATH=ROOT_DIR)
+            proc = subprocess.Popen([sys.executable, path], env=env,
+                                    stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            try:
+                self.assertEqual(self._wait_for(port, b'v1'), b'v1')
+                with open(path, 'w') as f:
+                    f.write(script.format(port=port, version='v2'))
+                proc.send_signal(signal.SIGHUP)
+                self.assertEqual(self._wait_for(port, b'v2'), b'v2')
+            finally:
+                proc.send_signal(signal.SIGTERM)
+                self.assertEqual(proc.wait(timeout=10), 0)
+
+    def test_profiler_runs_in_workers(self):
+        sock = create_socket('127.0.0.1', 0)
+        port = sock.getsockname()[1]
+        sock.close()
+        script = '''
+import os
+import time
+from kobin import Kobin
+app = Kobin()
+app.config['PROFILER'] = 'sampling'
+app.config['PROFILER_INTERVAL'] = 0.001
+app.config['PROFILER_DIR'] = {directory!r}
+app.config['PROFILER_DUMP_INTERVAL'] = 0.1
+
+@app.route('/')
+def busy():
+    end = time.monotonic() + 0.2
+    while time.monotonic() < end:
+        pass
+    return str(os.getpid())
+
+app.run('127.0.0.1', {port}, server='kobin', workers=1, threads=2, graceful_timeout=2)
+'''
+        with tempfile.TemporaryDirectory() as directory:
+            proc = subprocess.Popen([sys.executable, '-c', script.format(port=port, directory=directory)],
+                                    cwd=ROOT_DIR, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            try:
+                pid = int(self._wait_for(port, None))
+                self.assertNotEqual(pid, proc.pid)
+                path = os.path.join(directory, 'stacks.{}.collapsed'.format(pid))
+                deadline = time.monotonic() + 5
+                while not os.path.exists(path) and time.monotonic() < deadline:
+                    time.sleep(0.1)
+                with open(path) as f:
+                    self.assertIn('busy', f.read())
+            finally:
+                proc.send_signal(signal.SIGTERM)
+                self.assertEqual(proc.wait(timeout=10), 0)
+
+    def _wait_for(self, port, body):
+        deadline = time.monotonic() + 10
+        result = None
+        while (result is None or body is not None and result != body) and time.monotonic() < deadline:
+            try:
+                conn = http.client.HTTPConnection('127.0.0.1', port, timeout=5)
+                conn.request('GET', '/')
+                result = conn.getresponse().read()
+                conn.close()
+            except ConnectionError:
+                time.sleep(0.1)
+        return result
@@ -0,0 +1,145 @@
+import gzip
+import os
+import tempfile
+from unittest import TestCase
+from kobin import Kobin
+from kobin.static import parse_range, safe_join
+
+
+class SafeJoinTests(TestCase):
+    def test_join(self):
+        self.assertEqual(safe_join('/srv', 'css/./style.css'), os.path.join('/srv', 'css', 'style.css'))
+
+    def test_parent_directory(self):
+        self.assertIsNone(safe_join('/srv', 'css/../../etc/passwd'))
+
+    def test_null_byte(self):
+        self.assertIsNone(safe_join('/srv', 'style.css\0.png'))
+
+    def test_empty(self):
+        self.assertIsNone(safe_join('/srv', '/'))
+
+
+class ParseRangeTests(TestCase):
+    def test_range(self):
+        self.assertEqual(parse_range('bytes=0-9', 100), (0, 9))
+
+    def test_open_ended(self):
+        self.assertEqual(parse_range('bytes=90-', 100), (90, 99))
+
+    def test_suffix(self):
+        self.assertEqual(parse_range('bytes=-10', 100), (90, 99))
+
+    def test_end_is_clamped(self):
+        self.assertEqual(parse_range('bytes=90-200', 100), (90, 99))
+
+    def test_ignored(self):
+        self.assertIsNone(parse_range('bytes=0-1,5-6', 100))
+        self.assertIsNone(parse_range('items=0-1', 100))
+        self.assertIsNone(parse_range('bytes=5-1', 100))
+
+    def test_unsatisfiable(self):
+        self.assertEqual(parse_range('bytes=100-', 100), (-1, -1))
+
+
+class StaticFilesTests(TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.content = b'body { color: red; }\n' * 10
+        with open(os.path.join(self.directory.name, 'style.css'), 'wb') as f:
+            f.write(self.content)
+        self.app = Kobin()
+        self.app.config['STATICFILES_DIRS'] = [self.directory.name]
+        self.status = None
+        self.headers = {}
+
+        @self.app.route('/static/{name}')
+        def fallback(name):
+            return 'route ' + name
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def start_response(self, status, headerlist):
+        self.status = status
+        self.headers = dict(headerlist)
+
+    def get(self, path, method='GET', **headers):
+        env = {'REQUEST_METHOD': method, 'PATH_INFO': path}
+        env.update(headers)
+        body = self.app.wsgi(env, self.start_response)
+        try:
+            return b''.join(body)
+        finally:
+            if hasattr(body, 'close'):
+                body.close()
+
+    def test_serve(self):
+        self.assertEqual(self.get('/static/style.css'), self.content)
+        self.assertEqual(self.status, '200 OK')
+        self.assertEqual(self.headers['Content-Type'], 'text/css; charset=UTF-8')
+        self.assertEqual(self.headers['Content-Length'], str(len(self.content)))
+        self.assertIn('ETag', self.headers)
+        self.assertIn('Last-Modified', self.headers)
+
+    def test_uses_file_wrapper(self):
+        wrapped = []
+
+        def file_wrapper(f, block_size):
+            wrapped.append(f)
+            return iter(lambda: f.read(block_size), b'')
+
+        self.get('/static/style.css', **{'wsgi.file_wrapper': file_wrapper})
+        self.assertEqual(len(wrapped), 1)
+        wrapped[0].close()
+
+    def test_head(self):
+        self.assertEqual(self.get('/static/style.css', method='HEAD'), b'')
+        self.assertEqual(self.headers['Content-Length'], str(len(self.content)))
+
+    def test_not_modified(self):
+        self.get('/static/style.css')
+        etag = self.headers['ETag']
+        self.assertEqual(self.get('/static/style.css', HTTP_IF_NONE_MATCH=etag), b'')
+        self.assertEqual(self.status, '304 Not Modified')
+
+    def test_range(self):
+        self.assertEqual(self.get('/static/style.css', HTTP_RANGE='bytes=0-3'), b'body')
+        self.assertEqual(self.status, '206 Partial Content')
+        self.assertEqual(self.headers['Content-Range'], 'bytes 0-3/{}'.format(len(self.content)))
+        self.assertEqual(self.headers['Content-Length'], '4')
+
+    def test_range_with_stale_if_range(self):
+        self.assertEqual(self.get('/static/style.css', HTTP_RANGE='bytes=0-3', HTTP_IF_RANGE='"old"'),
+                         self.content)
+        self.assertEqual(self.status, '200 OK')
+
+    def test_unsatisfiable_range(self):
+        self.get('/static/style.css', HTTP_RANGE='bytes=10000-')
+        self.assertEqual(self.status, '416 Requested Range Not Satisfiable')
+
+    def test_precompressed(self):
+        with open(os.path.join(self.directory.name, 'style.css.gz'), 'wb') as f:
+            f.write(gzip.compress(self.content))
+        self.app.static_files._cache.clear()
+        body = self.get('/static/style.css', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(gzip.decompress(body), self.content)
+        self.assertEqual(self.headers['Content-Encoding'], 'gzip')
+        self.assertEqual(self.headers['Vary'], 'Accept-Encoding')
+        self.assertEqual(self.get('/static/style.css'), self.content)
+        self.assertNotIn('Content-Encoding', self.headers)
+
+    def test_modified_file_is_detected(self):
+        self.get('/static/style.css')
+        with open(os.path.join(self.directory.name, 'style.css'), 'ab') as f:
+            f.write(b'/* more */')
+        self.assertEqual(self.get('/static/style.css'), self.content + b'/* more */')
+
+    def test_falls_through_to_router(self):
+        self.assertEqual(self.get('/static/missing.css'), b'route missing.css')
+
+    def test_traversal_is_not_served(self):
+        self.app.config['STATICFILES_DIRS'] = [os.path.join(self.directory.name, 'sub')]
+        os.mkdir(os.path.join(self.directory.name, 'sub'))
+        self.get('/static/../style.css')
+        self.assertEqual(self.status, '404 Not Found')
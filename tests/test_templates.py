@@ -1,16 +1,74 @@
 import os
+import tempfile
 from unittest import TestCase
 from unittest.mock import patch
-from kobin.templates import render_template
+from kobin import Kobin
+from kobin.templates import render_template, stream_template
 
 TEMPLATE_DIRS = [os.path.join(os.path.dirname(__file__), 'templates')]
 
 
 class Jinja2TemplateTests(TestCase):
-    @patch('kobin.current_config')
-    def test_file(self, mock_current_config):
+    def setUp(self):
+        self.app = Kobin()
+        self.app.config['TEMPLATE_DIRS'] = TEMPLATE_DIRS
+
+    @patch('kobin.current_app')
+    def test_file(self, mock_current_app):
         """ Templates: Jinja2 file """
-        mock_current_config.return_value = {'TEMPLATE_DIRS': TEMPLATE_DIRS}
+        mock_current_app.return_value = self.app
         actual = render_template('jinja2.html', var='kobin')
         expected = "Hello kobin World."
         self.assertEqual(actual, expected)
+
+    @patch('kobin.current_app')
+    def test_environment_is_reused(self, mock_current_app):
+        mock_current_app.return_value = self.app
+        render_template('jinja2.html', var='kobin')
+        env = self.app.template_env
+        render_template('jinja2.html', var='kobin')
+        self.assertIs(self.app.template_env, env)
+        self.assertEqual(len(env.cache), 1)
+
+    def test_environment_from_config(self):
+        self.app.config['TEMPLATE_CACHE_SIZE'] = 10
+        self.app.config['TEMPLATE_AUTO_RELOAD'] = True
+        env = self.app.template_env
+        self.assertEqual(env.cache.capacity, 10)
+        self.assertTrue(env.auto_reload)
+
+    def test_bytecode_cache(self):
+        with tempfile.TemporaryDirectory() as cache_dir:
+            self.app.config['TEMPLATE_BYTECODE_CACHE_DIR'] = cache_dir
+            self.app.template_env.get_template('jinja2.html')
+            self.assertEqual(len(os.listdir(cache_dir)), 1)
+
+    def test_precompile_templates_into_environment(self):
+        timings = self.app.precompile_templates()
+        self.assertIn('jinja2.html', timings)
+        self.assertEqual(len(self.app.template_env.cache), len(timings))
+
+    @patch('kobin.current_app')
+    def test_precompile_templates_into_modules(self, mock_current_app):
+        mock_current_app.return_value = self.app
+        with tempfile.TemporaryDirectory() as module_dir:
+            timings = self.app.precompile_templates(module_dir)
+            self.assertIn('jinja2.html', timings)
+
+            self.app.config['TEMPLATE_MODULE_DIR'] = module_dir
+            self.app.config['TEMPLATE_DIRS'] = []
+            actual = render_template('jinja2.html', var='kobin')
+        self.assertEqual(actual, "Hello kobin World.")
+
+    @patch('kobin.current_app')
+    def test_stream_template(self, mock_current_app):
+        mock_current_app.return_value = self.app
+        actual = stream_template('jinja2.html', var='kobin')
+        self.assertNotIsInstance(actual, str)
+        self.assertEqual(''.join(actual), "Hello kobin World.")
+
+    @patch('kobin.current_app')
+    def test_stream_template_with_buffer_size(self, mock_current_app):
+        mock_current_app.return_value = self.app
+        actual = list(stream_template('jinja2.html', buffer_size=1000, var='kobin'))
+        self.assertEqual(actual, ["Hello kobin World."])